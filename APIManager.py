@@ -1,14 +1,57 @@
-import requests
 import json
-import subprocess
-from typing import List, Tuple, Optional
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Tuple, Optional
+from ResponseCache import ResponseCache
+from ModelRegistry import ModelRegistry
+from ModelLoader import ModelLoader, LOAD_TIMEOUT
+from MetricsLog import MetricsLog, generation_metrics
+from EndpointPool import EndpointPool, Endpoint
+from RequestScheduler import RequestScheduler
+
+if TYPE_CHECKING:
+    import requests
+
+# Sampling options sent with every generation unless a model's profile overrides them
+DEFAULT_OPTIONS = {
+    "temperature": 0.7,
+    "top_p": 0.9,
+    "top_k": 40
+}
 
 class APIManager:
-    def __init__(self):
-        self.base_url = "http://localhost:11434/api"
+    def __init__(self, pool_size: int = 10, connect_timeout: float = 5,
+                 read_timeout: float = 30):
+        # Ollama servers requests are routed across; one local server by default
+        self.endpoints = EndpointPool(self)
         self._model = "llama2-uncensored"  # Use private variable
-        self._available_models: List[str] = []
-        self.refresh_models()  # Load available models on init
+
+        # Opt-in cache of finished responses; None while disabled
+        self.response_cache: Optional[ResponseCache] = None
+
+        # JSONL log of per-request metrics; None while disabled
+        self.metrics_log: Optional[MetricsLog] = None
+
+        # One keep-alive session shared by every endpoint, created on first
+        # use because importing requests is a large share of startup time
+        self._session = None
+        self._session_lock = threading.Lock()
+        self.configure_transport(pool_size, connect_timeout, read_timeout)
+
+        # Installed models from /api/tags, loaded in the background on first read
+        self.registry = ModelRegistry(self)
+
+        # How long Ollama keeps models loaded ("" leaves it to the server),
+        # and which models are loaded right now
+        self.keep_alive = ""
+        self.keep_alive_overrides: Dict[str, str] = {}
+        self.loader = ModelLoader(self)
+
+        # Per-model Ollama options (num_ctx, num_thread, ...); see options_for
+        self.model_options: Dict[str, dict] = {}
+
+        # Queues generations per model with priorities; see RequestScheduler
+        self.scheduler = RequestScheduler(self)
 
     @property
     def model(self) -> str:
@@ -16,101 +59,472 @@ class APIManager:
 
     @model.setter
     def model(self, value: str):
-        if value in self._available_models or not self._available_models:
+        available = self.registry.models(refresh=False)
+        if value in available or not available:
             self._model = value
         else:
             print(f"Warning: Model {value} not found in available models")
             # Keep current model if new one isn't available
 
+    @property
+    def base_url(self) -> str:
+        """URL of the first configured server"""
+        return self.endpoints.primary.url
+
+    @base_url.setter
+    def base_url(self, value: str):
+        self.configure_endpoints([value], self.endpoints.check_interval)
+
+    def configure_endpoints(self, urls: List[str], check_interval: float = 30) -> None:
+        """Route requests across these servers, checking their health every check_interval s"""
+        single = len(self.endpoints) == 1
+        self.endpoints.configure(urls, check_interval)
+        if self._session is not None and single != (len(self.endpoints) == 1):
+            self._mount_adapter(self._session)
+
+    def configure_transport(self, pool_size: int, connect_timeout: float,
+                            read_timeout: float) -> None:
+        """Set the connection pool size and timeouts used for all requests
+
+        Only connection failures are retried; a request that reached the
+        server is never sent twice.
+        """
+        if getattr(self, "_transport", None) == (pool_size, connect_timeout, read_timeout):
+            return
+        self._transport = (pool_size, connect_timeout, read_timeout)
+        self.timeout = (connect_timeout, read_timeout)
+        if self._session is not None:
+            self._mount_adapter(self._session)
+
+    @property
+    def session(self) -> "requests.Session":
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    session = requests.Session()
+                    self._mount_adapter(session)
+                    self._session = session
+        return self._session
+
+    def _mount_adapter(self, session: "requests.Session") -> None:
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+        pool_size = self._transport[0]
+        # With several servers a refused connection fails over right away instead
+        connect_retries = 3 if len(self.endpoints) == 1 else 0
+        retry = Retry(total=3, connect=connect_retries, read=0, status=0,
+                      backoff_factor=0.25, raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size,
+                              max_retries=retry)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+
+    def configure_keep_alive(self, default: str = "",
+                             overrides: Optional[Dict[str, str]] = None) -> None:
+        """Set the keep_alive sent for every model, with per-model overrides"""
+        self.keep_alive = default
+        self.keep_alive_overrides = dict(overrides or {})
+
+    def keep_alive_for(self, model: str) -> str:
+        return self.keep_alive_overrides.get(model, self.keep_alive)
+
+    def configure_options(self, profiles: Optional[Dict[str, dict]] = None) -> None:
+        """Set the Ollama options sent for each model, e.g. {"llama2": {"num_thread": 8}}"""
+        self.model_options = {model: dict(options) for model, options in (profiles or {}).items()}
+
+    def options_for(self, model: str) -> dict:
+        """Sampling defaults overlaid with model's profile"""
+        options = dict(DEFAULT_OPTIONS)
+        options.update(self.model_options.get(model, {}))
+        return options
+
+    def enable_cache(self, enabled: bool, memory_entries: int = 256,
+                     max_disk_mb: int = 100, directory: str = "response_cache") -> None:
+        """Turn the response cache on or off; counters survive reconfiguration"""
+        if not enabled:
+            self.response_cache = None
+        elif self.response_cache is None:
+            self.response_cache = ResponseCache(directory, memory_entries, max_disk_mb * 1024 * 1024)
+        else:
+            self.response_cache.configure(memory_entries, max_disk_mb * 1024 * 1024)
+
+    def enable_metrics_log(self, enabled: bool, path: str = "metrics.jsonl",
+                           max_mb: int = 5) -> None:
+        """Turn the metrics log on or off, or move it to a new path or size"""
+        log = self.metrics_log
+        if log and enabled and log.path == path and log.max_bytes == max_mb * 1024 * 1024:
+            return
+        self.metrics_log = MetricsLog(path, max_mb * 1024 * 1024) if enabled else None
+        if log:
+            log.close()
+
+    def close(self) -> None:
+        """Close pooled connections; call on application exit"""
+        self.endpoints.close()
+        if self._session is not None:
+            self._session.close()
+        if self.metrics_log:
+            self.metrics_log.close()
+
+    def _request(self, method: str, path: str, model: Optional[str] = None,
+                 endpoint: Optional[Endpoint] = None, **kwargs) -> "requests.Response":
+        """Send a request to an Ollama endpoint through the shared session
+
+        The endpoint pool picks the server (see EndpointPool.choose) unless
+        endpoint is given. A server that cannot be reached is marked down and
+        the request moves on to the next one; the last error is raised when
+        none is left. A streamed response counts as in flight on its server
+        until it is closed.
+        """
+        import requests
+        kwargs.setdefault("timeout", self.timeout)
+        tried = []
+        while True:
+            target = endpoint or self.endpoints.choose(model, exclude=tried)
+            self.endpoints.begin(target)
+            try:
+                response = self.session.request(method, f"{target.url}/{path}", **kwargs)
+            except requests.exceptions.ConnectionError as e:
+                self.endpoints.end(target)
+                self.endpoints.mark_down(target, e)
+                tried.append(target)
+                if endpoint or len(tried) >= len(self.endpoints):
+                    raise
+                continue
+            except BaseException:
+                self.endpoints.end(target)
+                raise
+            if model and path == "generate" and response.status_code == 200:
+                self.endpoints.mark_warm(target, model)
+            if kwargs.get("stream"):
+                response.close = self._release_on_close(response, target)
+            else:
+                self.endpoints.end(target)
+            return response
+
+    def _release_on_close(self, response: "requests.Response",
+                          endpoint: Endpoint) -> Callable[[], None]:
+        close = response.close
+        released = []
+
+        def release():
+            try:
+                close()
+            finally:
+                if not released:
+                    released.append(True)
+                    self.endpoints.end(endpoint)
+        return release
+
     def refresh_models(self) -> None:
-        """Refresh the list of available models"""
-        try:
-            result = subprocess.run(['ollama', 'list'], 
-                                  capture_output=True, 
-                                  text=True, 
-                                  check=True)
-            self._available_models = []
-            for line in result.stdout.split('\n')[1:]:  # Skip header line
-                if line.strip():
-                    model_name = line.split()[0].split(':')[0]  # Get name without version
-                    self._available_models.append(model_name)
-        except subprocess.CalledProcessError as e:
-            print(f"Error running ollama list: {e}")
-        except Exception as e:
-            print(f"Error refreshing models: {e}")
+        """Refresh the list of available models in the background"""
+        self.registry.refresh()
 
     def list_models(self) -> List[str]:
-        """Get list of installed models"""
-        if not self._available_models:
-            self.refresh_models()
-        return self._available_models
+        """Get list of installed models (cached; never blocks)"""
+        return self.registry.models()
+
+    def preload_model(self, model: Optional[str] = None) -> None:
+        """Load a model (default: the current one) into memory in the background"""
+        self.loader.preload(model or self._model)
 
     def download_model(self, model_name: str) -> Tuple[bool, str]:
-        """Download a new model using Ollama"""
+        """Download a model, blocking until Ollama has finished pulling it"""
+        for chunk in self.stream_pull(model_name):
+            if chunk.get("error"):
+                return False, f"Error downloading model: {chunk['error']}"
+            if chunk.get("status") == "success":
+                self.refresh_models()  # Refresh model list after download
+                return True, "Model downloaded successfully"
+        return False, "Error downloading model: download ended before completing"
+
+    def stream_pull(self, model_name: str,
+                    cancel: Optional[threading.Event] = None) -> Iterator[dict]:
+        """Pull a model through /api/pull, yielding each progress line
+
+        Lines carry a status and, while layers download, their digest, total
+        and completed bytes. Errors come back as {"status": "error", "error"};
+        setting cancel closes the connection and yields {"status": "cancelled"}.
+        Ollama keeps the layers fetched so far, so a later pull resumes.
+        """
+        import requests
         try:
-            process = subprocess.Popen(
-                ['ollama', 'pull', model_name], 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE,
-                universal_newlines=True
-            )
-            self.refresh_models()  # Refresh model list after download
-            return True, "Model download started"
+            # Verifying a large layer can take minutes without a progress line
+            timeout = (self.timeout[0], max(self.timeout[1], LOAD_TIMEOUT))
+            with self._request("POST", "pull", model=model_name,
+                               json={"model": model_name, "stream": True},
+                               stream=True, timeout=timeout) as response:
+                if response.status_code != 200:
+                    yield {"status": "error",
+                           "error": f"{response.status_code} - {response.text}"}
+                    return
+                for line in response.iter_lines():
+                    if cancel is not None and cancel.is_set():
+                        yield {"status": "cancelled"}
+                        return
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        yield {"status": "error", "error": chunk["error"]}
+                        return
+                    yield chunk
+                    if chunk.get("status") == "success":
+                        return
+            yield {"status": "error", "error": "Download ended before completing"}
+        except requests.exceptions.ConnectionError:
+            yield {"status": "error",
+                   "error": "Cannot connect to Ollama. Please make sure Ollama is running."}
+        except requests.exceptions.Timeout:
+            yield {"status": "error", "error": "Ollama stopped sending download progress."}
         except Exception as e:
-            return False, f"Error downloading model: {e}"
+            yield {"status": "error", "error": str(e)}
 
     def remove_model(self, model_name: str) -> Tuple[bool, str]:
         """Remove a model using Ollama"""
         try:
             if model_name == self._model:
                 return False, "Cannot remove currently active model"
-                
-            result = subprocess.run(
-                ['ollama', 'rm', model_name], 
-                capture_output=True, 
-                text=True, 
-                check=True
-            )
+
+            # Remove it from every server that has it
+            targets = self.endpoints.hosting(model_name) or self.endpoints.endpoints
+            errors = []
+            for endpoint in targets:
+                response = self._request("DELETE", "delete", endpoint=endpoint,
+                                         json={"model": model_name})
+                if response.status_code != 200:
+                    errors.append(f"{response.status_code} - {response.text}")
+            if len(errors) == len(targets):
+                return False, f"Error removing model: {errors[0]}"
             self.refresh_models()  # Refresh model list after removal
             return True, "Model removed successfully"
-        except subprocess.CalledProcessError as e:
-            return False, f"Error removing model: {e.stderr}"
         except Exception as e:
             return False, f"Error removing model: {e}"
 
-    def generate_response(self, prompt: str) -> str:
-        """Generate a response using the current model"""
+    def generate_response(self, prompt: str,
+                          on_token: Optional[Callable[[str], None]] = None,
+                          model: Optional[str] = None,
+                          context: Optional[List[int]] = None,
+                          system: Optional[str] = None) -> str:
+        """Generate a response using the current model
+
+        If on_token is given the response is streamed and on_token is called
+        with each piece of text as it arrives. The full text is returned either
+        way; an error's message follows whatever text arrived before it.
+        """
+        pieces = []
+        for chunk in self.stream_response(prompt, model, context, system):
+            text = chunk.get("response", "")
+            if chunk.get("error"):
+                pieces.append(f"\n\n{text}" if pieces else text)
+                break
+            if text:
+                pieces.append(text)
+                if on_token:
+                    on_token(text)
+        return "".join(pieces)
+
+    def stream_response(self, prompt: str, model: Optional[str] = None,
+                        context: Optional[List[int]] = None,
+                        system: Optional[str] = None,
+                        cancel: Optional[threading.Event] = None,
+                        options: Optional[dict] = None, use_cache: bool = True,
+                        endpoint: Optional[Endpoint] = None) -> Iterator[dict]:
+        """Stream a response from the current model, yielding each NDJSON chunk
+
+        Every chunk is the decoded JSON object sent by Ollama; the text lives
+        under "response" and the last chunk has "done" set. Errors are reported
+        as a single chunk with "error" set and the message in "response".
+        model defaults to the current model; callers running in the background
+        pass it explicitly so a settings change cannot affect a running request.
+
+        context is the "context" array from the last chunk of an earlier
+        response. Passing it continues that conversation without Ollama
+        re-evaluating the earlier turns; the last chunk carries the new one.
+        system overrides the model's system prompt, and options are Ollama
+        options sent on top of the model's profile (see options_for).
+        endpoint pins the request to one server instead of letting the
+        endpoint pool choose.
+
+        Setting cancel stops the stream and the last chunk has "cancelled"
+        set. The connection is closed, which stops Ollama generating; with a
+        RequestScheduler.CancelEvent that happens as soon as it is set, even
+        in the middle of a read, otherwise at the next chunk. A request still
+        waiting for Ollama to answer (e.g. while loading a model) stops once
+        the answer arrives. RequestScheduler.stream adds queueing on top.
+
+        With the response cache enabled an identical earlier request is
+        replayed as one text chunk plus its last chunk (marked "cached"), and
+        identical requests running at the same time share one generation;
+        use_cache=False always generates.
+
+        The last chunk also carries "metrics": Ollama's counts and durations
+        plus the wall time and time to first token measured here (see
+        MetricsLog.generation_metrics). They are appended to the metrics log
+        when it is enabled.
+        """
+        model = model or self._model
+        request = {"context": context, "system": system, "cancel": cancel,
+                   "options": options, "endpoint": endpoint}
+        if use_cache:
+            chunks = self._stream_cached(prompt, model, **request)
+        else:
+            chunks = self._stream_generate(prompt, model, **request)
+        yield from self._with_metrics(model, prompt, chunks)
+
+    def _with_metrics(self, model: str, prompt: str, chunks: Iterator[dict]) -> Iterator[dict]:
+        """Pass chunks through, adding client-side timing to the last one"""
+        started_at = time.time()
+        start = time.perf_counter()
+        first_token = None
+        for chunk in chunks:
+            if first_token is None and chunk.get("response") and not chunk.get("error"):
+                first_token = time.perf_counter() - start
+            if chunk.get("done") and not chunk.get("error") and not chunk.get("cancelled"):
+                metrics = generation_metrics(model, chunk, started_at,
+                                             time.perf_counter() - start, first_token,
+                                             len(prompt))
+                chunk = dict(chunk, metrics=metrics)
+                log = self.metrics_log
+                if log:
+                    log.write(metrics)
+            yield chunk
+
+    def _stream_cached(self, prompt: str, model: str, context: Optional[List[int]],
+                       system: Optional[str],
+                       cancel: Optional[threading.Event] = None,
+                       options: Optional[dict] = None,
+                       endpoint: Optional[Endpoint] = None) -> Iterator[dict]:
+        """Serve a request from the response cache if enabled; see stream_response"""
+        cache = self.response_cache
+        if cache is None or not model:
+            yield from self._stream_generate(prompt, model, context, system, cancel,
+                                             options, endpoint)
+            return
+
+        key = ResponseCache.key(model, self.registry.digest(model), prompt,
+                                context, system, dict(self.options_for(model), **(options or {})))
+        entry = cache.get(key)
+        if entry is None:
+            with cache.single_flight(key) as leader:
+                if not leader:
+                    entry = cache.get(key, count=False)
+                if entry is None:
+                    pieces = []
+                    for chunk in self._stream_generate(prompt, model, context, system, cancel,
+                                                       options, endpoint):
+                        if not chunk.get("error") and not chunk.get("cancelled"):
+                            pieces.append(chunk.get("response", ""))
+                            if chunk.get("done"):
+                                cache.put(key, {"response": "".join(pieces), "final": chunk})
+                        yield chunk
+                    return
+        yield {"response": entry["response"], "done": False}
+        yield dict(entry["final"], response="", cached=True)
+
+    def _stream_generate(self, prompt: str, model: str, context: Optional[List[int]],
+                         system: Optional[str],
+                         cancel: Optional[threading.Event] = None,
+                         options: Optional[dict] = None,
+                         endpoint: Optional[Endpoint] = None) -> Iterator[dict]:
+        """Stream one generation from /api/generate; see stream_response"""
+        import requests
         try:
-            if not self._model:
-                return "Error: No model selected"
-
-            print(f"Using model: {self._model}")  # Debug print
-            response = requests.post(
-                f"{self.base_url}/generate",
-                json={
-                    "model": self._model,
-                    "prompt": prompt,
-                    "stream": False,
-                    "options": {
-                        "temperature": 0.7,
-                        "top_p": 0.9,
-                        "top_k": 40
-                    }
-                },
-                timeout=30
-            )
-            
-            if response.status_code == 200:
-                return response.json()["response"]
-            elif response.status_code == 404:
-                self.refresh_models()  # Refresh models list on 404
-                return f"Error: Model '{self._model}' not found. Please check available models in settings."
-            else:
-                return f"Error: {response.status_code} - {response.text}"
-                
-        except requests.exceptions.ConnectionError:
-            return "Error: Cannot connect to Ollama. Please make sure Ollama is running."
-        except requests.exceptions.Timeout:
-            return "Error: Request timed out. Please try again."
+            if not model:
+                yield self._error_chunk("Error: No model selected")
+                return
+
+            payload = {
+                "model": model,
+                "prompt": prompt,
+                "stream": True,
+                "options": dict(self.options_for(model), **(options or {}))
+            }
+            if context:
+                payload["context"] = context
+            if system:
+                payload["system"] = system
+            keep_alive = self.keep_alive_for(model)
+            if keep_alive:
+                payload["keep_alive"] = keep_alive
+
+            # A model that may still need loading gets longer to send its first
+            # token; so does a request whose options can make Ollama reload it
+            timeout = self.timeout
+            if options or not self.loader.is_loaded(model):
+                timeout = (self.timeout[0], max(self.timeout[1], LOAD_TIMEOUT))
+
+            with self._request("POST", "generate", model=model, endpoint=endpoint,
+                               json=payload, stream=True, timeout=timeout) as response:
+                if response.status_code == 404:
+                    self.refresh_models()  # Refresh models list on 404
+                    yield self._error_chunk(f"Error: Model '{model}' not found. Please check available models in settings.")
+                    return
+                if response.status_code != 200:
+                    yield self._error_chunk(f"Error: {response.status_code} - {response.text}")
+                    return
+
+                # Cancelling shuts the connection down under a read in progress
+                # (which stops Ollama) instead of waiting for the next chunk
+                unregister = (cancel.on_set(lambda: self._interrupt(response))
+                              if hasattr(cancel, "on_set") else lambda: None)
+                try:
+                    for line in response.iter_lines():
+                        if cancel is not None and cancel.is_set():
+                            break
+                        if not line:
+                            continue
+                        chunk = json.loads(line)
+                        if "error" in chunk:
+                            yield self._error_chunk(f"Error: {chunk['error']}")
+                            return
+                        if chunk.get("done"):
+                            self.loader.mark_used(model, chunk)
+                            yield chunk
+                            return
+                        yield chunk
+                finally:
+                    unregister()
+                if cancel is not None and cancel.is_set():
+                    # Leaving the with block closes the connection
+                    yield {"response": "", "done": True, "cancelled": True}
+
         except Exception as e:
-            return f"Error: {str(e)}"
+            if cancel is not None and cancel.is_set():
+                # The read was cut short by _interrupt
+                yield {"response": "", "done": True, "cancelled": True}
+            elif isinstance(e, requests.exceptions.ConnectionError):
+                yield self._error_chunk("Error: Cannot connect to Ollama. Please make sure Ollama is running.")
+            elif isinstance(e, requests.exceptions.Timeout):
+                yield self._error_chunk("Error: Request timed out. Please try again.")
+            else:
+                yield self._error_chunk(f"Error: {str(e)}")
+
+    @staticmethod
+    def _interrupt(response: "requests.Response") -> None:
+        """Unblock a read of response running on another thread"""
+        try:
+            response.raw.shutdown()  # urllib3 2.3 and later
+        except Exception:
+            try:
+                response.close()
+            except Exception:
+                pass
+
+    @staticmethod
+    def build_prompt(history: List[dict], prompt: str) -> str:
+        """Fold earlier messages into a single prompt for a conversation without context"""
+        if not history:
+            return prompt
+        turns = []
+        for message in history:
+            speaker = "User" if message.get("role") == "user" else "Assistant"
+            turns.append(f"{speaker}: {message.get('content', '')}")
+        turns.append(f"User: {prompt}")
+        turns.append("Assistant:")
+        return "\n\n".join(turns)
+
+    @staticmethod
+    def _error_chunk(message: str) -> dict:
+        return {"response": message, "done": True, "error": True}
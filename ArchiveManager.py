@@ -0,0 +1,462 @@
+"""Streaming import and export of chat archives
+
+An archive is the JSON object {chat name: [messages]} that earlier versions
+wrote with json.dump, optionally compressed with gzip (.gz) or zstd (.zst,
+needs the zstandard package). Chats are written and parsed one at a time,
+so memory use depends on the largest chat rather than the archive size.
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from StorageManager import StorageManager
+
+# Bytes read from an archive at a time
+CHUNK_SIZE = 1 << 20
+# Progress is reported to the GUI at most this often
+PROGRESS_INTERVAL = 0.2
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+ARCHIVE_FILTER = "Chat Archives (*.json *.json.gz *.json.zst);;All Files (*)"
+
+
+class ArchiveCancelled(Exception):
+    pass
+
+
+def compression_for(path: str) -> Optional[str]:
+    """"gzip", "zstd" or None, from the file name when exporting"""
+    name = path.lower()
+    if name.endswith(".gz"):
+        return "gzip"
+    if name.endswith((".zst", ".zstd")):
+        return "zstd"
+    return None
+
+
+def _zstandard():
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("zstd archives need the zstandard package (pip install zstandard)")
+    return zstandard
+
+
+def open_archive(path: str, mode: str = "r",
+                 compression: Optional[str] = None) -> Tuple[io.TextIOBase, io.BufferedIOBase]:
+    """Text stream over a possibly compressed archive, and the raw file under it
+
+    Reading detects the compression from the file's first bytes; writing
+    uses compression ("gzip", "zstd" or None). The raw file's position
+    tracks progress.
+    """
+    raw = open(path, mode + "b")
+    try:
+        if mode == "r":
+            magic = raw.peek(4)[:4]
+            compression = ("gzip" if magic.startswith(GZIP_MAGIC) else
+                           "zstd" if magic == ZSTD_MAGIC else None)
+        if compression == "gzip":
+            stream = gzip.GzipFile(fileobj=raw, mode=mode + "b")
+        elif compression == "zstd":
+            zstandard = _zstandard()
+            stream = (zstandard.ZstdDecompressor().stream_reader(raw, closefd=False) if mode == "r"
+                      else zstandard.ZstdCompressor().stream_writer(raw, closefd=False))
+        else:
+            return io.TextIOWrapper(raw, encoding="utf-8"), raw
+        return io.TextIOWrapper(stream, encoding="utf-8"), raw
+    except Exception:
+        raw.close()
+        raise
+
+
+def iter_archive(stream: io.TextIOBase) -> Iterator[Tuple[str, list]]:
+    """Yield (chat name, messages) from an archive without reading it all
+
+    The buffer holds at most one chat plus CHUNK_SIZE characters; when a
+    chat does not fit it doubles, so long chats are still parsed in linear
+    time.
+    """
+    decoder = json.JSONDecoder()
+    buffer, pos, eof = "", 0, False
+
+    def fill() -> bool:
+        nonlocal buffer, pos, eof
+        if eof:
+            return False
+        data = stream.read(max(CHUNK_SIZE, len(buffer) - pos))
+        buffer, pos = buffer[pos:] + data, 0
+        eof = not data
+        return bool(data)
+
+    def next_char() -> str:
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer):
+                return buffer[pos]
+            if not fill():
+                return ""
+
+    def decode():
+        nonlocal pos
+        while True:
+            try:
+                value, pos = decoder.raw_decode(buffer, pos)
+                return value
+            except json.JSONDecodeError:
+                # Incomplete value at the end of the buffer, or invalid
+                if not fill():
+                    raise
+
+    def expect(char: str):
+        nonlocal pos
+        found = next_char()
+        if found != char:
+            raise ValueError(f"Not a chat archive: expected '{char}', found '{found or 'end of file'}'")
+        pos += 1
+
+    expect("{")
+    if next_char() == "}":
+        return
+    while True:
+        next_char()
+        name = decode()
+        if not isinstance(name, str):
+            raise ValueError("Not a chat archive: chat names must be strings")
+        expect(":")
+        next_char()
+        messages = decode()
+        if not isinstance(messages, list):
+            raise ValueError(f"Not a chat archive: messages of {name!r} are not a list")
+        yield name, messages
+        separator = next_char()
+        pos += 1
+        if separator == "}":
+            return
+        if separator != ",":
+            raise ValueError(f"Not a chat archive: expected ',' or '}}', found '{separator or 'end of file'}'")
+
+
+def write_archive(stream: io.TextIOBase, chats: Iterable[Tuple[str, list]]) -> int:
+    """Write chats as one JSON object, a chat at a time; returns the count"""
+    count = 0
+    stream.write("{")
+    for name, messages in chats:
+        if count:
+            stream.write(", ")
+        stream.write(json.dumps(name))
+        stream.write(": ")
+        stream.write(json.dumps(messages))
+        count += 1
+    stream.write("}")
+    return count
+
+
+def export_archive(storage: StorageManager, path: str, names: Optional[List[str]] = None,
+                   cancel: Optional[threading.Event] = None,
+                   progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """Write names (default: every chat) to path; returns the number of chats
+
+    The archive is written next to path and moved into place when complete,
+    so a cancelled or failed export leaves no partial file.
+    """
+    if names is None:
+        names = [entry["name"] for entry in storage.load_index()]
+    total = len(names)
+
+    def chats():
+        for done, name in enumerate(names):
+            if cancel is not None and cancel.is_set():
+                raise ArchiveCancelled()
+            if progress:
+                progress(done, total)
+            yield name, [dict(message) for message in storage.load_message_list(name)]
+
+    partial = path + ".part"
+    stream, raw = open_archive(partial, "w", compression_for(path))
+    try:
+        try:
+            count = write_archive(stream, chats())
+        finally:
+            stream.close()
+            raw.close()
+        os.replace(partial, path)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    if progress:
+        progress(total, total)
+    return count
+
+
+def message_digest(message: dict) -> bytes:
+    """Hash of a message's role and text; tokens and metrics do not count"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(str(message.get("role", "unknown")).encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(str(message.get("content", "")).encode("utf-8"))
+    return digest.digest()
+
+
+def chat_digest(digests: List[bytes]) -> bytes:
+    return hashlib.blake2b(b"".join(digests), digest_size=16).digest()
+
+
+class ChatIndex:
+    """Content hashes of every stored chat, for merging imports
+
+    Holds one 16-byte digest per message and one per chat, so comparing an
+    imported chat with the stored ones never needs their text again.
+    refresh() picks up chats that another connection (the window, while an
+    import runs) created, changed, renamed or deleted since.
+    """
+
+    def __init__(self, storage: StorageManager):
+        self.messages: Dict[str, List[bytes]] = {}  # chat name -> message digests
+        self.chats: Dict[bytes, str] = {}  # chat digest -> a chat with that content
+        self._updated: Dict[str, float] = {}  # chat name -> updated_at when hashed
+        self._version = None
+        self.refresh(storage)
+
+    def add(self, name: str, digests: List[bytes], updated_at: Optional[float] = None):
+        """Record name's content; updated_at (when known) spares re-hashing it on refresh"""
+        self.messages[name] = digests
+        self.chats.setdefault(chat_digest(digests), name)
+        if updated_at is not None:
+            self._updated[name] = updated_at
+
+    def refresh(self, storage: StorageManager):
+        """Re-hash the chats that changed since the index was last refreshed"""
+        version = storage.data_version()
+        if version == self._version:
+            return
+        self._version = version
+        stored = {entry["name"]: entry["updated_at"] for entry in storage.load_index()}
+        changed = [name for name, updated in stored.items() if self._updated.get(name) != updated]
+        removed = [name for name in self.messages if name not in stored]
+        if not changed and not removed:
+            return
+        for name in removed:
+            del self.messages[name]
+            self._updated.pop(name, None)
+        for name in changed:
+            self.messages[name] = [message_digest(m) for m in storage.load_message_list(name)]
+            self._updated[name] = stored[name]
+        self.chats = {}
+        for name, digests in self.messages.items():
+            self.chats.setdefault(chat_digest(digests), name)
+
+    def merge(self, name: str, digests: List[bytes]) -> Tuple[str, str, int]:
+        """How to import a chat: (action, target name, messages already stored)
+
+        action is "skipped" when a stored chat has the same messages or
+        already starts with all of them, "extended" when a stored chat of
+        that name (or a copy renamed by an earlier import) is a prefix of
+        it, "added" for a new name and "renamed" when a chat of that name
+        has different messages.
+        """
+        if (digests or name in self.messages) and chat_digest(digests) in self.chats:
+            return "skipped", self.chats[chat_digest(digests)], len(digests)
+        for candidate in self._copies(name):
+            stored = self.messages[candidate]
+            if digests[:len(stored)] == stored:
+                return "extended", candidate, len(stored)
+            if stored[:len(digests)] == digests:
+                return "skipped", candidate, len(digests)
+        if name not in self.messages:
+            return "added", name, 0
+        return "renamed", self._free_name(name), 0
+
+    def _copies(self, name: str) -> Iterator[str]:
+        """name and its renamed copies "name (2)", "name (3)", ... that exist"""
+        if name in self.messages:
+            yield name
+        n = 2
+        while f"{name} ({n})" in self.messages:
+            yield f"{name} ({n})"
+            n += 1
+
+    def _free_name(self, name: str) -> str:
+        n = 2
+        while f"{name} ({n})" in self.messages:
+            n += 1
+        return f"{name} ({n})"
+
+
+def import_archive(storage: StorageManager, path: str,
+                   cancel: Optional[threading.Event] = None,
+                   progress: Optional[Callable[[int, int], None]] = None
+                   ) -> Iterator[Tuple[str, str]]:
+    """Merge every chat in the archive at path into storage, yielding (action, name)
+
+    Chats are matched by content (see ChatIndex.merge): duplicates are
+    skipped, chats that continue a stored one only add their new messages,
+    and chats that conflict with a stored chat of the same name are stored
+    under a new name, so importing never overwrites anything. Each chat is
+    merged in its own transaction as soon as it is parsed, so a cancelled
+    or failed import keeps the chats before it. The transaction holds the
+    write lock while the chat is compared and written, after the index has
+    picked up whatever other connections changed, so chats created or
+    extended meanwhile are merged with rather than collided with.
+    progress is called with (compressed bytes read, file size).
+    """
+    total = os.path.getsize(path)
+    index = ChatIndex(storage)
+    stream, raw = open_archive(path, "r")
+    try:
+        for name, messages in iter_archive(stream):
+            if cancel is not None and cancel.is_set():
+                raise ArchiveCancelled()
+            digests = [message_digest(m) for m in messages]
+            with storage.transaction():
+                index.refresh(storage)
+                action, target, stored = index.merge(name, digests)
+                if action == "extended":
+                    storage.append_messages(target, messages[stored:])
+                elif action in ("added", "renamed"):
+                    storage.create_chat(target, messages)
+                if action != "skipped":
+                    index.add(target, digests, storage.load_entry(target)["updated_at"])
+            yield action, target
+            if progress:
+                progress(raw.tell(), total)
+    finally:
+        stream.close()
+        raw.close()
+    if progress:
+        progress(total, total)
+
+
+def describe_import(counts: Dict[str, int]) -> str:
+    """e.g. "Imported 3 chats (2 new, 1 extended); 5 duplicates skipped" """
+    changed = counts["added"] + counts["extended"] + counts["renamed"]
+    text = f"Imported {changed} chat{'s' if changed != 1 else ''}"
+    details = [f"{counts[action]} {label}" for action, label in
+               (("added", "new"), ("extended", "extended"), ("renamed", "renamed"))
+               if counts[action]]
+    if details:
+        text += f" ({', '.join(details)})"
+    if counts["skipped"]:
+        text += (f"; {counts['skipped']} duplicate{'s' if counts['skipped'] != 1 else ''}"
+                 " skipped")
+    return text
+
+
+class ArchiveSignals(QObject):
+    """Signals emitted by an ArchiveTask from its worker thread"""
+    progress = pyqtSignal(str, int, int)         # kind, done, total
+    imported = pyqtSignal(str)                   # chat the import just wrote
+    finished = pyqtSignal(str, bool, str, list)  # kind, success, message, chat names
+
+
+class ArchiveTask(QRunnable):
+    """Runs one import or export on a pool thread with its own database connection"""
+
+    def __init__(self, kind: str, db_path: str, path: str, names: Optional[List[str]],
+                 cancel: threading.Event, signals: ArchiveSignals):
+        super().__init__()
+        self.kind = kind
+        self.db_path = db_path
+        self.path = path
+        self.names = names
+        self.cancel = cancel
+        self.signals = signals
+        self._last_report = 0.0
+
+    def run(self):
+        storage = None
+        names = []
+        try:
+            # SQLite connections belong to the thread that opened them
+            storage = StorageManager(self.db_path, legacy_json_path="")
+            if self.kind == "import":
+                counts = dict.fromkeys(("added", "extended", "renamed", "skipped"), 0)
+                for action, name in import_archive(storage, self.path, self.cancel,
+                                                   self._progress):
+                    counts[action] += 1
+                    if action != "skipped":
+                        names.append(name)
+                        self.signals.imported.emit(name)
+                message = describe_import(counts)
+            else:
+                count = export_archive(storage, self.path, self.names, self.cancel,
+                                       self._progress)
+                message = f"Exported {count} chat{'s' if count != 1 else ''}"
+            self.signals.finished.emit(self.kind, True, message, names)
+        except ArchiveCancelled:
+            message = f"{self.kind.capitalize()} cancelled"
+            if names:
+                message += f" after {len(names)} chat{'s' if len(names) != 1 else ''}"
+            self.signals.finished.emit(self.kind, False, message, names)
+        except Exception as e:
+            print(f"Error during chat {self.kind}: {e}")
+            self.signals.finished.emit(self.kind, False, f"Chat {self.kind} failed: {e}", names)
+        finally:
+            if storage:
+                storage.close()
+
+    def _progress(self, done: int, total: int):
+        now = time.monotonic()
+        if done >= total or now - self._last_report >= PROGRESS_INTERVAL:
+            self._last_report = now
+            self.signals.progress.emit(self.kind, done, total)
+
+
+class ArchiveManager(QObject):
+    """Imports and exports chat archives in the background, one at a time"""
+    progress_changed = pyqtSignal(str, int, int)         # kind, done, total
+    chat_imported = pyqtSignal(str)                      # chat name, as each is written
+    archive_finished = pyqtSignal(str, bool, str, list)  # kind, success, message, chat names
+
+    def __init__(self, storage: StorageManager, parent=None):
+        super().__init__(parent)
+        self.storage = storage
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self.kind: Optional[str] = None  # "import" or "export" while one runs
+        self._cancel: Optional[threading.Event] = None
+
+        self._signals = ArchiveSignals()
+        self._signals.progress.connect(self.progress_changed)
+        self._signals.imported.connect(self.chat_imported)
+        self._signals.finished.connect(self._on_finished)
+
+    def busy(self) -> bool:
+        return self.kind is not None
+
+    def export_chats(self, path: str, names: Optional[List[str]] = None) -> bool:
+        """Export names (default: every chat); False if an import or export is running"""
+        return self._start("export", path, names)
+
+    def import_chats(self, path: str) -> bool:
+        return self._start("import", path, None)
+
+    def cancel(self):
+        if self._cancel:
+            self._cancel.set()
+
+    def shutdown(self, timeout_ms: int = 5000):
+        self.cancel()
+        self.pool.waitForDone(timeout_ms)
+
+    def _start(self, kind: str, path: str, names: Optional[List[str]]) -> bool:
+        if self.busy():
+            return False
+        self.kind = kind
+        self._cancel = threading.Event()
+        self.pool.start(ArchiveTask(kind, self.storage.db_path, path, names, self._cancel,
+                                    self._signals))
+        return True
+
+    def _on_finished(self, kind: str, success: bool, message: str, names: list):
+        self.kind = None
+        self._cancel = None
+        self.archive_finished.emit(kind, success, message, names)
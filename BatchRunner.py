@@ -0,0 +1,321 @@
+"""Run a file of prompts through one or more models without the GUI
+
+Prompts come from a text file (one prompt per line), a JSONL file (one
+object per line with "prompt" and optionally "id", "model" and "system")
+or standard input. Every prompt runs against every model given with
+--models (or its own "model"), at most --concurrency at a time, and each
+result is written to the output as one JSON line as soon as it finishes:
+
+    {"id": ..., "model": ..., "response": ..., "error": null, "metrics": {...}}
+
+The output doubles as a checkpoint: with --resume, prompts that already
+have a successful result in it are skipped and the rest are appended, so
+an interrupted or partly failed run can simply be started again.
+
+    python BatchRunner.py prompts.txt --models llama2 mistral --concurrency 4 \\
+        --output results.jsonl --resume
+
+Servers, connection, keep-alive, cache and metrics-log settings are read
+from settings.json; --url spreads the prompts over other servers. A summary with throughput and latency percentiles is
+printed to standard error at the end.
+"""
+import argparse
+import json
+import math
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+from APIManager import APIManager
+from EndpointPool import normalize_url
+
+# Percentiles reported in the summary
+PERCENTILES = (50, 90, 99)
+
+
+def read_prompts(lines: Iterable[str], jsonl: Optional[bool] = None) -> Iterator[dict]:
+    """Yield {"id", "prompt", ...} per non-empty line
+
+    jsonl=None treats a line as JSON when it starts with "{". Ids default
+    to the line number so they stay stable between runs of the same file.
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.rstrip("\r\n")
+        if not line.strip():
+            continue
+        if jsonl or (jsonl is None and line.lstrip().startswith("{")):
+            try:
+                job = json.loads(line)
+            except ValueError as e:
+                print(f"Skipping line {number}: {e}", file=sys.stderr)
+                continue
+            if not isinstance(job, dict) or not job.get("prompt"):
+                print(f"Skipping line {number}: no prompt", file=sys.stderr)
+                continue
+        else:
+            job = {"prompt": line}
+        job.setdefault("id", number)
+        yield job
+
+
+def completed_jobs(path: str) -> Set[Tuple[str, str]]:
+    """(id, model) of every successful result already in an output file"""
+    done = set()
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # A line cut short when the last run was interrupted
+                if not record.get("error"):
+                    done.add((str(record.get("id")), record.get("model")))
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def percentile(ordered: List[float], p: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    rank = math.ceil(p / 100 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+
+class BatchRunner:
+    """Runs prompt jobs through an APIManager with bounded concurrency
+
+    Results are handed to the output callback from the calling thread, in
+    the order they finish; only the requests themselves run on the pool.
+    """
+
+    def __init__(self, api_manager: APIManager, models: List[str], concurrency: int = 4,
+                 retries: int = 1, system: Optional[str] = None):
+        self.api_manager = api_manager
+        self.models = models
+        self.concurrency = max(1, concurrency)
+        self.retries = retries
+        self.system = system
+        self.results: List[dict] = []
+        self.skipped = 0
+        self.wall_seconds = 0.0
+
+    def jobs(self, prompts: Iterable[dict], done: Set[Tuple[str, str]]) -> Iterator[dict]:
+        """Expand prompts into one job per model, leaving out finished ones"""
+        for prompt in prompts:
+            for model in ([prompt["model"]] if prompt.get("model") else self.models):
+                if (str(prompt["id"]), model) in done:
+                    self.skipped += 1
+                    continue
+                yield dict(prompt, model=model)
+
+    def run(self, jobs: Iterable[dict], output) -> List[dict]:
+        """Run every job, calling output(record) as each one finishes"""
+        start = time.perf_counter()
+        jobs = iter(jobs)
+        pending = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency,
+                                thread_name_prefix="BatchRunner") as pool:
+            try:
+                # Keep at most concurrency requests in flight so huge prompt
+                # files (or an endless stdin) are read as they are needed
+                while True:
+                    for job in jobs:
+                        pending.add(pool.submit(self.run_job, job))
+                        if len(pending) >= self.concurrency:
+                            break
+                    if not pending:
+                        break
+                    finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        record = future.result()
+                        self.results.append(record)
+                        output(record)
+            except KeyboardInterrupt:
+                for future in pending:
+                    future.cancel()
+                raise
+            finally:
+                self.wall_seconds = time.perf_counter() - start
+        return self.results
+
+    def run_job(self, job: dict) -> dict:
+        """Generate one response, retrying failed requests; never raises"""
+        system = job.get("system", self.system) or None
+        attempts = 0
+        while True:
+            attempts += 1
+            text, final, error = "", {}, None
+            try:
+                # The scheduler groups jobs by model so Ollama does not keep swapping models
+                text, final = self.api_manager.scheduler.generate(job["prompt"], model=job["model"],
+                                                                  system=system)
+                if final.get("error"):
+                    error = text or "Unknown error"
+            except Exception as e:
+                error = f"Error: {e}"
+            if error is None or attempts > self.retries:
+                break
+            time.sleep(min(2 ** attempts, 30))
+        record = {"id": job["id"], "model": job["model"],
+                  "response": None if error else text,
+                  "error": error, "attempts": attempts,
+                  "metrics": final.get("metrics")}
+        # Pass through any extra fields from a JSONL prompt (tags, expected answers, ...)
+        for key, value in job.items():
+            if key not in record and key not in ("prompt", "system"):
+                record[key] = value
+        return record
+
+    def summary(self) -> dict:
+        """Totals, throughput and latency percentiles overall and per model"""
+        summary = {"jobs": len(self.results), "skipped": self.skipped,
+                   "wall_seconds": round(self.wall_seconds, 3)}
+        summary.update(self._stats(self.results, self.wall_seconds))
+        summary["models"] = {model: self._stats([r for r in self.results
+                                                 if r["model"] == model], self.wall_seconds)
+                             for model in dict.fromkeys(r["model"] for r in self.results)}
+        return summary
+
+    @staticmethod
+    def _stats(records: List[dict], wall_seconds: float) -> dict:
+        ok = [r for r in records if not r["error"]]
+        metrics = [r["metrics"] for r in ok if r.get("metrics")]
+        tokens = sum(m.get("eval_count", 0) for m in metrics)
+        stats = {"succeeded": len(ok), "failed": len(records) - len(ok),
+                 "tokens": tokens,
+                 "requests_per_second": round(len(ok) / wall_seconds, 3) if wall_seconds else 0.0,
+                 "tokens_per_second": round(tokens / wall_seconds, 2) if wall_seconds else 0.0}
+        for name, key in (("latency", "wall_seconds"), ("first_token", "first_token_seconds")):
+            values = sorted(m[key] for m in metrics if m.get(key) is not None)
+            if values:
+                stats[name] = {f"p{p}": round(percentile(values, p), 4) for p in PERCENTILES}
+                stats[name]["max"] = round(values[-1], 4)
+        return stats
+
+
+def format_summary(summary: dict) -> str:
+    lines = [f"{summary['jobs']} jobs in {summary['wall_seconds']:.1f} s "
+             f"({summary['skipped']} skipped from an earlier run)"]
+
+    def describe(name: str, stats: dict):
+        lines.append(f"{name}: {stats['succeeded']} succeeded, {stats['failed']} failed, "
+                     f"{stats['requests_per_second']:.2f} requests/s, "
+                     f"{stats['tokens_per_second']:.1f} tokens/s")
+        for key, label in (("latency", "latency"), ("first_token", "first token")):
+            if key in stats:
+                values = ", ".join(f"{k} {v:.2f} s" for k, v in stats[key].items())
+                lines.append(f"  {label}: {values}")
+
+    describe("all models", summary)
+    if len(summary["models"]) > 1:
+        for model, stats in summary["models"].items():
+            describe(model, stats)
+    return "\n".join(lines)
+
+
+def load_settings(path: str) -> dict:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def configure_api_manager(api_manager: APIManager, settings: dict, concurrency: int):
+    """Apply the GUI's servers, connection, keep-alive, model options, cache and metrics settings"""
+    api_manager.configure_endpoints(settings.get("endpoints", []),
+                                    settings.get("health_check_interval", 30))
+    api_manager.configure_keep_alive(settings.get("keep_alive", ""),
+                                     settings.get("keep_alive_overrides", {}))
+    api_manager.configure_options(settings.get("model_options", {}))
+    # Every worker needs its own pooled connection
+    api_manager.configure_transport(max(settings.get("pool_size", 10), concurrency),
+                                    settings.get("connect_timeout", 5.0),
+                                    settings.get("read_timeout", 30.0))
+    api_manager.enable_cache(settings.get("response_cache", False),
+                             settings.get("cache_memory_entries", 256),
+                             settings.get("cache_disk_mb", 100))
+    api_manager.enable_metrics_log(settings.get("metrics_log", True),
+                                   max_mb=settings.get("metrics_log_mb", 5))
+    api_manager.scheduler.configure(concurrency, settings.get("max_active_models", 1))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("input", nargs="?", default="-",
+                        help="prompt file (.txt or .jsonl); - or omitted reads standard input")
+    parser.add_argument("-m", "--models", nargs="+",
+                        help="models to run every prompt on (default: the model in settings)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4,
+                        help="requests in flight at once")
+    parser.add_argument("-o", "--output", default="-",
+                        help="JSONL results file; - writes to standard output")
+    parser.add_argument("--resume", action="store_true",
+                        help="skip prompts already answered in --output and append to it")
+    parser.add_argument("--format", choices=("auto", "text", "jsonl"), default="auto",
+                        help="input format; auto treats lines starting with { as JSON")
+    parser.add_argument("--system", help="system prompt for prompts that do not set one")
+    parser.add_argument("--retries", type=int, default=1,
+                        help="extra attempts for a failed request")
+    parser.add_argument("--url", nargs="+",
+                        help="Ollama servers to spread the prompts over "
+                             "(default: the servers in settings)")
+    parser.add_argument("--settings", default="settings.json")
+    parser.add_argument("--summary-json", help="also write the summary to this file")
+    args = parser.parse_args(argv)
+
+    if args.resume and args.output == "-":
+        parser.error("--resume needs --output")
+
+    settings = load_settings(args.settings)
+    if args.url:
+        settings["endpoints"] = [normalize_url(url) for url in args.url]
+    api_manager = APIManager()
+    configure_api_manager(api_manager, settings, args.concurrency)
+    models = args.models or [settings.get("model", api_manager.model)]
+
+    runner = BatchRunner(api_manager, models, args.concurrency, args.retries,
+                         args.system or settings.get("system_prompt") or None)
+    done = completed_jobs(args.output) if args.resume else set()
+    jsonl = {"auto": None, "text": False, "jsonl": True}[args.format]
+    if args.format == "auto" and args.input.endswith(".jsonl"):
+        jsonl = True
+
+    source = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    if args.output == "-":
+        output_file = sys.stdout
+    else:
+        output_file = open(args.output, "a" if args.resume else "w", encoding="utf-8")
+
+    def write(record: dict):
+        output_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output_file.flush()  # Each finished result is on disk before the next one
+        status = f"failed: {record['error']}" if record["error"] else "done"
+        print(f"[{len(runner.results)}] {record['id']} on {record['model']} {status}",
+              file=sys.stderr)
+
+    interrupted = False
+    try:
+        runner.run(runner.jobs(read_prompts(source, jsonl), done), write)
+    except KeyboardInterrupt:
+        interrupted = True
+        print("Interrupted; run again with --resume to continue", file=sys.stderr)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+        api_manager.close()
+
+    summary = runner.summary()
+    print(format_summary(summary), file=sys.stderr)
+    if args.summary_json:
+        with open(args.summary_json, "w") as f:
+            json.dump(summary, f, indent=2)
+    if interrupted:
+        return 130
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
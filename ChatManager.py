@@ -1,29 +1,252 @@
 import os
+import queue
+import threading
+import time
+
+# How long the writer waits for more work before writing a batch
+COALESCE_DELAY = 0.05
+# Transcripts are fsynced at most this often
+FSYNC_INTERVAL = 2.0
+# Appended to a reply recovered from a checkpoint after a crash
+INTERRUPTED_MARKER = " [interrupted]"
 
 class ChatManager:
+    """Writes auto-save transcripts (chat_<id>.txt) on a background thread
+
+    New messages are appended rather than rewriting the file, bursts are
+    coalesced into one write per file, and files are fsynced periodically.
+    Replies that are still streaming are checkpointed to chat_<id>.partial so
+    a crash mid-generation keeps what was produced; recover() folds those
+    checkpoints back into the transcripts on the next start.
+    """
+
     def __init__(self):
         self.auto_save = False
         self.save_directory = ""
         self.current_chat = None
-        
+
+        self._queue = queue.Queue()
+        self._writer = None
+        self._ready_dirs = set()
+        self._known_transcripts = set()
+        self._unsynced = set()
+        self._tail_checked = set()
+        self._last_fsync = time.monotonic()
+
     def set_auto_save(self, enabled: bool, directory: str = ""):
         """Configure auto-save settings"""
+        changed = enabled and (not self.auto_save or directory != self.save_directory)
         self.auto_save = enabled
         self.save_directory = directory
-        
+        if changed and directory:
+            self.recover()
+
+    def transcript_path(self, chat_id: str) -> str:
+        return os.path.join(self.save_directory, f"chat_{chat_id}.txt")
+
+    def has_transcript(self, chat_id: str) -> bool:
+        """Whether chat_id already has a transcript that new messages can extend"""
+        path = self.transcript_path(chat_id)
+        if path in self._known_transcripts:
+            return True
+        if os.path.exists(path):
+            self._known_transcripts.add(path)
+            return True
+        return False
+
     def save_chat(self, chat_id: str, content: str):
-        """Save chat content"""
+        """Replace the whole transcript of chat_id"""
+        if self.auto_save and self.save_directory:
+            path = self.transcript_path(chat_id)
+            self._known_transcripts.add(path)
+            self._put(("write", path, content + "\n"))
+
+    def append_message(self, chat_id: str, message: dict):
+        """Append one message to the transcript of chat_id"""
+        if self.auto_save and self.save_directory:
+            path = self.transcript_path(chat_id)
+            self._known_transcripts.add(path)
+            self._put(("append", path, f"{message['role']}: {message['content']}\n"))
+
+    def checkpoint_partial(self, chat_id: str, content: str):
+        """Record the reply streamed so far; only the latest checkpoint is kept"""
+        if self.auto_save and self.save_directory:
+            self._put(("partial", self._partial_path(chat_id), content))
+
+    def clear_partial(self, chat_id: str):
+        """Drop the checkpoint once the finished reply has been appended"""
         if self.auto_save and self.save_directory:
+            self._put(("partial", self._partial_path(chat_id), None))
+
+    def recover(self):
+        """Append replies interrupted by a crash to their transcripts"""
+        try:
+            names = os.listdir(self.save_directory)
+        except OSError:
+            return
+        for name in names:
+            if not (name.startswith("chat_") and name.endswith(".partial")):
+                continue
+            partial_path = os.path.join(self.save_directory, name)
+            transcript = partial_path[:-len(".partial")] + ".txt"
             try:
-                # Create save directory if it doesn't exist
-                os.makedirs(self.save_directory, exist_ok=True)
-                
-                # Save chat to file
-                file_path = os.path.join(self.save_directory, f"chat_{chat_id}.txt")
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write(content)
-                    
-                print(f"Auto-saved chat to: {file_path}")
+                with open(partial_path, "r", encoding="utf-8") as f:
+                    line = f"assistant: {f.read()}"
+                if line.strip() != "assistant:" and not self._ends_with(transcript, line):
+                    with open(transcript, "a", encoding="utf-8") as f:
+                        f.write(line + INTERRUPTED_MARKER + "\n")
+                        f.flush()
+                        os.fsync(f.fileno())
+                    print(f"Recovered interrupted reply into: {transcript}")
+                os.remove(partial_path)
+            except Exception as e:
+                print(f"Error recovering {partial_path}: {e}")
+
+    def flush(self, timeout: float = 5.0):
+        """Block until everything queued so far is written and fsynced"""
+        if self._writer is None:
+            return
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        done.wait(timeout)
+
+    def close(self):
+        """Flush and stop the writer thread; call on application exit"""
+        if self._writer is None:
+            return
+        self._queue.put(None)
+        self._writer.join(5.0)
+        self._writer = None
+
+    def _partial_path(self, chat_id: str) -> str:
+        return os.path.join(self.save_directory, f"chat_{chat_id}.partial")
+
+    def _put(self, op):
+        if self._writer is None:
+            self._writer = threading.Thread(target=self._run, name="ChatManager writer", daemon=True)
+            self._writer.start()
+        self._queue.put(op)
+
+    def _run(self):
+        while True:
+            # With writes not yet synced, wake up in time to fsync them even
+            # if nothing else is queued
+            timeout = (max(0.0, FSYNC_INTERVAL - (time.monotonic() - self._last_fsync))
+                       if self._unsynced else None)
+            try:
+                op = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                self._fsync_all()
+                continue
+            time.sleep(COALESCE_DELAY)  # Let a burst pile up
+            batch = [op]
+            try:
+                while True:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            stop = None in batch
+            flushes = [item[1] for item in batch if item and item[0] == "flush"]
+            self._write_batch([item for item in batch if item and item[0] != "flush"])
+            if stop or flushes or time.monotonic() - self._last_fsync >= FSYNC_INTERVAL:
+                self._fsync_all()
+            for done in flushes:
+                done.set()
+            if stop:
+                return
+
+    def _write_batch(self, batch):
+        """Apply a batch with one write per transcript and the latest checkpoint per chat"""
+        pending = {}   # transcript path -> [replace whole file, text]
+        partials = {}  # partial path -> latest text, or None to remove
+        for kind, path, text in batch:
+            if kind == "write":
+                pending[path] = [True, text]
+            elif kind == "append":
+                entry = pending.setdefault(path, [False, ""])
+                entry[1] += text
+            elif kind == "partial":
+                partials[path] = text
+
+        for path, (replace, text) in pending.items():
+            try:
+                self._ensure_dir(os.path.dirname(path))
+                if replace:
+                    self._replace_file(path, text)
+                else:
+                    if path not in self._tail_checked and self._lacks_final_newline(path):
+                        # Transcripts written by older versions lack the final newline
+                        text = "\n" + text
+                    with open(path, "a", encoding="utf-8") as f:
+                        f.write(text)
+                self._tail_checked.add(path)
+                self._unsynced.add(path)
             except Exception as e:
                 print(f"Error auto-saving chat: {e}")
 
+        for path, text in partials.items():
+            try:
+                if text is None:
+                    if os.path.exists(path):
+                        os.remove(path)
+                else:
+                    self._ensure_dir(os.path.dirname(path))
+                    # Checkpoints are rewritten constantly; the periodic fsync is enough
+                    self._replace_file(path, text, sync=False)
+            except Exception as e:
+                print(f"Error checkpointing reply: {e}")
+
+    def _ensure_dir(self, directory: str):
+        if directory not in self._ready_dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._ready_dirs.add(directory)
+
+    @staticmethod
+    def _replace_file(path: str, text: str, sync: bool = True):
+        """Write path atomically so a crash leaves either the old or new file"""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+            if sync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def _fsync_all(self):
+        for path in self._unsynced:
+            try:
+                fd = os.open(path, os.O_RDWR)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError as e:
+                print(f"Error syncing {path}: {e}")
+        self._unsynced.clear()
+        self._last_fsync = time.monotonic()
+
+    @staticmethod
+    def _lacks_final_newline(path: str) -> bool:
+        try:
+            with open(path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() == 0:
+                    return False
+                f.seek(-1, os.SEEK_END)
+                return f.read(1) != b"\n"
+        except OSError:
+            return False
+
+    @staticmethod
+    def _ends_with(path: str, text: str) -> bool:
+        """Check the end of a file without reading all of it"""
+        expected = text.encode("utf-8")
+        try:
+            with open(path, "rb") as f:
+                f.seek(0, os.SEEK_END)
+                size = f.tell()
+                f.seek(max(0, size - len(expected) - 2))
+                return f.read().rstrip(b"\n").endswith(expected.rstrip(b"\n"))
+        except OSError:
+            return False
@@ -0,0 +1,168 @@
+import math
+from typing import Optional, Sequence
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from APIManager import APIManager
+from StorageManager import ChatCache
+from RequestScheduler import BACKGROUND
+
+# Rough characters-per-token ratio, used until Ollama reports a real count
+CHARS_PER_TOKEN = 4
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation below in a few sentences. Keep the facts, names, "
+    "decisions and open questions needed to continue it. Reply with the summary only."
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, math.ceil(len(text) / CHARS_PER_TOKEN))
+
+
+def message_tokens(message: dict) -> int:
+    """Token count of a message, estimated once and cached on the message"""
+    tokens = message.get("tokens")
+    if tokens is None:
+        tokens = message["tokens"] = estimate_tokens(message.get("content", ""))
+    return tokens
+
+
+class SummarySignals(QObject):
+    finished = pyqtSignal(str, str, int)  # chat name, summary, covered message count
+
+
+class SummaryTask(QRunnable):
+    """Summarizes older turns of a chat with the summary model on a pool thread
+
+    The oldest of messages[covered:start] are folded into summary, one
+    budget's worth at a time; the transcript is built here rather than on
+    the GUI thread.
+    """
+
+    def __init__(self, api_manager: APIManager, chat_name: str, model: str,
+                 messages: Sequence[dict], covered: int, start: int,
+                 summary: Optional[dict], budget: int, signals: SummarySignals):
+        super().__init__()
+        self.api_manager = api_manager
+        self.chat_name = chat_name
+        self.model = model
+        self.messages = messages
+        self.covered = covered
+        self.start = start
+        self.summary = summary
+        self.budget = budget
+        self.signals = signals
+
+    def run(self):
+        batch, tokens = [], self.summary["tokens"] if self.summary else 0
+        # The chat may have been cut short since prepare()
+        for index in range(self.covered, min(self.start, len(self.messages))):
+            message = self.messages[index]
+            if batch and tokens + message_tokens(message) > self.budget:
+                break
+            batch.append(message)
+            tokens += message_tokens(message)
+        if not batch:
+            self.signals.finished.emit(self.chat_name, "", self.covered)
+            return
+
+        prompt = "\n\n".join(
+            f"{'User' if m.get('role') == 'user' else 'Assistant'}: {m.get('content', '')}"
+            for m in batch)
+        if self.summary and self.summary["summary"]:
+            prompt = f"Summary so far: {self.summary['summary']}\n\n{prompt}"
+
+        # Background priority: a message being sent goes first and may interrupt this
+        summary, final = self.api_manager.scheduler.generate(prompt, model=self.model,
+                                                             system=SUMMARY_PROMPT,
+                                                             priority=BACKGROUND)
+        if final.get("error") or final.get("cancelled"):
+            print(f"Error summarizing {self.chat_name}: {summary or 'cancelled'}")
+            summary = ""
+        self.signals.finished.emit(self.chat_name, summary.strip(), self.covered + len(batch))
+
+
+class ContextManager(QObject):
+    """Chooses what to send with each message so prompt evaluation stays bounded
+
+    While a chat's cached Ollama context plus the new message fits the token
+    budget it is reused as is. Otherwise a fresh prompt is built from the
+    pinned system prompt, the chat's rolling summary and as many recent
+    messages as fit. Messages that fall out of that window are folded into
+    the summary in the background by the (ideally cheap) summary model.
+    """
+    summary_updated = pyqtSignal(str)  # chat name
+
+    def __init__(self, api_manager: APIManager, chats: ChatCache, budget: int = 2048,
+                 system_prompt: str = "", summary_model: str = "", parent=None):
+        super().__init__(parent)
+        self.api_manager = api_manager
+        self.chats = chats
+        self.configure(budget, system_prompt, summary_model)
+
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)  # Summaries are background work
+        self._summarizing = set()
+        self._signals = SummarySignals()
+        self._signals.finished.connect(self._on_summary)
+
+    def configure(self, budget: int, system_prompt: str = "", summary_model: str = ""):
+        self.budget = budget
+        self.system_prompt = system_prompt
+        self.summary_model = summary_model
+
+    def prepare(self, chat_name: str, model: str) -> dict:
+        """Keyword arguments for GenerationManager.generate for the chat's last message"""
+        messages = self.chats[chat_name]
+        new_message = messages[-1]
+        new_tokens = message_tokens(new_message)
+
+        context = self.chats.context_for(chat_name, model)
+        if context and len(context) + new_tokens <= self.budget:
+            return {"prompt": new_message["content"], "context": context}
+
+        summary = self.chats.storage.load_summary(chat_name)
+        covered = summary["covered_count"] if summary else 0
+        available = self.budget - new_tokens
+        if self.system_prompt:
+            available -= estimate_tokens(self.system_prompt)
+        if summary:
+            available -= summary["tokens"]
+
+        # Walk back from the newest message while the window still fits
+        start = len(messages) - 1
+        while start > covered and message_tokens(messages[start - 1]) <= available:
+            start -= 1
+            available -= message_tokens(messages[start])
+
+        if start > covered:
+            self._summarize(chat_name, model, messages, covered, start, summary)
+
+        prompt = APIManager.build_prompt(messages[start:-1], new_message["content"])
+        if summary and summary["summary"]:
+            prompt = f"Summary of the earlier conversation: {summary['summary']}\n\n{prompt}"
+        return {"prompt": prompt, "system": self.system_prompt or None}
+
+    def shutdown(self, timeout_ms: int = 1000):
+        self.pool.clear()
+        self.pool.waitForDone(timeout_ms)
+
+    def _summarize(self, chat_name: str, model: str, messages: Sequence[dict],
+                   covered: int, start: int, summary: Optional[dict]):
+        """Fold the oldest of messages[covered:start] into the summary in the background"""
+        if chat_name in self._summarizing:
+            return
+        self._summarizing.add(chat_name)
+        self.pool.start(SummaryTask(self.api_manager, chat_name, self.summary_model or model,
+                                    messages, covered, start, summary, self.budget,
+                                    self._signals))
+
+    def _on_summary(self, chat_name: str, summary: str, covered_count: int):
+        self._summarizing.discard(chat_name)
+        if not summary or chat_name not in self.chats:
+            return
+        current = self.chats.storage.load_summary(chat_name)
+        if current and current["covered_count"] >= covered_count:
+            return
+        self.chats.storage.save_summary(chat_name, summary, covered_count,
+                                        estimate_tokens(summary))
+        self.summary_updated.emit(chat_name)
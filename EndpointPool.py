@@ -0,0 +1,271 @@
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+from ModelRegistry import display_name
+
+DEFAULT_URL = "http://localhost:11434/api"
+# Seconds a health check waits for a server to answer
+HEALTH_TIMEOUT = 5
+# Weight of the newest sample in each endpoint's moving average latency
+LATENCY_SMOOTHING = 0.3
+# A server that would have to load the model counts as this many extra
+# requests in flight, so a warm server wins unless it is clearly busier
+COLD_PENALTY = 2
+
+
+def normalize_url(text: str) -> str:
+    """Turn "box:11434" or "http://box:11434/" into "http://box:11434/api" """
+    url = text.strip().rstrip("/")
+    if "://" not in url:
+        url = "http://" + url
+    if not url.endswith("/api"):
+        url += "/api"
+    return url
+
+
+def parse_endpoints(text: str) -> List[str]:
+    """Parse a comma- or whitespace-separated list of server addresses"""
+    urls = []
+    for entry in text.replace(",", " ").split():
+        url = normalize_url(entry)
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+
+def format_endpoints(urls: List[str]) -> str:
+    return ", ".join(urls)
+
+
+class Endpoint:
+    """One Ollama server and what is known about it"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.healthy = True  # Assumed until a request or health check fails
+        self.latency: Optional[float] = None  # Seconds, moving average of /api/tags
+        self.in_flight = 0
+        self.models: Optional[set] = None  # Installed models; None until first listed
+        self.loaded: set = set()  # Models in memory (from /api/ps and recent use)
+        self.checked_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def has_model(self, model: str) -> bool:
+        """Whether model is installed here; unknown counts as yes"""
+        return self.models is None or display_name(model) in self.models
+
+    def status(self) -> dict:
+        return {"url": self.url, "healthy": self.healthy, "latency": self.latency,
+                "in_flight": self.in_flight,
+                "models": sorted(self.models) if self.models is not None else None,
+                "loaded": sorted(self.loaded), "error": self.error}
+
+
+class EndpointPool:
+    """Routes requests across one or more Ollama servers
+
+    choose() picks the server for a request: healthy servers that have the
+    model installed, then the least loaded, counting requests in flight
+    plus COLD_PENALTY if the model is not in memory there, then the lowest
+    latency.
+    With more than one server a background thread checks every server
+    each check_interval seconds, listing its installed and loaded models
+    and timing the answer; a server that fails is skipped until it
+    answers again. Subscribers are called with status() after each check,
+    from the checking thread.
+    """
+
+    def __init__(self, api_manager, urls: Iterable[str] = (DEFAULT_URL,),
+                 check_interval: float = 30):
+        self.api_manager = api_manager
+        self.check_interval = check_interval
+        self._endpoints: List[Endpoint] = []
+        self._subscribers: List[Callable[[List[dict]], None]] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._checker: Optional[threading.Thread] = None
+        self._closed = False
+        self.configure(urls, check_interval)
+
+    def __len__(self) -> int:
+        return len(self._endpoints)
+
+    @property
+    def endpoints(self) -> List[Endpoint]:
+        return list(self._endpoints)
+
+    @property
+    def primary(self) -> Endpoint:
+        return self._endpoints[0]
+
+    def configure(self, urls: Iterable[str], check_interval: Optional[float] = None):
+        """Replace the server list, keeping what is known about servers that stay"""
+        urls = [normalize_url(url) for url in urls if url.strip()] or [DEFAULT_URL]
+        with self._lock:
+            existing = {endpoint.url: endpoint for endpoint in self._endpoints}
+            self._endpoints = [existing.get(url) or Endpoint(url) for url in dict.fromkeys(urls)]
+            if check_interval is not None:
+                self.check_interval = check_interval
+            start = (len(self._endpoints) > 1 and self._checker is None
+                     and not self._closed)
+            if start:
+                self._checker = threading.Thread(target=self._check_loop,
+                                                 name="EndpointPool health", daemon=True)
+        # Check new servers right away; a new checker starts with a check
+        if start:
+            self._checker.start()
+        else:
+            self._wake.set()
+
+    def choose(self, model: Optional[str] = None,
+               exclude: Iterable[Endpoint] = ()) -> Optional[Endpoint]:
+        """The best server for a request on model, or None if all are excluded"""
+        exclude = list(exclude)
+        name = display_name(model) if model else None
+        with self._lock:
+            candidates = [e for e in self._endpoints if e not in exclude]
+            if not candidates:
+                return None
+            return min(candidates, key=lambda e: (
+                not e.healthy,
+                bool(name) and not e.has_model(name),
+                e.in_flight + (COLD_PENALTY if name and name not in e.loaded else 0),
+                e.latency if e.latency is not None else float("inf")))
+
+    def hosting(self, model: str) -> List[Endpoint]:
+        """Servers that have model installed (or have not been listed yet)"""
+        with self._lock:
+            return [e for e in self._endpoints if e.has_model(model)]
+
+    def begin(self, endpoint: Endpoint):
+        with self._lock:
+            endpoint.in_flight += 1
+
+    def end(self, endpoint: Endpoint):
+        with self._lock:
+            endpoint.in_flight = max(0, endpoint.in_flight - 1)
+
+    def mark_down(self, endpoint: Endpoint, error: Exception):
+        with self._lock:
+            was_healthy = endpoint.healthy
+            endpoint.healthy = False
+            endpoint.error = str(error)
+            endpoint.loaded.clear()
+        if was_healthy:
+            print(f"Ollama server {endpoint.url} is not responding: {error}")
+            self._notify()
+
+    def mark_warm(self, endpoint: Endpoint, model: str):
+        """Record that endpoint just ran model, so it stays the first choice for it"""
+        name = display_name(model)
+        with self._lock:
+            endpoint.healthy = True
+            endpoint.loaded.add(name)
+            if endpoint.models is not None:
+                endpoint.models.add(name)
+
+    def list_models(self) -> Dict[str, dict]:
+        """/api/tags from every server, merged; raises if no server answers"""
+        results: Dict[Endpoint, object] = {}
+        if len(self._endpoints) == 1:
+            self._list_into(self.primary, results)
+        else:
+            threads = [threading.Thread(target=self._list_into, args=(endpoint, results),
+                                        daemon=True) for endpoint in self.endpoints]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        merged, errors = {}, []
+        for endpoint in self.endpoints:
+            result = results.get(endpoint)
+            if isinstance(result, Exception) or result is None:
+                errors.append(result)
+                continue
+            for entry in result:
+                merged.setdefault(display_name(entry["name"]), entry)
+        if errors and len(errors) == len(results):
+            raise errors[0] or RuntimeError("No Ollama server answered")
+        return merged
+
+    def check(self):
+        """Check every server now: health, latency, installed and loaded models"""
+        try:
+            self.list_models()
+        except Exception:
+            pass  # Each server's error is recorded on its endpoint
+        for endpoint in self.endpoints:
+            if not endpoint.healthy:
+                continue
+            try:
+                response = self.api_manager._request("GET", "ps", endpoint=endpoint,
+                                                     timeout=self._health_timeout())
+                if response.status_code == 200:
+                    loaded = {display_name(entry["name"])
+                              for entry in response.json().get("models", [])}
+                    with self._lock:
+                        endpoint.loaded = loaded
+            except Exception as e:
+                print(f"Error listing loaded models on {endpoint.url}: {e}")
+        self._notify()
+
+    def status(self) -> List[dict]:
+        with self._lock:
+            return [endpoint.status() for endpoint in self._endpoints]
+
+    def subscribe(self, callback: Callable[[List[dict]], None]):
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[List[dict]], None]):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+
+    def _list_into(self, endpoint: Endpoint, results: dict):
+        start = time.perf_counter()
+        try:
+            response = self.api_manager._request("GET", "tags", endpoint=endpoint,
+                                                 timeout=self._health_timeout())
+            response.raise_for_status()
+            entries = response.json().get("models", [])
+        except Exception as e:
+            results[endpoint] = e
+            with self._lock:
+                endpoint.healthy = False
+                endpoint.error = str(e)
+                endpoint.loaded.clear()
+                endpoint.checked_at = time.time()
+            return
+        elapsed = time.perf_counter() - start
+        results[endpoint] = entries
+        with self._lock:
+            endpoint.healthy = True
+            endpoint.error = None
+            endpoint.models = {display_name(entry["name"]) for entry in entries}
+            endpoint.latency = (elapsed if endpoint.latency is None else
+                                LATENCY_SMOOTHING * elapsed
+                                + (1 - LATENCY_SMOOTHING) * endpoint.latency)
+            endpoint.checked_at = time.time()
+
+    def _health_timeout(self) -> tuple:
+        return (self.api_manager.timeout[0], HEALTH_TIMEOUT)
+
+    def _check_loop(self):
+        while not self._closed:
+            self._wake.clear()
+            if len(self._endpoints) > 1:
+                self.check()
+            self._wake.wait(self.check_interval)
+        with self._lock:
+            self._checker = None
+
+    def _notify(self):
+        status = self.status()
+        for callback in list(self._subscribers):
+            try:
+                callback(status)
+            except Exception as e:
+                print(f"Error notifying endpoint subscriber: {e}")
@@ -0,0 +1,160 @@
+import itertools
+from typing import Dict, List, Optional
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from APIManager import APIManager
+from RequestScheduler import INTERACTIVE, Ticket
+
+
+class GenerationSignals(QObject):
+    """Signals emitted by a GenerationTask from its worker thread"""
+    token_received = pyqtSignal(int, str)   # task id, text
+    finished = pyqtSignal(int, str, dict)   # task id, full response, last chunk
+
+
+class GenerationTask(QRunnable):
+    """Streams one response from Ollama on a pool thread"""
+
+    def __init__(self, task_id: int, api_manager: APIManager, prompt: str,
+                 context: Optional[List[int]], system: Optional[str], ticket: Ticket,
+                 signals: GenerationSignals):
+        super().__init__()
+        self.task_id = task_id
+        self.api_manager = api_manager
+        self.prompt = prompt
+        self.context = context
+        self.system = system
+        self.ticket = ticket
+        self.signals = signals
+
+    def run(self):
+        pieces = []
+        final = {}
+        # The scheduler queues the request until Ollama can take it without thrashing
+        for chunk in self.api_manager.scheduler.stream(self.prompt, context=self.context,
+                                                       system=self.system, ticket=self.ticket):
+            text = chunk.get("response", "")
+            if chunk.get("error"):
+                # Keep the text already streamed and shown, as cancel() does
+                pieces.append(f"\n\n{text}" if pieces else text)
+                break
+            if text:
+                pieces.append(text)
+                self.signals.token_received.emit(self.task_id, text)
+            if chunk.get("done"):
+                final = chunk
+        self.signals.finished.emit(self.task_id, "".join(pieces), final)
+
+
+class GenerationManager(QObject):
+    """Runs generations off the GUI thread and tracks them per chat
+
+    Every chat can have at most one generation in flight, which cancel()
+    stops. Tasks are identified internally by id so a chat can be renamed
+    while its response is streaming.
+    """
+    token_received = pyqtSignal(str, str)    # chat name, text
+    response_ready = pyqtSignal(str, str, dict)  # chat name, full response, Ollama stats
+    context_ready = pyqtSignal(str, str, list)  # chat name, model, context
+    state_changed = pyqtSignal(str, bool)    # chat name, generating
+
+    def __init__(self, api_manager: APIManager, max_threads: int = 8, parent=None):
+        super().__init__(parent)
+        self.api_manager = api_manager
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self._ids = itertools.count(1)
+        self._chat_for_task: Dict[int, str] = {}
+        self._model_for_task: Dict[int, str] = {}
+        self._ticket_for_task: Dict[int, Ticket] = {}
+        self._partial: Dict[str, str] = {}
+
+        self._signals = GenerationSignals()
+        self._signals.token_received.connect(self._on_token)
+        self._signals.finished.connect(self._on_finished)
+
+    def generate(self, chat_name: str, prompt: str, model: Optional[str] = None,
+                 context: Optional[List[int]] = None, system: Optional[str] = None) -> bool:
+        """Start generating a response for chat_name; False if one is already running
+
+        context and system are passed through to Ollama; see ContextManager
+        for how they are chosen.
+        """
+        if self.is_generating(chat_name):
+            return False
+        model = model or self.api_manager.model
+        task_id = next(self._ids)
+        self._chat_for_task[task_id] = chat_name
+        self._model_for_task[task_id] = model
+        self._partial[chat_name] = ""
+        ticket = self.api_manager.scheduler.ticket(model, INTERACTIVE)
+        self._ticket_for_task[task_id] = ticket
+        self.pool.start(GenerationTask(task_id, self.api_manager, prompt,
+                                       context, system, ticket, self._signals))
+        self.state_changed.emit(chat_name, True)
+        return True
+
+    def cancel(self, chat_name: str) -> bool:
+        """Stop chat_name's generation, keeping the text streamed so far
+
+        The chat is finished right away (response_ready gets the partial text
+        and {"cancelled": True}); the request itself is withdrawn from the
+        scheduler or its stream is closed.
+        """
+        task_id = next((task for task, name in self._chat_for_task.items()
+                        if name == chat_name), None)
+        if task_id is None:
+            return False
+        self._ticket_for_task[task_id].cancel()
+        self._on_finished(task_id, self._partial.get(chat_name, ""), {"cancelled": True})
+        return True
+
+    def is_generating(self, chat_name: str) -> bool:
+        return chat_name in self._partial
+
+    def partial_response(self, chat_name: str) -> Optional[str]:
+        """Text streamed so far for chat_name, or None if nothing is in flight"""
+        return self._partial.get(chat_name)
+
+    def rename_chat(self, old_name: str, new_name: str):
+        """Keep in-flight work attached to a chat that was renamed"""
+        for task_id, chat_name in self._chat_for_task.items():
+            if chat_name == old_name:
+                self._chat_for_task[task_id] = new_name
+        if old_name in self._partial:
+            self._partial[new_name] = self._partial.pop(old_name)
+
+    def discard_chat(self, chat_name: str):
+        """Drop in-flight work for a deleted chat; its response is ignored"""
+        for task_id, name in list(self._chat_for_task.items()):
+            if name == chat_name:
+                del self._chat_for_task[task_id]
+                self._model_for_task.pop(task_id, None)
+                self._ticket_for_task.pop(task_id).cancel()
+        self._partial.pop(chat_name, None)
+
+    def shutdown(self, timeout_ms: int = 1000):
+        """Stop running tasks and wait briefly for them before the application exits"""
+        self.pool.clear()
+        for ticket in list(self._ticket_for_task.values()):
+            ticket.cancel()
+        self.pool.waitForDone(timeout_ms)
+
+    def _on_token(self, task_id: int, text: str):
+        chat_name = self._chat_for_task.get(task_id)
+        if chat_name is None:
+            return
+        self._partial[chat_name] += text
+        self.token_received.emit(chat_name, text)
+
+    def _on_finished(self, task_id: int, response: str, final: dict):
+        chat_name = self._chat_for_task.pop(task_id, None)
+        model = self._model_for_task.pop(task_id, None)
+        self._ticket_for_task.pop(task_id, None)
+        if chat_name is None:
+            return
+        self._partial.pop(chat_name, None)
+        context = final.pop("context", None)
+        self.response_ready.emit(chat_name, response, final)
+        if context:
+            self.context_ready.emit(chat_name, model, context)
+        self.state_changed.emit(chat_name, False)
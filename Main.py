@@ -1,56 +1,171 @@
 import sys
-import json
-from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QListWidget, QTextEdit, QLineEdit, QPushButton, QMenu, QAction, QInputDialog, QFileDialog, QSplitter, QGroupBox
-from PyQt5.QtCore import Qt, QSize
-from PyQt5.QtGui import QPalette, QColor
+import time
+from StartupProfiler import StartupProfiler
+
+# Started before the remaining imports so they are timed too
+profiler = StartupProfiler(enabled=any(arg.startswith("--profile-startup") for arg in sys.argv))
+
+import html
+from PyQt5.QtWidgets import QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QListWidget, QTextEdit, QLineEdit, QPushButton, QMenu, QAction, QInputDialog, QFileDialog, QSplitter, QGroupBox, QLabel, QToolTip, QTextBrowser
+from PyQt5.QtCore import Qt, QSize, QTimer, QEvent, pyqtSignal
+from PyQt5.QtGui import QPalette, QColor, QTextCursor, QTextBlockFormat, QTextCharFormat
 from SettingsManager import SettingsManager
 from ChatManager import ChatManager
 from APIManager import APIManager
+from GenerationManager import GenerationManager
+from StorageManager import StorageManager, ChatCache, HIGHLIGHT_START, HIGHLIGHT_END
+from ContextManager import ContextManager, message_tokens
+from MetricsLog import format_metrics
+from PullManager import PullManager, describe_download
+from ArchiveManager import ArchiveManager, ARCHIVE_FILTER
+from MessageRenderer import MessageRenderer, split_blocks, with_label
+profiler.mark("imports")
+
+# Streamed tokens are painted at most this often (roughly one frame at 60 Hz)
+STREAM_REPAINT_INTERVAL_MS = 16
+# Search runs once typing pauses for this long
+SEARCH_DELAY_MS = 150
+
+
+def last_chat_number(names):
+    """Highest N among chats named "Chat N"; others, such as "Chat 2 (2)", are ignored"""
+    return max((int(name.split()[-1]) for name in names
+                if name.startswith("Chat ") and name.split()[-1].isdigit()), default=0)
 
 class MainWindow(QMainWindow):
-    def __init__(self):
+    startup_finished = pyqtSignal()  # Deferred startup work is done
+    model_load_changed = pyqtSignal(str, dict)  # Emitted from model loader threads
+
+    def __init__(self, profiler=None):
         super().__init__()
+        self.profiler = profiler or StartupProfiler()
         self.setWindowTitle("Ghost Writer")
         self.setGeometry(100, 100, 800, 600)
         self.chat_counter = 0
-        self.chats = {}
         self.current_chat = None
+        self.startup_pending = True
         
-        # Create API Manager first
+        # Create API Manager first; models are discovered after the window is shown
         self.api_manager = APIManager()
+        self.model_load_changed.connect(self.on_model_load_changed)
+        self.api_manager.loader.subscribe(self.model_load_changed.emit)
+
+        # Background generation, one in-flight response per chat
+        self.generation_manager = GenerationManager(self.api_manager, parent=self)
+        self.generation_manager.token_received.connect(self.on_token_received)
+        self.generation_manager.response_ready.connect(self.on_response_ready)
+        self.generation_manager.context_ready.connect(self.on_context_ready)
+        self.generation_manager.state_changed.connect(self.on_generation_state_changed)
+
+        # Coalesces streamed tokens into one repaint per frame
+        self.repaint_timer = QTimer(self)
+        self.repaint_timer.setSingleShot(True)
+        self.repaint_timer.setInterval(STREAM_REPAINT_INTERVAL_MS)
+        self.repaint_timer.timeout.connect(self.refresh_partial_response)
+
+        # Model downloads through /api/pull, shown in the status bar and settings
+        self.pull_manager = PullManager(self.api_manager, parent=self)
+        self.pull_manager.downloads_changed.connect(self.update_download_label)
+        self.pull_manager.progress_changed.connect(self.update_download_label)
+        self.pull_manager.pull_finished.connect(self.on_pull_finished)
+        self.profiler.mark("api and generation managers")
         
-        # Then create Settings Manager
+        # Then create Settings Manager (its dialog is built when first opened)
         self.settings_manager = SettingsManager(self)
         self.settings_manager.settings_changed.connect(self.apply_settings)
+        self.profiler.mark("settings")
         
         # Create Chat Manager
         self.chat_manager = ChatManager()
+
+        # Chat history database (migrates a legacy chats.json on first run).
+        # Only the chat index is read here; message bodies load on demand.
+        self.storage = StorageManager()
+        self.chats = ChatCache(self.storage)
+
+        # Chat import and export, streamed chat by chat in the background
+        self.archive_manager = ArchiveManager(self.storage, parent=self)
+        self.archive_manager.progress_changed.connect(self.update_archive_label)
+        self.archive_manager.chat_imported.connect(self.on_chat_imported)
+        self.archive_manager.archive_finished.connect(self.on_archive_finished)
+
+        # Keeps what is sent with each message within the token budget
+        self.context_manager = ContextManager(self.api_manager, self.chats, parent=self)
+        self.profiler.mark("storage")
         
         # Create widgets before layout
         self.create_widgets()
         
         # Initialize UI and apply settings
         self.init_ui()
+        self.profiler.mark("widgets")
         self.apply_settings(self.settings_manager.settings)
+        self.profiler.mark("apply settings")
+        # The chat list and model discovery wait for finish_startup()
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.startup_pending:
+            self.startup_pending = False
+            # Runs once the event loop has painted the window
+            QTimer.singleShot(0, self.finish_startup)
+
+    def finish_startup(self):
+        """Startup work that does not need to happen before the window is visible"""
+        self.profiler.mark("show window")
         self.load_chats()
+        self.profiler.mark("load chats")
+        self.api_manager.refresh_models()
+        self.warm_up_model()
+        self.profiler.mark("start model refresh and preload")
+        self.startup_finished.emit()
 
     def create_widgets(self):
         """Create all widgets before layout"""
         # Chat display
         self.chat_display = QTextEdit()
         self.chat_display.setReadOnly(True)
+        self.chat_display.setUndoRedoEnabled(False)  # Nothing to undo, don't keep history
+        self.partial_start = None  # Document position of the streaming reply, if shown
+        self.partial_tail = None  # Position of its open last block, redrawn per token
+        self.partial_blocks = 0  # Closed blocks of it already shown
+        self.renderer = MessageRenderer()
+        # Hovering a reply shows its generation metrics
+        self.chat_display.viewport().installEventFilter(self)
         
         # Chat list
         self.chat_list = QListWidget()
         self.chat_list.itemClicked.connect(self.load_chat)
+
+        # Search box; while it has text the matches replace the chat list
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("Search chats...")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.textChanged.connect(self.schedule_search)
+        self.search_results = QTextBrowser()
+        self.search_results.setOpenLinks(False)
+        self.search_results.anchorClicked.connect(self.open_search_result)
+        self.search_results.hide()
+        self.search_hits = []
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.run_search)
         
         # Input box (removed fixed height constraint)
         self.input_box = QTextEdit()
+        self.input_box.textChanged.connect(self.warm_up_model)  # Load the model while the user types
         
         # Send button
         self.send_button = QPushButton("Send")
         self.send_button.clicked.connect(self.send_message)
 
+        # Stop button, enabled while the current chat's response is generating
+        self.stop_button = QPushButton("Stop")
+        self.stop_button.setShortcut("Esc")
+        self.stop_button.setEnabled(False)
+        self.stop_button.clicked.connect(self.stop_generation)
+
     def init_ui(self):
         """Initialize the UI layout"""
         # Create menu first
@@ -74,6 +189,11 @@ class MainWindow(QMainWindow):
         export_action = QAction('Export All Chats', self)
         export_action.triggered.connect(self.export_chats)
         file_menu.addAction(export_action)
+
+        self.cancel_archive_action = QAction('Cancel Import/Export', self)
+        self.cancel_archive_action.setEnabled(False)
+        self.cancel_archive_action.triggered.connect(self.archive_manager.cancel)
+        file_menu.addAction(self.cancel_archive_action)
         
         # Create central widget and layout
         central_widget = QWidget()
@@ -85,9 +205,11 @@ class MainWindow(QMainWindow):
         left_widget.setMinimumWidth(200)
         left_layout = QVBoxLayout()
         
-        # Add chat list
+        # Add search box and chat list
+        left_layout.addWidget(self.search_input)
         self.chat_list.setMinimumWidth(180)
         left_layout.addWidget(self.chat_list, stretch=1)
+        left_layout.addWidget(self.search_results, stretch=1)
         
         # Add all buttons below chat list
         button_layout = QVBoxLayout()
@@ -134,6 +256,7 @@ class MainWindow(QMainWindow):
         self.input_box.setMaximumHeight(800)  # Significantly increased maximum height
         input_layout.addWidget(self.input_box, stretch=1)  # Add stretch to input box
         input_layout.addWidget(self.send_button)
+        input_layout.addWidget(self.stop_button)
         
         # Add input container to splitter
         right_splitter.addWidget(input_container)
@@ -166,24 +289,56 @@ class MainWindow(QMainWindow):
         self.chat_list.setContextMenuPolicy(Qt.CustomContextMenu)
         self.chat_list.customContextMenuRequested.connect(self.show_chat_context_menu)
 
+        # Status bar with the last reply's metrics, import/export progress,
+        # model downloads, the model's load state and response cache counters
+        self.metrics_label = QLabel()
+        self.statusBar().addWidget(self.metrics_label)
+        self.archive_label = QLabel()
+        self.statusBar().addPermanentWidget(self.archive_label)
+        self.download_label = QLabel()
+        self.statusBar().addPermanentWidget(self.download_label)
+        self.model_label = QLabel()
+        self.statusBar().addPermanentWidget(self.model_label)
+        self.cache_label = QLabel()
+        self.statusBar().addPermanentWidget(self.cache_label)
+
     def create_new_chat(self):
         self.chat_counter += 1
+        while f"Chat {self.chat_counter}" in self.chats:
+            self.chat_counter += 1
         new_chat_name = f"Chat {self.chat_counter}"
-        self.chats[new_chat_name] = []
-        self.chat_list.addItem(new_chat_name)
+        self.chats.create(new_chat_name)
+        self.add_chat_list_item(new_chat_name)
         self.chat_list.setCurrentRow(self.chat_list.count() - 1)
         self.load_chat(self.chat_list.currentItem())
-        self.save_chats()
+
+    def add_chat_list_item(self, chat_name):
+        self.chat_list.addItem(chat_name)
+        self.update_chat_list_tooltip(self.chat_list.item(self.chat_list.count() - 1))
+
+    def update_chat_list_tooltip(self, item):
+        """Describe a chat from the index without loading its messages"""
+        entry = self.chats.index.get(item.text())
+        if entry:
+            modified = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["updated_at"]))
+            item.setToolTip(f"{entry['message_count']} messages, last modified {modified}")
 
     def load_chat(self, item):
+        if self.current_chat:
+            self.chats.unpin(self.current_chat)
         self.current_chat = item.text()
-        self.chat_display.clear()
-        for message in self.chats[self.current_chat]:
-            self.chat_display.append(message)
+        self.chats.pin(self.current_chat)
+        self.display_chat()
+        self.update_send_button()
+        last_metrics = next((m["metrics"] for m in reversed(self.chats[self.current_chat])
+                             if m.get("metrics")), None)
+        self.metrics_label.setText(format_metrics(last_metrics))
 
     def send_message(self):
         if not self.current_chat:
             return
+        if self.generation_manager.is_generating(self.current_chat):
+            return
             
         message = self.input_box.toPlainText().strip()
         if message:
@@ -196,14 +351,113 @@ class MainWindow(QMainWindow):
             # Clear input
             self.input_box.clear()
             
-            # Get AI response
-            response = self.api_manager.generate_response(message)
-            
-            # Add AI response
-            self.update_chat_content({
-                "role": "assistant",
-                "content": response
-            })
+            # Get AI response in the background; it lands in on_response_ready.
+            # The context manager reuses the cached context or trims history to budget.
+            model = self.api_manager.model
+            request = self.context_manager.prepare(self.current_chat, model)
+            self.generation_manager.generate(self.current_chat, model=model, **request)
+
+    def stop_generation(self):
+        """Stop the current chat's response, keeping what has arrived so far"""
+        if self.current_chat:
+            self.generation_manager.cancel(self.current_chat)
+
+    def on_token_received(self, chat_name, text):
+        """Checkpoint the streaming reply and schedule a repaint if it is on screen"""
+        if self.chat_manager.auto_save:
+            self.chat_manager.checkpoint_partial(
+                chat_name, self.generation_manager.partial_response(chat_name))
+        if chat_name == self.current_chat and not self.repaint_timer.isActive():
+            self.repaint_timer.start()
+
+    def on_response_ready(self, chat_name, response, stats):
+        """Store a finished response in the chat it was generated for"""
+        if stats.get("cancelled") and not response:
+            # Stopped before any text arrived; drop the empty reply
+            if chat_name == self.current_chat:
+                self.display_chat()
+            return
+        message = {
+            "role": "assistant",
+            "content": response
+        }
+        if stats.get("eval_count"):
+            message["tokens"] = stats["eval_count"]
+        if stats.get("metrics"):
+            message["metrics"] = stats["metrics"]
+            if chat_name == self.current_chat:
+                self.metrics_label.setText(format_metrics(stats["metrics"]))
+        self.update_chat_content(message, chat_name)
+        self.update_cache_label()
+
+    def on_context_ready(self, chat_name, model, context):
+        """Cache the context returned with a response for the next turn"""
+        if chat_name in self.chats:
+            self.chats.save_context(chat_name, model, context)
+
+    def on_generation_state_changed(self, chat_name, generating):
+        if chat_name == self.current_chat:
+            self.update_send_button()
+
+    def warm_up_model(self):
+        """Preload the current model; does nothing while it is loaded or loading"""
+        if self.settings_manager.settings.get("preload_model", True) and not self.startup_pending:
+            self.api_manager.preload_model()
+
+    def on_model_load_changed(self, model, state):
+        if model == self.api_manager.model:
+            self.update_model_label()
+
+    def update_model_label(self):
+        """Show whether the current model is loaded and how long loading took"""
+        model = self.api_manager.model
+        state = self.api_manager.loader.state(model)
+        if state is None:
+            text = f"{model}: not loaded"
+        elif state["state"] == "loading":
+            text = f"{model}: loading..."
+        elif state["state"] == "failed":
+            text = f"{model}: failed to load"
+        elif state["load_seconds"] is not None:
+            text = f"{model}: loaded in {state['load_seconds']:.1f} s"
+        else:
+            text = f"{model}: loaded"
+        self.model_label.setText(text)
+        self.model_label.setToolTip(state["error"] if state and state["error"] else "")
+
+    def update_download_label(self, *args):
+        """Show the first running download and how many more are queued"""
+        downloads = self.pull_manager.downloads()
+        if not downloads:
+            self.download_label.setText("")
+            return
+        model, state = next(iter(downloads.items()))
+        text = describe_download(model, state)
+        if len(downloads) > 1:
+            text += f" (+{len(downloads) - 1} queued)"
+        self.download_label.setText(text)
+
+    def on_pull_finished(self, model, success, message):
+        if not success:
+            message = f"Download of {model} failed: {message}"
+        self.statusBar().showMessage(message, 10000)
+
+    def update_cache_label(self):
+        """Show response cache hit/miss counters while the cache is enabled"""
+        cache = self.api_manager.response_cache
+        if cache is None:
+            self.cache_label.hide()
+            return
+        stats = cache.stats()
+        self.cache_label.setText(f"Cache: {stats['hits']} hits, {stats['misses']} misses, "
+                                 f"{stats['shared']} shared")
+        self.cache_label.show()
+
+    def update_send_button(self):
+        """Only allow sending when the current chat is not waiting on a response"""
+        busy = bool(self.current_chat) and self.generation_manager.is_generating(self.current_chat)
+        self.send_button.setEnabled(not busy)
+        self.stop_button.setEnabled(busy)
 
     def show_chat_context_menu(self, position):
         """Show context menu for chat list items"""
@@ -230,73 +484,98 @@ class MainWindow(QMainWindow):
             new_name, ok = QInputDialog.getText(self, "Rename Chat", 
                                               "Enter new name:", 
                                               text=old_name)
-            if ok and new_name and new_name != old_name:
-                self.chats[new_name] = self.chats.pop(old_name)
+            if ok and new_name and new_name != old_name and new_name not in self.chats:
+                self.chats.rename(old_name, new_name)
+                self.generation_manager.rename_chat(old_name, new_name)
                 current_item.setText(new_name)
                 self.current_chat = new_name
-                self.save_chats()
+                self.refresh_search()
 
     def delete_chat(self):
         current_row = self.chat_list.currentRow()
         if current_row != -1:
             chat_name = self.chat_list.takeItem(current_row).text()
-            del self.chats[chat_name]
+            self.chats.delete(chat_name)
+            self.generation_manager.discard_chat(chat_name)
+            self.refresh_search()
             if self.chat_list.count() == 0:
                 self.chat_display.clear()
+                self.metrics_label.clear()
+                self.partial_start = None
                 self.current_chat = None
+                self.update_send_button()
             else:
                 self.load_chat(self.chat_list.item(0))
-            self.save_chats()
-
-    def save_chats(self):
-        with open('chats.json', 'w') as f:
-            json.dump(self.chats, f)
 
     def load_chats(self):
         try:
-            with open('chats.json', 'r') as f:
-                self.chats = json.load(f)
             for chat_name in self.chats:
-                self.chat_list.addItem(chat_name)
-            if self.chats:
-                chat_numbers = [int(name.split()[-1]) for name in self.chats if name.startswith("Chat ")]
-                if chat_numbers:
-                    self.chat_counter = max(chat_numbers)
-                else:
-                    self.chat_counter = 0
+                self.add_chat_list_item(chat_name)
+            self.chat_counter = last_chat_number(self.chats)
             if self.chat_list.count() > 0:
                 self.chat_list.setCurrentRow(0)
                 self.load_chat(self.chat_list.item(0))
-        except FileNotFoundError:
-            pass
+        except Exception as e:
+            print(f"Error loading chats: {e}")
 
     def import_chats(self):
-        file_name, _ = QFileDialog.getOpenFileName(self, "Import Chats", "", "JSON Files (*.json)")
+        file_name, _ = QFileDialog.getOpenFileName(self, "Import Chats", "", ARCHIVE_FILTER)
         if file_name:
-            try:
-                with open(file_name, 'r') as f:
-                    imported_chats = json.load(f)
-                self.chats.update(imported_chats)
-                self.refresh_chat_list()
-                self.save_chats()
-            except Exception as e:
-                print(f"Error importing chats: {e}")
+            self.start_archive(self.archive_manager.import_chats(file_name))
 
     def export_chats(self):
-        file_name, _ = QFileDialog.getSaveFileName(self, "Export Chats", "", "JSON Files (*.json)")
+        """Export every chat; a .gz or .zst file name compresses the archive"""
+        file_name, _ = QFileDialog.getSaveFileName(self, "Export Chats", "", ARCHIVE_FILTER)
         if file_name:
-            try:
-                with open(file_name, 'w') as f:
-                    json.dump(self.chats, f)
-            except Exception as e:
-                print(f"Error exporting chats: {e}")
+            self.start_archive(self.archive_manager.export_chats(file_name))
+
+    def start_archive(self, started):
+        if not started:
+            self.statusBar().showMessage("An import or export is already running", 5000)
+            return
+        self.cancel_archive_action.setEnabled(True)
+        self.update_archive_label(self.archive_manager.kind, 0, 0)
+
+    def update_archive_label(self, kind, done, total):
+        verb = "Importing" if kind == "import" else "Exporting"
+        if not total:
+            self.archive_label.setText(f"{verb} chats...")
+        elif kind == "import":
+            self.archive_label.setText(f"{verb} chats: {done * 100 // total}%")
+        else:
+            self.archive_label.setText(f"{verb} chats: {done}/{total}")
+
+    def on_chat_imported(self, name):
+        """Pick up a chat as soon as the import has written it
+
+        The import merges with whatever is stored when it gets to a chat,
+        so sending and creating chats stay possible meanwhile; this keeps
+        the window's copy of the chat and its name current.
+        """
+        self.chats.refresh(name)
+        items = self.chat_list.findItems(name, Qt.MatchExactly)
+        if items:
+            self.update_chat_list_tooltip(items[0])
+        else:
+            self.add_chat_list_item(name)
+        if name == self.current_chat:
+            self.display_chat()
+
+    def on_archive_finished(self, kind, success, message, names):
+        self.cancel_archive_action.setEnabled(False)
+        self.archive_label.setText("")
+        if names:
+            # The import wrote through its own connection
+            self.chats.reload(names)
+            self.refresh_chat_list()
+        self.statusBar().showMessage(message, 10000)
 
     def refresh_chat_list(self):
+        self.refresh_search()
         self.chat_list.clear()
         for chat_name in self.chats:
-            self.chat_list.addItem(chat_name)
-        if self.chats:
-            self.chat_counter = max(int(name.split()[-1]) for name in self.chats if name.startswith("Chat "))
+            self.add_chat_list_item(chat_name)
+        self.chat_counter = max(self.chat_counter, last_chat_number(self.chats))
         if self.chat_list.count() > 0:
             self.chat_list.setCurrentRow(0)
             self.load_chat(self.chat_list.item(0))
@@ -305,13 +584,9 @@ class MainWindow(QMainWindow):
         if not self.current_chat:
             return
 
-        file_name, _ = QFileDialog.getSaveFileName(self, "Export Chat", "", "JSON Files (*.json)")
+        file_name, _ = QFileDialog.getSaveFileName(self, "Export Chat", "", ARCHIVE_FILTER)
         if file_name:
-            try:
-                with open(file_name, 'w') as f:
-                    json.dump({self.current_chat: self.chats[self.current_chat]}, f)
-            except Exception as e:
-                print(f"Error exporting chat: {e}")
+            self.start_archive(self.archive_manager.export_chats(file_name, [self.current_chat]))
 
     def show_settings(self):
         """Show the settings dialog"""
@@ -326,6 +601,9 @@ class MainWindow(QMainWindow):
             font.setPointSize(settings["font_size"])
             self.chat_display.setFont(font)
             self.input_box.setFont(font)
+            self.renderer.configure("dark" if settings["dark_mode"] else "light",
+                                    settings["font_size"])
+            self.display_chat()
 
         if settings["dark_mode"]:
             self.set_dark_theme()
@@ -336,12 +614,42 @@ class MainWindow(QMainWindow):
 
         # Update API settings
         if hasattr(self, 'api_manager'):
+            self.api_manager.configure_endpoints(settings.get("endpoints", []),
+                                                 settings.get("health_check_interval", 30))
             self.api_manager.model = settings.get("model", "llama2-uncensored")
+            self.api_manager.configure_keep_alive(settings.get("keep_alive", ""),
+                                                  settings.get("keep_alive_overrides", {}))
+            self.api_manager.configure_options(settings.get("model_options", {}))
+            self.api_manager.configure_transport(settings.get("pool_size", 10),
+                                                 settings.get("connect_timeout", 5.0),
+                                                 settings.get("read_timeout", 30.0))
+            self.api_manager.enable_cache(settings.get("response_cache", False),
+                                          settings.get("cache_memory_entries", 256),
+                                          settings.get("cache_disk_mb", 100))
+            self.api_manager.enable_metrics_log(settings.get("metrics_log", True),
+                                                max_mb=settings.get("metrics_log_mb", 5))
+            self.api_manager.scheduler.configure(settings.get("max_active_requests", 4),
+                                                 settings.get("max_active_models", 1))
+            if hasattr(self, 'cache_label'):
+                self.update_cache_label()
+                self.update_model_label()
+            # A newly chosen model starts loading right away
+            self.warm_up_model()
+
+        # Token budget, pinned system prompt and summary model
+        if hasattr(self, 'context_manager'):
+            self.context_manager.configure(settings.get("context_budget", 2048),
+                                           settings.get("system_prompt", ""),
+                                           settings.get("summary_model", ""))
+
+        # Bound how many chat bodies stay in memory
+        if hasattr(self, 'chats'):
+            self.chats.set_max_loaded(settings.get("max_loaded_chats", 20))
 
         # Update ChatManager settings
         if hasattr(self, 'chat_manager'):
-            self.chat_manager.auto_save = settings.get("auto_save", False)
-            self.chat_manager.save_directory = settings.get("save_directory", "")
+            self.chat_manager.set_auto_save(settings.get("auto_save", False),
+                                            settings.get("save_directory", ""))
 
     def set_dark_theme(self):
         dark_palette = QPalette()
@@ -481,46 +789,239 @@ class MainWindow(QMainWindow):
                 }
             """)
 
-    def update_chat_content(self, message):
+    def update_chat_content(self, message, chat_name=None):
         """Update chat content and trigger auto-save"""
-        if self.current_chat:
-            self.chats[self.current_chat].append(message)
-            self.display_chat()
+        chat_name = chat_name or self.current_chat
+        if chat_name in self.chats:
+            message_tokens(message)  # Cache the token count alongside the message
+            self.chats.append_message(chat_name, message)
+            for item in self.chat_list.findItems(chat_name, Qt.MatchExactly):
+                self.update_chat_list_tooltip(item)
+            self.refresh_search()
+            if chat_name == self.current_chat:
+                self.clear_partial_response()
+                self.append_message(message, len(self.chats[chat_name]) - 1)
+                self.scroll_to_bottom()
             
-            # Auto-save the current chat
-            if hasattr(self, 'chat_manager'):
-                chat_content = "\n".join([f"{msg['role']}: {msg['content']}" 
-                                        for msg in self.chats[self.current_chat]])
-                self.chat_manager.save_chat(self.current_chat, chat_content)
+            # Auto-save the chat; an existing transcript only gets the new message
+            if hasattr(self, 'chat_manager') and self.chat_manager.auto_save:
+                if self.chat_manager.has_transcript(chat_name):
+                    self.chat_manager.append_message(chat_name, message)
+                else:
+                    chat_content = "\n".join([f"{msg['role']}: {msg['content']}" 
+                                            for msg in self.chats[chat_name]])
+                    self.chat_manager.save_chat(chat_name, chat_content)
+                if message["role"] == "assistant":
+                    self.chat_manager.clear_partial(chat_name)
 
     def display_chat(self):
-        """Display the current chat in the chat display"""
+        """Re-render the whole current chat
+
+        Only needed on chat switch or a theme/font change; new messages and
+        streamed tokens are appended or patched in place instead.
+        """
         if self.current_chat and hasattr(self, 'chat_display'):
             # Clear the display
             self.chat_display.clear()
+            self.partial_start = None
             
             # Display each message
-            for message in self.chats[self.current_chat]:
-                role = message.get('role', 'unknown')
-                content = message.get('content', '')
-                
-                # Format based on role
-                if role == "user":
-                    self.chat_display.append(f"You: {content}")
-                elif role == "assistant":
-                    self.chat_display.append(f"Assistant: {content}")
-                else:
-                    self.chat_display.append(f"{role}: {content}")
-                
-                # Add a newline between messages
-                self.chat_display.append("")
-            
-            # Scroll to the bottom
-            scrollbar = self.chat_display.verticalScrollBar()
-            scrollbar.setValue(scrollbar.maximum())
+            for index, message in enumerate(self.chats[self.current_chat]):
+                self.append_message(message, index)
+
+            # Show the reply that is still streaming, if any
+            self.refresh_partial_response()
+            self.scroll_to_bottom()
+
+    def append_message(self, message, index=None):
+        """Append one message to the end of the chat display
+
+        index is the message's position in the chat; it is stored on the
+        message's text blocks so hovering them can find the message.
+        """
+        role = message.get('role', 'unknown')
+        content = message.get('content', '')
+        document = self.chat_display.document()
+        first_block = 0 if document.isEmpty() else document.blockCount()
+        
+        # Format based on role; the renderer caches the HTML of each message,
+        # plain text is inserted as such, which is much faster
+        label = {"user": "You", "assistant": "Assistant"}.get(role, role)
+        fragment = self.renderer.render(role, content)
+        if fragment:
+            self.insert_html(with_label(fragment, label))
+        else:
+            self.chat_display.append(f"{label}: {content}")
+        
+        if index is not None:
+            block = document.findBlockByNumber(first_block)
+            while block.isValid():
+                block.setUserState(index)
+                block = block.next()
+
+        # Add a newline between messages
+        self.chat_display.append("")
+
+    def refresh_partial_response(self):
+        """Patch the streaming reply of the current chat in place"""
+        if not self.current_chat:
+            return
+        partial_response = self.generation_manager.partial_response(self.current_chat)
+        if partial_response is None:
+            return
+        closed, tail = split_blocks(partial_response)
+        cursor = QTextCursor(self.chat_display.document())
+        if self.partial_start is None or len(closed) < self.partial_blocks:
+            self.clear_partial_response()
+            cursor.movePosition(QTextCursor.End)
+            self.partial_start = self.partial_tail = cursor.position()
+            self.partial_blocks = 0
+        # Closed blocks never change, so only the open last block is redrawn
+        cursor.setPosition(self.partial_tail)
+        cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+        for block in closed[self.partial_blocks:]:
+            fragment = self.renderer.render_block(block)
+            self.insert_html(with_label(fragment, "Assistant") if self.partial_blocks == 0
+                             else fragment)
+            self.partial_blocks += 1
+        cursor.movePosition(QTextCursor.End)
+        self.partial_tail = cursor.position()
+        if tail.strip() or self.partial_blocks == 0:
+            fragment = self.renderer.render_block(tail, cache=False) if tail.strip() else ""
+            self.insert_html(with_label(fragment, "Assistant") if self.partial_blocks == 0
+                             else fragment)
+        self.scroll_to_bottom()
+
+    def insert_html(self, fragment):
+        """Add an HTML fragment to the chat display in new blocks at the end"""
+        document = self.chat_display.document()
+        cursor = QTextCursor(document)
+        cursor.movePosition(QTextCursor.End)
+        if not document.isEmpty():
+            cursor.insertBlock(QTextBlockFormat(), QTextCharFormat())
+        cursor.insertHtml(fragment)
+
+    def clear_partial_response(self):
+        """Remove the streaming reply from the display, leaving stored messages"""
+        if self.partial_start is None:
+            return
+        cursor = QTextCursor(self.chat_display.document())
+        cursor.setPosition(self.partial_start)
+        cursor.movePosition(QTextCursor.End, QTextCursor.KeepAnchor)
+        cursor.removeSelectedText()
+        self.partial_start = self.partial_tail = None
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.ToolTip and watched is self.chat_display.viewport():
+            self.show_message_tooltip(event)
+            return True
+        return super().eventFilter(watched, event)
+
+    def show_message_tooltip(self, event):
+        """Show the generation metrics of the reply under the mouse"""
+        index = self.chat_display.cursorForPosition(event.pos()).block().userState()
+        text = ""
+        if self.current_chat and index >= 0:
+            messages = self.chats[self.current_chat]
+            if index < len(messages):
+                text = format_metrics(messages[index].get("metrics"), multiline=True)
+        if text:
+            QToolTip.showText(event.globalPos(), text, self.chat_display)
+        else:
+            QToolTip.hideText()
+
+    def schedule_search(self, text):
+        searching = bool(text.strip())
+        self.chat_list.setVisible(not searching)
+        self.search_results.setVisible(searching)
+        if searching:
+            self.search_timer.start()
+        else:
+            self.search_timer.stop()
+
+    def refresh_search(self):
+        """Re-run an active search after chats change"""
+        if self.search_input.text().strip():
+            self.search_timer.start()
+
+    def run_search(self):
+        """Show ranked matches for the search box, with matched words in bold"""
+        query = self.search_input.text()
+        try:
+            self.search_hits = self.storage.search(query)
+        except Exception as e:
+            print(f"Error searching chats: {e}")
+            self.search_hits = []
+        if not self.search_hits:
+            self.search_results.setHtml("<p>No matches</p>")
+            return
+        entries = []
+        for number, hit in enumerate(self.search_hits):
+            snippet = (html.escape(hit["snippet"])
+                       .replace(HIGHLIGHT_START, "<b>").replace(HIGHLIGHT_END, "</b>"))
+            role = "You" if hit["role"] == "user" else "Assistant"
+            entries.append(f'<p><a href="{number}">{html.escape(hit["chat"])}</a> '
+                           f'<small>({role})</small><br>{snippet}</p>')
+        self.search_results.setHtml("".join(entries))
+
+    def open_search_result(self, url):
+        """Open the chat of a search result and select the matching message"""
+        try:
+            hit = self.search_hits[int(url.toString())]
+        except (ValueError, IndexError):
+            return
+        items = self.chat_list.findItems(hit["chat"], Qt.MatchExactly)
+        if not items:
+            return
+        if hit["chat"] != self.current_chat:
+            self.chat_list.setCurrentItem(items[0])
+            self.load_chat(items[0])
+        self.select_message(hit["index"])
+
+    def select_message(self, index):
+        """Select the displayed text of message index and scroll it into view"""
+        document = self.chat_display.document()
+        block = document.begin()
+        while block.isValid() and block.userState() != index:
+            block = block.next()
+        if not block.isValid():
+            return
+        cursor = QTextCursor(block)
+        while block.next().isValid() and block.next().userState() == index:
+            block = block.next()
+        cursor.setPosition(block.position() + block.length() - 1, QTextCursor.KeepAnchor)
+        self.chat_display.setTextCursor(cursor)
+        self.chat_display.ensureCursorVisible()
+
+    def scroll_to_bottom(self):
+        scrollbar = self.chat_display.verticalScrollBar()
+        scrollbar.setValue(scrollbar.maximum())
+
+    def closeEvent(self, event):
+        self.generation_manager.shutdown()
+        self.pull_manager.shutdown()
+        self.archive_manager.shutdown()
+        self.context_manager.shutdown()
+        self.api_manager.close()
+        self.chat_manager.close()
+        self.storage.close()
+        super().closeEvent(event)
+
+def report_startup(main_window):
+    """Print the --profile-startup report and quit"""
+    # Model discovery runs in the background; time it separately from the window
+    main_window.api_manager.registry.refresh(block=True)
+    profiler.mark("model list (background)")
+    print(profiler.report(as_json="--profile-startup=json" in sys.argv))
+    main_window.close()
+    QApplication.instance().quit()
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
-    main_window = MainWindow()
+    profiler.mark("QApplication")
+    main_window = MainWindow(profiler)
+    if profiler.enabled:
+        main_window.startup_finished.connect(lambda: report_startup(main_window))
     main_window.show()
     sys.exit(app.exec_())
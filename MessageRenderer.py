@@ -0,0 +1,317 @@
+"""Markdown and code rendering for the chat display, with cached HTML
+
+Replies are rendered as a subset of Markdown: fenced code blocks with
+syntax highlighting, headings, lists, block quotes, rules, and inline
+code, bold, italic and links. Messages from the user, and replies with
+no Markdown in them, are shown as typed; they need no HTML at all, which
+the display inserts several times faster.
+
+A message is split into blocks at blank lines outside code fences, and
+each block is rendered on its own, so a streaming reply only renders its
+last, still open block again as tokens arrive. Rendered blocks and whole
+messages are kept in LRU caches keyed on a hash of their text plus the
+theme and font size, so switching chats or repainting reuses the HTML.
+"""
+import hashlib
+import html
+import re
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Rendered fragments kept per cache
+MAX_CACHED_MESSAGES = 2000
+MAX_CACHED_BLOCKS = 5000
+
+# Colors by theme: code text and background, then syntax classes
+THEMES: Dict[str, Dict[str, str]] = {
+    "light": {"text": "#1f2328", "background": "#f6f8fa", "quote": "#57606a",
+              "keyword": "#cf222e", "string": "#0a3069", "comment": "#6e7781",
+              "number": "#0550ae", "inline": "#eff1f3"},
+    "dark": {"text": "#d4d4d4", "background": "#1e1e1e", "quote": "#9da5b4",
+             "keyword": "#569cd6", "string": "#ce9178", "comment": "#6a9955",
+             "number": "#b5cea8", "inline": "#3a3a3a"},
+}
+
+KEYWORDS = {
+    "python": """and as assert async await break class continue def del elif else except
+        finally for from global if import in is lambda nonlocal not or pass raise return
+        try while with yield None True False""",
+    "javascript": """async await break case catch class const continue default delete do
+        else export extends finally for function if import in instanceof let new of return
+        super switch this throw try typeof var void while yield null true false undefined""",
+    "c": """auto break case char const continue default do double else enum extern float
+        for goto if inline int long register return short signed sizeof static struct
+        switch typedef union unsigned void volatile while bool true false NULL class
+        namespace template typename public private protected virtual new delete this
+        nullptr using try catch throw""",
+    "java": """abstract boolean break byte case catch char class const continue default do
+        double else enum extends final finally float for if implements import instanceof
+        int interface long new package private protected public return short static super
+        switch this throw throws try void while null true false var""",
+    "go": """break case chan const continue default defer else fallthrough for func go
+        goto if import interface map package range return select struct switch type var
+        nil true false""",
+    "rust": """as async await break const continue crate dyn else enum extern false fn for
+        if impl in let loop match mod move mut pub ref return self Self static struct super
+        trait true type unsafe use where while""",
+    "shell": """if then else elif fi case esac for while until do done in function return
+        local export echo cd exit""",
+    "sql": """select from where insert into values update set delete create table drop
+        alter index join left right inner outer on and or not null as order by group
+        having limit primary key""",
+}
+KEYWORDS = {language: set(words.split()) for language, words in KEYWORDS.items()}
+LANGUAGE_ALIASES = {"py": "python", "python3": "python", "js": "javascript",
+                    "ts": "javascript", "typescript": "javascript", "jsx": "javascript",
+                    "tsx": "javascript", "json": "javascript", "cpp": "c", "c++": "c",
+                    "h": "c", "hpp": "c", "cs": "c", "csharp": "c", "kotlin": "java",
+                    "golang": "go", "rs": "rust", "sh": "shell", "bash": "shell",
+                    "zsh": "shell", "console": "shell"}
+# Languages whose comments start with #; the others use // and /* */
+HASH_COMMENTS = {"python", "shell"}
+
+FENCE = re.compile(r"^\s*(```|~~~)")
+HEADING = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+BULLET = re.compile(r"^\s*[-*+]\s+(.*)$")
+NUMBERED = re.compile(r"^\s*\d+[.)]\s+(.*)$")
+RULE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+# Anything that might be Markdown; text without it is shown as plain text
+MARKUP = re.compile(r"[`*_\[]|^\s*(?:[#>]|[-+]\s|\d+[.)]\s|~~~|---)", re.MULTILINE)
+INLINE = re.compile(
+    r"(?P<code>`+)(?P<code_text>.+?)(?P=code)"
+    r"|\*\*(?P<bold>.+?)\*\*|__(?P<bold2>.+?)__"
+    r"|(?<![\w*])\*(?P<italic>[^*\s](?:[^*]*[^*\s])?)\*(?![\w*])"
+    r"|(?<![\w_])_(?P<italic2>[^_\s](?:[^_]*[^_\s])?)_(?![\w_])"
+    r"|\[(?P<link_text>[^\]]+)\]\((?P<url>[^)\s]+)\)")
+TOKEN = (
+    r"(?P<comment>{comment})"
+    r'|(?P<string>"""[\s\S]*?(?:"""|$)|\'\'\'[\s\S]*?(?:\'\'\'|$)'
+    r'|"(?:[^"\\\n]|\\.)*"?|\'(?:[^\'\\\n]|\\.)*\'?|`(?:[^`\\]|\\.)*`?)'
+    r"|(?P<number>\b(?:0[xX][0-9a-fA-F]+|\d+\.?\d*(?:[eE][-+]?\d+)?)\b)"
+    r"|(?P<word>[A-Za-z_][A-Za-z0-9_]*)")
+TOKEN_PATTERNS = {
+    "hash": re.compile(TOKEN.replace("{comment}", r"#[^\n]*")),
+    "slash": re.compile(TOKEN.replace("{comment}", r"//[^\n]*|/\*[\s\S]*?(?:\*/|$)")),
+}
+
+
+def split_blocks(text: str) -> Tuple[List[str], str]:
+    """Split text into closed blocks and the trailing block still being written
+
+    A block ends at a blank line outside a code fence, or at the line that
+    closes its fence. Earlier boundaries never move as text is appended, so
+    closed blocks can be rendered once while a reply streams in.
+    """
+    blocks, current, fence = [], [], None
+    lines = text.split("\n")
+    for number, line in enumerate(lines):
+        last = number == len(lines) - 1
+        match = FENCE.match(line)
+        if fence:
+            current.append(line)
+            if match and match.group(1) == fence and line.strip() == fence and not last:
+                blocks.append("\n".join(current))
+                current, fence = [], None
+        elif match:
+            if current:
+                blocks.append("\n".join(current))
+            current, fence = [line], match.group(1)
+        elif not line.strip() and not last:
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+        else:
+            current.append(line)
+    return blocks, "\n".join(current)
+
+
+def render_inline(text: str, colors: Dict[str, str]) -> str:
+    """Escape text and apply inline code, bold, italic and links"""
+    parts, pos = [], 0
+    for match in INLINE.finditer(text):
+        parts.append(html.escape(text[pos:match.start()]))
+        if match.group("code"):
+            parts.append(f'<code style="color:{colors["text"]}; background-color:{colors["inline"]}">'
+                         f'{html.escape(match.group("code_text").strip())}</code>')
+        elif match.group("bold") or match.group("bold2"):
+            parts.append(f"<b>{render_inline(match.group('bold') or match.group('bold2'), colors)}</b>")
+        elif match.group("italic") or match.group("italic2"):
+            parts.append(f"<i>{render_inline(match.group('italic') or match.group('italic2'), colors)}</i>")
+        else:
+            parts.append(f'<a href="{html.escape(match.group("url"))}">'
+                         f'{render_inline(match.group("link_text"), colors)}</a>')
+        pos = match.end()
+    parts.append(html.escape(text[pos:]))
+    return "".join(parts)
+
+
+def highlight_code(code: str, language: str, colors: Dict[str, str]) -> str:
+    """HTML for code with keywords, strings, comments and numbers colored"""
+    language = LANGUAGE_ALIASES.get(language.lower(), language.lower())
+    keywords = KEYWORDS.get(language)
+    if keywords is None:
+        # Unknown or unnamed language: color what most languages share
+        keywords = KEYWORDS["python"] | KEYWORDS["javascript"]
+    pattern = TOKEN_PATTERNS["hash" if language in HASH_COMMENTS or language not in KEYWORDS
+                             else "slash"]
+    parts, pos = [], 0
+    for match in pattern.finditer(code):
+        kind = match.lastgroup
+        if kind == "word":
+            word = match.group()
+            if word not in keywords and not (language == "sql" and word.lower() in keywords):
+                continue
+            kind = "keyword"
+        parts.append(html.escape(code[pos:match.start()]))
+        parts.append(f'<span style="color:{colors[kind]}">{html.escape(match.group())}</span>')
+        pos = match.end()
+    parts.append(html.escape(code[pos:]))
+    return "".join(parts)
+
+
+def render_block(block: str, theme: str = "light", font_size: int = 12) -> str:
+    """HTML for one block from split_blocks()"""
+    colors = THEMES.get(theme, THEMES["light"])
+    lines = block.split("\n")
+    fence = FENCE.match(lines[0])
+    if fence:
+        language = lines[0].strip()[3:].strip().split(" ")[0]
+        body = lines[1:]
+        if body and body[-1].strip() == fence.group(1):
+            body = body[:-1]
+        code = highlight_code("\n".join(body), language, colors)
+        # A colored block rather than a table cell: every table is a frame
+        # in the display's document, which makes appending to it slow
+        return (f'<pre style="font-family: monospace; font-size: {font_size}pt; '
+                f'color: {colors["text"]}; background-color: {colors["background"]}">'
+                f"{code}</pre>")
+
+    parts, items, list_tag = [], [], None
+
+    def close_list():
+        nonlocal items, list_tag
+        if items:
+            parts.append(f"<{list_tag}>{''.join(items)}</{list_tag}>")
+        items, list_tag = [], None
+
+    paragraph, quote = [], []
+    for line in lines + [""]:
+        heading = HEADING.match(line)
+        bullet = BULLET.match(line)
+        numbered = NUMBERED.match(line)
+        quoted = line.lstrip().startswith(">")
+        if (heading or bullet or numbered or quoted or RULE.match(line)
+                or not line.strip()) and paragraph:
+            parts.append(f"<p>{'<br/>'.join(paragraph)}</p>")
+            paragraph = []
+        if not quoted and quote:
+            parts.append(f'<blockquote style="color:{colors["quote"]}">'
+                         f"{'<br/>'.join(quote)}</blockquote>")
+            quote = []
+        if bullet or numbered:
+            tag = "ul" if bullet else "ol"
+            if list_tag != tag:
+                close_list()
+                list_tag = tag
+            items.append(f"<li>{render_inline((bullet or numbered).group(1), colors)}</li>")
+            continue
+        if items and line.startswith(("  ", "\t")) and line.strip():
+            # Continuation of the previous list item
+            items[-1] = items[-1][:-5] + "<br/>" + render_inline(line.strip(), colors) + "</li>"
+            continue
+        close_list()
+        if heading:
+            level = len(heading.group(1))
+            size = font_size * (1.6, 1.4, 1.2, 1.1, 1.0, 1.0)[level - 1]
+            parts.append(f'<p style="font-size:{size:.0f}pt"><b>'
+                         f"{render_inline(heading.group(2), colors)}</b></p>")
+        elif RULE.match(line):
+            parts.append("<hr/>")
+        elif quoted:
+            quote.append(render_inline(line.lstrip()[1:].strip(), colors))
+        elif line.strip():
+            paragraph.append(render_inline(line, colors))
+    return "".join(parts)
+
+
+def with_label(fragment: str, label: str) -> str:
+    """Put "label:" before a message's first paragraph, or above it"""
+    head = f"{html.escape(label)}: "
+    if fragment.startswith("<p"):
+        end = fragment.index(">") + 1
+        return fragment[:end] + head + fragment[end:]
+    return f"<p>{head}</p>" + fragment
+
+
+def _digest(text: str) -> bytes:
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class MessageRenderer:
+    """Renders messages to HTML fragments for the chat display, with caching
+
+    render() returns a whole message's HTML, from the message cache when
+    the same text was rendered before with the same theme and font size,
+    or "" for a message that should be shown as plain text.
+    render_block() does the same per block, which is what streaming replies
+    use for their closed blocks; the open last block is never cached.
+    """
+
+    def __init__(self, theme: str = "light", font_size: int = 12,
+                 max_messages: int = MAX_CACHED_MESSAGES, max_blocks: int = MAX_CACHED_BLOCKS):
+        self.theme = theme
+        self.font_size = font_size
+        self.max_messages = max_messages
+        self.max_blocks = max_blocks
+        self._messages: "OrderedDict[tuple, str]" = OrderedDict()
+        self._blocks: "OrderedDict[tuple, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def configure(self, theme: str, font_size: int):
+        """Render with a new theme and font size; cached fragments for others stay until evicted"""
+        self.theme = theme
+        self.font_size = font_size
+
+    def render(self, role: str, content: str) -> str:
+        if role != "assistant" or not MARKUP.search(content):
+            return ""
+        key = (_digest(content), self.theme, self.font_size)
+        cached = self._lookup(self._messages, key)
+        if cached is not None:
+            return cached
+        blocks, tail = split_blocks(content)
+        if tail.strip():
+            blocks.append(tail)
+        fragment = "".join(self.render_block(block) for block in blocks)
+        self._store(self._messages, key, fragment, self.max_messages)
+        return fragment
+
+    def render_block(self, block: str, cache: bool = True) -> str:
+        if not cache:
+            return render_block(block, self.theme, self.font_size)
+        key = (_digest(block), self.theme, self.font_size)
+        cached = self._lookup(self._blocks, key)
+        if cached is None:
+            cached = render_block(block, self.theme, self.font_size)
+            self._store(self._blocks, key, cached, self.max_blocks)
+        return cached
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses,
+                "messages": len(self._messages), "blocks": len(self._blocks)}
+
+    def _lookup(self, cache: OrderedDict, key: tuple) -> Optional[str]:
+        fragment = cache.get(key)
+        if fragment is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        cache.move_to_end(key)
+        return fragment
+
+    @staticmethod
+    def _store(cache: OrderedDict, key: tuple, fragment: str, limit: int):
+        cache[key] = fragment
+        while len(cache) > limit:
+            cache.popitem(last=False)
@@ -0,0 +1,167 @@
+"""Compact in-memory storage for the messages of a chat
+
+A MessageList keeps a chat's messages in parallel columns instead of one
+dict per message: roles as one byte each (codes into a shared table of
+interned role names), token counts and timestamps in arrays, one slot
+per message for metrics (None for all but replies), and each message's
+text as its single string. Indexing returns a MessageView, a mapping with the keys the old
+dicts had, so code written for message dicts keeps working.
+"""
+import sys
+import time
+from array import array
+from collections.abc import Mapping, Sequence
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+# Role names by code; grows as new roles are seen
+ROLES: List[str] = ["user", "assistant", "system"]
+_ROLE_CODES: Dict[str, int] = {role: code for code, role in enumerate(ROLES)}
+# Token count column value for "not known yet"
+NO_TOKENS = -1
+
+
+def role_code(role: str) -> int:
+    code = _ROLE_CODES.get(role)
+    if code is None:
+        if len(ROLES) > 255:
+            raise ValueError(f"Too many distinct message roles to store {role!r}")
+        code = _ROLE_CODES[role] = len(ROLES)
+        ROLES.append(sys.intern(role))
+    return code
+
+
+class MessageView(Mapping):
+    """One message of a MessageList, read like the message dict it replaces
+
+    Keys are "role", "content", and "tokens" and "metrics" when set.
+    Setting "tokens" or "metrics" writes through to the list.
+    """
+    __slots__ = ("_messages", "_index")
+
+    def __init__(self, messages: "MessageList", index: int):
+        self._messages = messages
+        self._index = index
+
+    @property
+    def role(self) -> str:
+        return ROLES[self._messages._roles[self._index]]
+
+    @property
+    def content(self) -> str:
+        return self._messages._contents[self._index]
+
+    @property
+    def tokens(self) -> Optional[int]:
+        tokens = self._messages._tokens[self._index]
+        return None if tokens == NO_TOKENS else tokens
+
+    @property
+    def metrics(self) -> Optional[dict]:
+        return self._messages._metrics[self._index]
+
+    @property
+    def created_at(self) -> float:
+        return self._messages._created[self._index]
+
+    def __getitem__(self, key: str):
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        if key == "tokens" and self.tokens is not None:
+            return self.tokens
+        if key == "metrics" and self.metrics is not None:
+            return self.metrics
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value):
+        if key == "tokens":
+            self._messages._tokens[self._index] = NO_TOKENS if value is None else value
+        elif key == "metrics":
+            self._messages._metrics[self._index] = value or None
+        else:
+            raise KeyError(f"{key} cannot be changed")
+
+    def __iter__(self) -> Iterator[str]:
+        yield "role"
+        yield "content"
+        if self.tokens is not None:
+            yield "tokens"
+        if self.metrics is not None:
+            yield "metrics"
+
+    def __len__(self) -> int:
+        return 2 + (self.tokens is not None) + (self.metrics is not None)
+
+    def __repr__(self) -> str:
+        return f"MessageView({dict(self)!r})"
+
+
+class MessageList(Sequence):
+    """The messages of one chat, stored column by column; see the module docstring"""
+
+    def __init__(self, messages: Iterable[Mapping] = ()):
+        self._roles = array("B")
+        self._contents: List[str] = []
+        self._tokens = array("i")
+        self._created = array("d")
+        self._metrics: List[Optional[dict]] = []
+        for message in messages:
+            self.append(message)
+
+    def __len__(self) -> int:
+        return len(self._contents)
+
+    def __getitem__(self, index: Union[int, slice]):
+        if isinstance(index, slice):
+            return [MessageView(self, i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("message index out of range")
+        return MessageView(self, index)
+
+    def __iter__(self) -> Iterator[MessageView]:
+        for index in range(len(self)):
+            yield MessageView(self, index)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(other) == len(self) and all(mine == theirs
+                                               for mine, theirs in zip(self, other))
+
+    def append(self, message: Mapping, created_at: Optional[float] = None):
+        """Add a message given as a dict (or a view of another list)"""
+        self.add(message.get("role", "unknown"), message.get("content", ""),
+                 message.get("tokens"), message.get("metrics"),
+                 created_at if created_at is not None
+                 else getattr(message, "created_at", None))
+
+    def add(self, role: str, content: str, tokens: Optional[int] = None,
+            metrics: Optional[dict] = None, created_at: Optional[float] = None):
+        """Add a message from its fields, without building a dict for it"""
+        self._roles.append(role_code(role))
+        self._contents.append(content)
+        self._tokens.append(NO_TOKENS if tokens is None else tokens)
+        self._created.append(time.time() if created_at is None else created_at)
+        self._metrics.append(metrics or None)
+
+    def extend(self, messages: Iterable[Mapping]):
+        for message in messages:
+            self.append(message)
+
+    def pop(self) -> dict:
+        """Remove the last message and return it as a dict"""
+        if not self._contents:
+            raise IndexError("pop from empty MessageList")
+        message = dict(self[-1])
+        self._roles.pop()
+        self._contents.pop()
+        self._tokens.pop()
+        self._created.pop()
+        self._metrics.pop()
+        return message
+
+    def __repr__(self) -> str:
+        return f"MessageList({len(self)} messages)"
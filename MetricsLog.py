@@ -0,0 +1,90 @@
+import json
+import logging
+import platform
+from logging.handlers import RotatingFileHandler
+from typing import Optional
+
+# Ollama reports durations in nanoseconds
+NS_PER_SECOND = 1e9
+
+
+def generation_metrics(model: str, final: dict, started_at: float, wall_seconds: float,
+                       first_token_seconds: Optional[float], prompt_chars: int) -> dict:
+    """Timing of one generation from Ollama's last chunk plus client-side measurements"""
+    metrics = {
+        "model": model,
+        "started_at": round(started_at, 3),
+        "wall_seconds": round(wall_seconds, 4),
+        "first_token_seconds": (round(first_token_seconds, 4)
+                                if first_token_seconds is not None else None),
+        "prompt_chars": prompt_chars,
+        "cached": bool(final.get("cached")),
+    }
+    for key in ("eval_count", "prompt_eval_count"):
+        if key in final:
+            metrics[key] = final[key]
+    for key in ("eval_duration", "prompt_eval_duration", "load_duration", "total_duration"):
+        if key in final:
+            metrics[key.replace("_duration", "_seconds")] = round(final[key] / NS_PER_SECOND, 4)
+    if final.get("eval_count") and final.get("eval_duration"):
+        metrics["tokens_per_second"] = round(
+            final["eval_count"] / (final["eval_duration"] / NS_PER_SECOND), 2)
+    if final.get("prompt_eval_count") and final.get("prompt_eval_duration"):
+        metrics["prompt_tokens_per_second"] = round(
+            final["prompt_eval_count"] / (final["prompt_eval_duration"] / NS_PER_SECOND), 2)
+    return metrics
+
+
+def format_metrics(metrics: Optional[dict], multiline: bool = False) -> str:
+    """Human-readable summary of generation_metrics() for the status bar or a tooltip"""
+    if not metrics:
+        return ""
+    if metrics.get("cached"):
+        parts = [f"{metrics['model']}: cached response in {metrics['wall_seconds']:.2f} s"]
+    else:
+        parts = [metrics["model"]]
+        if metrics.get("tokens_per_second"):
+            parts.append(f"{metrics['tokens_per_second']:.1f} tok/s")
+        if metrics.get("first_token_seconds") is not None:
+            parts.append(f"first token {metrics['first_token_seconds']:.2f} s")
+    if multiline:
+        if not metrics.get("cached"):
+            parts.append(f"total {metrics['wall_seconds']:.2f} s")
+        if metrics.get("eval_count"):
+            parts.append(f"{metrics['eval_count']} tokens generated")
+        if metrics.get("prompt_eval_count"):
+            line = f"{metrics['prompt_eval_count']} prompt tokens"
+            if metrics.get("prompt_eval_seconds") is not None:
+                line += f" in {metrics['prompt_eval_seconds']:.2f} s"
+            parts.append(line)
+        if metrics.get("load_seconds"):
+            parts.append(f"model load {metrics['load_seconds']:.2f} s")
+        return "\n".join(parts)
+    return ", ".join(parts)
+
+
+class MetricsLog:
+    """Appends one JSON line per generation to a size-rotated log file
+
+    Each line is the generation's metrics plus the host name, so logs from
+    several machines can be compared. The file rolls over to .1, .2, ...
+    once it reaches max_bytes.
+    """
+
+    def __init__(self, path: str = "metrics.jsonl", max_bytes: int = 5 * 1024 * 1024,
+                 backup_count: int = 3):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.host = platform.node()
+        self._handler = RotatingFileHandler(path, maxBytes=max_bytes,
+                                            backupCount=backup_count,
+                                            encoding="utf-8", delay=True)
+        self._handler.setFormatter(logging.Formatter("%(message)s"))
+
+    def write(self, metrics: dict):
+        record = logging.LogRecord("metrics", logging.INFO, self.path, 0,
+                                   json.dumps(dict(metrics, host=self.host)), None, None)
+        self._handler.handle(record)
+
+    def close(self):
+        self._handler.close()
@@ -0,0 +1,168 @@
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+# Loading a large model can take minutes; preloads and cold generations
+# wait this long for the first byte instead of the normal read timeout
+LOAD_TIMEOUT = 300
+# How long Ollama keeps a model loaded when no keep_alive is sent
+DEFAULT_KEEP_ALIVE_SECONDS = 300
+# A failed preload is not retried (e.g. on every keystroke) for this long
+RETRY_DELAY = 30
+
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def keep_alive_seconds(value: Union[str, int, float, None]) -> Optional[float]:
+    """Seconds a keep_alive value keeps a model loaded; None means forever
+
+    Accepts what Ollama accepts: a number of seconds or a duration such as
+    "10m" or "1h30m". Negative values keep the model loaded indefinitely.
+    """
+    if value is None or value == "":
+        return DEFAULT_KEEP_ALIVE_SECONDS
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        text = value.strip()
+        try:
+            seconds = float(text)
+        except ValueError:
+            parts = re.findall(r"(-?\d+(?:\.\d+)?)(ms|s|m|h)", text)
+            if not parts or "".join(n + u for n, u in parts) != text.replace(" ", ""):
+                return DEFAULT_KEEP_ALIVE_SECONDS
+            seconds = sum(float(n) * _DURATION_UNITS[u] for n, u in parts)
+    return None if seconds < 0 else seconds
+
+
+def parse_keep_alive_overrides(text: str) -> Dict[str, str]:
+    """Parse "model=duration, model=duration" into a dict"""
+    overrides = {}
+    for entry in text.split(","):
+        model, _, duration = entry.partition("=")
+        if model.strip() and duration.strip():
+            overrides[model.strip()] = duration.strip()
+    return overrides
+
+
+def format_keep_alive_overrides(overrides: Dict[str, str]) -> str:
+    return ", ".join(f"{model}={duration}" for model, duration in overrides.items())
+
+
+class ModelLoader:
+    """Tracks which models Ollama has in memory and loads them ahead of use
+
+    preload() asks Ollama to load a model on a background thread and times
+    it, so the first message does not pay the load cost. The load state of
+    each model is "loading", "loaded" or "failed"; a loaded model is assumed
+    unloaded again once its keep_alive runs out, and a failed load is retried
+    after RETRY_DELAY. Subscribers are called with (model, state) on every
+    change, from whichever thread made it.
+    """
+
+    def __init__(self, api_manager):
+        self.api_manager = api_manager
+        self._states: Dict[str, dict] = {}
+        self._subscribers: List[Callable[[str, dict], None]] = []
+        self._lock = threading.Lock()
+
+    def state(self, model: str) -> Optional[dict]:
+        """{"state", "load_seconds", "error"} for model, or None if never loaded"""
+        with self._lock:
+            state = self._states.get(model)
+            if state and state["state"] == "loaded" and self._expired(state):
+                return None
+            return dict(state) if state else None
+
+    def is_loaded(self, model: str) -> bool:
+        state = self.state(model)
+        return bool(state) and state["state"] == "loaded"
+
+    def subscribe(self, callback: Callable[[str, dict], None]):
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[str, dict], None]):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def preload(self, model: str, block: bool = False):
+        """Load model in the background unless it is loaded or loading already
+
+        Cheap when there is nothing to do, so it can be called on every keystroke.
+        """
+        if not model or keep_alive_seconds(self.api_manager.keep_alive_for(model)) == 0:
+            return  # A model that is unloaded right away cannot be warmed up
+        with self._lock:
+            state = self._states.get(model)
+            if state and (state["state"] == "loading" or not self._expired(state)):
+                return
+            state = self._states[model] = {"state": "loading", "load_seconds": None,
+                                           "error": None, "expires": None}
+            thread = threading.Thread(target=self._preload, args=(model,),
+                                      name=f"ModelLoader {model}", daemon=True)
+        self._notify(model, state)
+        thread.start()
+        if block:
+            thread.join()
+
+    def mark_used(self, model: str, final_chunk: dict):
+        """Record that a generation just ran on model, restarting its keep_alive"""
+        if not model or final_chunk.get("error") or final_chunk.get("cached"):
+            return
+        with self._lock:
+            previous = self._states.get(model)
+            state = self._loaded_state(model)
+            if previous and previous["state"] == "loaded" and not self._expired(previous):
+                state["load_seconds"] = previous["load_seconds"]
+            elif final_chunk.get("load_duration"):
+                # The generation itself paid for the load
+                state["load_seconds"] = final_chunk["load_duration"] / 1e9
+            self._states[model] = state
+        self._notify(model, state)
+
+    def _preload(self, model: str):
+        # Load with the model's options, or its first generation would reload it
+        payload = {"model": model, "stream": False,
+                   "options": self.api_manager.options_for(model)}
+        keep_alive = self.api_manager.keep_alive_for(model)
+        if keep_alive:
+            payload["keep_alive"] = keep_alive
+        connect_timeout, read_timeout = self.api_manager.timeout
+        start = time.monotonic()
+        try:
+            # A generate request without a prompt only loads the model
+            response = self.api_manager._request("POST", "generate", model=model, json=payload,
+                                                 timeout=(connect_timeout,
+                                                          max(read_timeout, LOAD_TIMEOUT)))
+            if response.status_code != 200:
+                raise RuntimeError(f"{response.status_code} - {response.text}")
+            error = response.json().get("error")
+            if error:
+                raise RuntimeError(error)
+            with self._lock:
+                state = self._states[model] = self._loaded_state(model)
+                state["load_seconds"] = time.monotonic() - start
+        except Exception as e:
+            print(f"Error preloading {model}: {e}")
+            with self._lock:
+                state = self._states[model] = {"state": "failed", "load_seconds": None,
+                                               "error": str(e),
+                                               "expires": time.monotonic() + RETRY_DELAY}
+        self._notify(model, state)
+
+    def _loaded_state(self, model: str) -> dict:
+        seconds = keep_alive_seconds(self.api_manager.keep_alive_for(model))
+        return {"state": "loaded", "load_seconds": None, "error": None,
+                "expires": None if seconds is None else time.monotonic() + seconds}
+
+    @staticmethod
+    def _expired(state: dict) -> bool:
+        return state["expires"] is not None and time.monotonic() >= state["expires"]
+
+    def _notify(self, model: str, state: dict):
+        for callback in list(self._subscribers):
+            try:
+                callback(model, dict(state))
+            except Exception as e:
+                print(f"Error notifying model load subscriber: {e}")
@@ -0,0 +1,225 @@
+"""Per-model Ollama options and an auto-tuner for this machine
+
+A profile is a dict of Ollama options (num_ctx, num_thread, num_batch, ...)
+sent with every request for one model, on top of the sampling defaults.
+AutoTuner times a reference prompt across num_thread and num_batch values
+and reports the fastest combination. It can also run without the GUI:
+
+    python ModelOptions.py llama2 --apply
+
+which tunes llama2 and stores the result in settings.json.
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+import threading
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Union
+from RequestScheduler import BACKGROUND
+
+if TYPE_CHECKING:
+    from APIManager import APIManager
+
+# Options a profile usually sets, in the order they are shown
+PROFILE_OPTIONS = ("num_ctx", "num_predict", "num_thread", "num_batch", "num_gpu",
+                   "temperature", "top_p", "top_k")
+REFERENCE_PROMPT = ("Explain in one paragraph how a bicycle's gears make it easier to ride "
+                    "up a hill, then list three ways to maintain them.")
+# Tokens generated per timed run; enough to measure a steady rate
+TUNE_PREDICT = 64
+BATCH_CANDIDATES = (128, 256, 512)
+
+
+def parse_options(text: str) -> Dict[str, Union[int, float, bool, str]]:
+    """Parse "num_ctx=4096, temperature=0.5" into a dict of typed values"""
+    options = {}
+    for entry in text.split(","):
+        key, _, value = entry.partition("=")
+        key, value = key.strip(), value.strip()
+        if not key or not value:
+            continue
+        if value.lower() in ("true", "false"):
+            options[key] = value.lower() == "true"
+            continue
+        try:
+            options[key] = int(value)
+        except ValueError:
+            try:
+                options[key] = float(value)
+            except ValueError:
+                options[key] = value
+    return options
+
+
+def format_options(options: Dict[str, object]) -> str:
+    ordered = sorted(options, key=lambda k: (PROFILE_OPTIONS.index(k)
+                                             if k in PROFILE_OPTIONS else len(PROFILE_OPTIONS), k))
+    return ", ".join(f"{key}={str(options[key]).lower() if isinstance(options[key], bool) else options[key]}"
+                     for key in ordered)
+
+
+def describe_model(details: Optional[dict]) -> str:
+    """One line from an /api/show response: family, size, quantization, context length"""
+    if not details:
+        return ""
+    info = details.get("details", {})
+    parts = [info.get(key) for key in ("family", "parameter_size", "quantization_level")]
+    context = context_length(details)
+    if context:
+        parts.append(f"context {context}")
+    return " · ".join(part for part in parts if part)
+
+
+def context_length(details: Optional[dict]) -> Optional[int]:
+    """The model's trained context length, the largest useful num_ctx"""
+    for key, value in (details or {}).get("model_info", {}).items():
+        if key.endswith(".context_length"):
+            return value
+    return None
+
+
+def thread_candidates(cpu_count: Optional[int] = None) -> List[int]:
+    """num_thread values worth trying: Ollama is usually fastest near the physical core count"""
+    count = cpu_count or os.cpu_count() or 4
+    return sorted({max(1, count // 4), max(1, count // 2), max(1, count * 3 // 4), count})
+
+
+class AutoTuner:
+    """Finds the fastest num_thread and num_batch for one model on one server
+
+    Every combination is loaded with an untimed one-token run, then timed
+    repeats times on the reference prompt. Generation speed (tokens/s) from
+    Ollama's own eval counters decides; prompt evaluation speed breaks ties.
+    Each run's prompt starts with its number so Ollama cannot reuse the
+    previous run's prompt evaluation. All runs go to the same server.
+    """
+
+    def __init__(self, api_manager: "APIManager", model: str,
+                 threads: Optional[List[int]] = None, batches: Optional[List[int]] = None,
+                 base_options: Optional[dict] = None, prompt: str = REFERENCE_PROMPT,
+                 num_predict: int = TUNE_PREDICT, repeats: int = 2):
+        self.api_manager = api_manager
+        self.model = model
+        self.threads = threads or thread_candidates()
+        self.batches = batches or list(BATCH_CANDIDATES)
+        self.base_options = dict(base_options or {})
+        self.prompt = prompt
+        self.num_predict = num_predict
+        self.repeats = max(1, repeats)
+        self.results: List[dict] = []
+        self._runs = itertools.count(1)
+
+    def run(self, progress: Optional[Callable[[dict, int, int], None]] = None,
+            cancel: Optional[threading.Event] = None) -> Optional[dict]:
+        """Try every combination; returns the best result or None if none worked
+
+        progress is called with (result, done, total) after each combination.
+        """
+        endpoint = self.api_manager.endpoints.choose(self.model)
+        combinations = list(itertools.product(self.threads, self.batches))
+        self.results = []
+        for done, (threads, batch) in enumerate(combinations, 1):
+            if cancel is not None and cancel.is_set():
+                break
+            options = dict(self.base_options, num_thread=threads, num_batch=batch)
+            result = {"num_thread": threads, "num_batch": batch}
+            try:
+                self._generate(options, 1, endpoint)  # Load with these options
+                samples = [self._generate(options, self.num_predict, endpoint)
+                           for _ in range(self.repeats)]
+                result["tokens_per_second"] = statistics.median(
+                    s["eval_count"] / (s["eval_duration"] / 1e9) for s in samples)
+                prompt_rates = [s["prompt_eval_count"] / (s["prompt_eval_duration"] / 1e9)
+                                for s in samples if s.get("prompt_eval_duration")]
+                result["prompt_tokens_per_second"] = (statistics.median(prompt_rates)
+                                                      if prompt_rates else 0.0)
+            except Exception as e:
+                result["error"] = str(e)
+            self.results.append(result)
+            if progress:
+                progress(result, done, len(combinations))
+        return self.best()
+
+    def best(self) -> Optional[dict]:
+        ok = [r for r in self.results if "error" not in r]
+        if not ok:
+            return None
+        return max(ok, key=lambda r: (r["tokens_per_second"], r["prompt_tokens_per_second"]))
+
+    def _generate(self, options: dict, num_predict: int, endpoint) -> dict:
+        """Last chunk of one run; waits for interactive requests and skips the response cache"""
+        text, final = self.api_manager.scheduler.generate(
+            f"Run {next(self._runs)}. {self.prompt}", model=self.model, priority=BACKGROUND,
+            # Fixed sampling so every combination generates comparable text
+            options=dict(options, num_predict=num_predict, temperature=0, seed=42),
+            use_cache=False, endpoint=endpoint)
+        if final.get("error"):
+            raise RuntimeError(text)
+        if not final.get("eval_count") or not final.get("eval_duration"):
+            raise RuntimeError("Ollama did not report generation timings")
+        return final
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Find the fastest num_thread and num_batch "
+                                                 "for a model on this machine")
+    parser.add_argument("model")
+    parser.add_argument("--threads", type=int, nargs="+",
+                        help="num_thread values to try (default: based on the CPU count)")
+    parser.add_argument("--batches", type=int, nargs="+", default=list(BATCH_CANDIDATES))
+    parser.add_argument("--repeats", type=int, default=2, help="timed runs per combination")
+    parser.add_argument("--num-predict", type=int, default=TUNE_PREDICT)
+    parser.add_argument("--url", help="Ollama server to tune (default: the first in settings)")
+    parser.add_argument("--settings", default="settings.json")
+    parser.add_argument("--apply", action="store_true",
+                        help="store the best combination in the model's profile in settings")
+    args = parser.parse_args(argv)
+
+    from APIManager import APIManager
+    from EndpointPool import normalize_url
+    try:
+        with open(args.settings, "r") as f:
+            settings = json.load(f)
+    except FileNotFoundError:
+        settings = {}
+    api_manager = APIManager()
+    api_manager.configure_endpoints([normalize_url(args.url)] if args.url
+                                    else settings.get("endpoints", [])[:1])
+    api_manager.configure_keep_alive(settings.get("keep_alive", ""),
+                                     settings.get("keep_alive_overrides", {}))
+    profiles = settings.get("model_options", {})
+    tuner = AutoTuner(api_manager, args.model, args.threads, args.batches,
+                      profiles.get(args.model), num_predict=args.num_predict,
+                      repeats=args.repeats)
+
+    def report(result, done, total):
+        if "error" in result:
+            status = f"failed: {result['error']}"
+        else:
+            status = (f"{result['tokens_per_second']:.1f} tok/s, "
+                      f"prompt {result['prompt_tokens_per_second']:.1f} tok/s")
+        print(f"[{done}/{total}] num_thread={result['num_thread']} "
+              f"num_batch={result['num_batch']}: {status}", file=sys.stderr)
+
+    try:
+        best = tuner.run(report)
+    finally:
+        api_manager.close()
+    if best is None:
+        print("No combination worked", file=sys.stderr)
+        return 1
+    print(json.dumps({"model": args.model, "best": best, "results": tuner.results}, indent=2))
+    if args.apply:
+        profile = dict(profiles.get(args.model, {}), num_thread=best["num_thread"],
+                       num_batch=best["num_batch"])
+        settings["model_options"] = dict(profiles, **{args.model: profile})
+        with open(args.settings, "w") as f:
+            json.dump(settings, f)
+        print(f"Saved {format_options(profile)} for {args.model}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
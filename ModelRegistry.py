@@ -0,0 +1,117 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+
+def display_name(name: str) -> str:
+    """Drop the implicit ":latest" tag; other tags distinguish real variants"""
+    return name[:-len(":latest")] if name.endswith(":latest") else name
+
+
+class ModelRegistry:
+    """Cached view of the models installed in Ollama
+
+    The list comes from /api/tags on every configured server and is refreshed on a background thread,
+    so reading it never blocks. Entries older than ttl seconds trigger a
+    refresh when read. Subscribers are called with the new list of names
+    after every refresh that changes it, from the refresh thread.
+    Per-model metadata from /api/show is cached the same way.
+    """
+
+    def __init__(self, api_manager, ttl: float = 60):
+        self.api_manager = api_manager
+        self.ttl = ttl
+        self._models: Dict[str, dict] = {}
+        self._fetched_at = 0.0
+        self._details: Dict[str, tuple] = {}  # name -> (fetched at, /api/show response)
+        self._subscribers: List[Callable[[List[str]], None]] = []
+        self._lock = threading.Lock()
+        self._refreshing = None
+        self._loaded = threading.Event()
+
+    def models(self, refresh: bool = True) -> List[str]:
+        """Installed model names from the cache; refreshes in the background when stale
+
+        refresh=False only reads the cache, for callers on the startup path.
+        """
+        if refresh and time.monotonic() - self._fetched_at > self.ttl:
+            self.refresh()
+        with self._lock:
+            return list(self._models)
+
+    def digest(self, name: str) -> str:
+        with self._lock:
+            return self._models.get(name, {}).get("digest", "")
+
+    def is_loaded(self) -> bool:
+        """Whether at least one refresh has completed"""
+        return self._loaded.is_set()
+
+    def wait_until_loaded(self, timeout: Optional[float] = None) -> bool:
+        return self._loaded.wait(timeout)
+
+    def subscribe(self, callback: Callable[[List[str]], None]):
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[[List[str]], None]):
+        if callback in self._subscribers:
+            self._subscribers.remove(callback)
+
+    def refresh(self, block: bool = False):
+        """Reload the model list from /api/tags; concurrent calls share one request"""
+        with self._lock:
+            thread = self._refreshing
+            if thread is None:
+                thread = self._refreshing = threading.Thread(
+                    target=self._refresh, name="ModelRegistry refresh", daemon=True)
+                thread.start()
+        if block:
+            thread.join()
+
+    def show(self, name: str) -> Optional[dict]:
+        """Metadata for one model from /api/show, cached for ttl seconds
+
+        This makes a request on a cache miss; call it off the GUI thread.
+        """
+        with self._lock:
+            cached = self._details.get(name)
+        if cached and time.monotonic() - cached[0] <= self.ttl:
+            return cached[1]
+        try:
+            response = self.api_manager._request("POST", "show", model=name,
+                                                 json={"model": name})
+            if response.status_code != 200:
+                print(f"Error fetching details for {name}: {response.status_code}")
+                return None
+            details = response.json()
+        except Exception as e:
+            print(f"Error fetching details for {name}: {e}")
+            return None
+        with self._lock:
+            self._details[name] = (time.monotonic(), details)
+        return details
+
+    def _refresh(self):
+        try:
+            # Every server's models, so requests can be routed to where a model lives
+            models = self.api_manager.endpoints.list_models()
+            with self._lock:
+                changed = list(models) != list(self._models)
+                self._models = models
+                self._fetched_at = time.monotonic()
+                self._details = {name: details for name, details in self._details.items()
+                                 if name in models}
+            self._loaded.set()
+            if changed:
+                for callback in list(self._subscribers):
+                    try:
+                        callback(list(models))
+                    except Exception as e:
+                        print(f"Error notifying model list subscriber: {e}")
+        except Exception as e:
+            # Try again on the next read rather than hammering an absent server
+            self._fetched_at = time.monotonic()
+            print(f"Error refreshing models: {e}")
+        finally:
+            with self._lock:
+                self._refreshing = None
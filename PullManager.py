@@ -0,0 +1,193 @@
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+from APIManager import APIManager
+
+# Progress is reported to the GUI at most this often per download
+PROGRESS_INTERVAL = 0.2
+# Throughput is averaged over this many seconds
+THROUGHPUT_WINDOW = 3.0
+
+
+def format_size(size: float) -> str:
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def describe_download(model: str, state: dict) -> str:
+    """One line for a download: state, percentage, size and speed"""
+    if state["state"] == "queued":
+        return f"{model}: queued"
+    progress = state.get("progress") or {}
+    if not progress.get("total"):
+        return f"{model}: {progress.get('status', 'starting')}"
+    layers = len(progress["layers"])
+    text = (f"{model}: {progress['fraction'] * 100:.0f}% of {format_size(progress['total'])}"
+            f" ({layers} layer{'s' if layers != 1 else ''})")
+    if progress.get("bytes_per_second"):
+        text += f" at {format_size(progress['bytes_per_second'])}/s"
+    return text
+
+
+class PullProgress:
+    """Folds /api/pull status lines into per-layer and overall progress"""
+
+    def __init__(self):
+        self.status = "starting"
+        self.layers: Dict[str, list] = {}  # digest -> [completed, total]
+        self._samples = deque()  # (time, bytes completed)
+
+    def update(self, chunk: dict):
+        self.status = chunk.get("status", self.status)
+        digest = chunk.get("digest")
+        if digest and chunk.get("total"):
+            self.layers[digest] = [chunk.get("completed", 0), chunk["total"]]
+            now = time.monotonic()
+            self._samples.append((now, self.completed))
+            while self._samples and now - self._samples[0][0] > THROUGHPUT_WINDOW:
+                self._samples.popleft()
+
+    @property
+    def completed(self) -> int:
+        return sum(completed for completed, _ in self.layers.values())
+
+    @property
+    def total(self) -> int:
+        return sum(total for _, total in self.layers.values())
+
+    def snapshot(self) -> dict:
+        completed, total = self.completed, self.total
+        speed = 0.0
+        if len(self._samples) > 1:
+            (start, first), (end, last) = self._samples[0], self._samples[-1]
+            if end > start:
+                speed = (last - first) / (end - start)
+        return {
+            "status": self.status,
+            "completed": completed,
+            "total": total,
+            "fraction": completed / total if total else 0.0,
+            "bytes_per_second": speed,
+            "layers": {digest: {"completed": c, "total": t}
+                       for digest, (c, t) in self.layers.items()},
+        }
+
+
+class PullSignals(QObject):
+    """Signals emitted by a PullTask from its worker thread"""
+    started = pyqtSignal(str)              # model
+    progress = pyqtSignal(str, dict)       # model, PullProgress.snapshot()
+    finished = pyqtSignal(str, bool, str)  # model, success, message
+
+
+class PullTask(QRunnable):
+    """Streams one model download from /api/pull on a pool thread"""
+
+    def __init__(self, api_manager: APIManager, model: str, cancel: threading.Event,
+                 signals: PullSignals):
+        super().__init__()
+        self.api_manager = api_manager
+        self.model = model
+        self.cancel = cancel
+        self.signals = signals
+
+    def run(self):
+        if self.cancel.is_set():
+            self.signals.finished.emit(self.model, False, "Download cancelled")
+            return
+        self.signals.started.emit(self.model)
+        progress = PullProgress()
+        last_report = 0.0
+        for chunk in self.api_manager.stream_pull(self.model, self.cancel):
+            if chunk.get("error"):
+                self.signals.finished.emit(self.model, False, chunk["error"])
+                return
+            if chunk.get("status") == "cancelled":
+                self.signals.finished.emit(self.model, False, "Download cancelled")
+                return
+            progress.update(chunk)
+            now = time.monotonic()
+            if now - last_report >= PROGRESS_INTERVAL:
+                last_report = now
+                self.signals.progress.emit(self.model, progress.snapshot())
+            if chunk.get("status") == "success":
+                self.signals.progress.emit(self.model, progress.snapshot())
+                self.signals.finished.emit(self.model, True,
+                                           f"Model {self.model} installed successfully")
+                return
+        self.signals.finished.emit(self.model, False, "Download ended before completing")
+
+
+class PullManager(QObject):
+    """Queues model downloads and runs them in the background
+
+    Downloads run max_concurrent at a time; the rest wait in order. Each can
+    be cancelled while queued or running. The model registry is refreshed
+    after every successful download so model lists update by themselves.
+    """
+    downloads_changed = pyqtSignal()        # a download was queued, started or finished
+    progress_changed = pyqtSignal(str, dict)  # model, download state
+    pull_finished = pyqtSignal(str, bool, str)  # model, success, message
+
+    def __init__(self, api_manager: APIManager, max_concurrent: int = 1, parent=None):
+        super().__init__(parent)
+        self.api_manager = api_manager
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_concurrent)
+        self._downloads: Dict[str, dict] = {}  # model -> {"state", "progress", "cancel"}
+
+        self._signals = PullSignals()
+        self._signals.started.connect(self._on_started)
+        self._signals.progress.connect(self._on_progress)
+        self._signals.finished.connect(self._on_finished)
+
+    def pull(self, model: str) -> bool:
+        """Queue model for download; False if it is already queued or downloading"""
+        if not model or model in self._downloads:
+            return False
+        cancel = threading.Event()
+        self._downloads[model] = {"state": "queued", "progress": None, "cancel": cancel}
+        self.pool.start(PullTask(self.api_manager, model, cancel, self._signals))
+        self.downloads_changed.emit()
+        return True
+
+    def cancel(self, model: str):
+        download = self._downloads.get(model)
+        if download:
+            download["cancel"].set()
+
+    def downloads(self) -> Dict[str, dict]:
+        """State of every queued or running download, in the order they were queued"""
+        return {model: {"state": d["state"], "progress": d["progress"]}
+                for model, d in self._downloads.items()}
+
+    def state(self, model: str) -> Optional[dict]:
+        return self.downloads().get(model)
+
+    def shutdown(self, timeout_ms: int = 1000):
+        """Cancel every download; Ollama keeps what was fetched for next time"""
+        for download in self._downloads.values():
+            download["cancel"].set()
+        self.pool.waitForDone(timeout_ms)
+
+    def _on_started(self, model: str):
+        if model in self._downloads:
+            self._downloads[model]["state"] = "pulling"
+            self.downloads_changed.emit()
+
+    def _on_progress(self, model: str, progress: dict):
+        download = self._downloads.get(model)
+        if download:
+            download["progress"] = progress
+            self.progress_changed.emit(model, {"state": download["state"], "progress": progress})
+
+    def _on_finished(self, model: str, success: bool, message: str):
+        self._downloads.pop(model, None)
+        if success:
+            self.api_manager.refresh_models()
+        self.pull_finished.emit(model, success, message)
+        self.downloads_changed.emit()
@@ -0,0 +1,269 @@
+import heapq
+import itertools
+import threading
+import time
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from APIManager import APIManager
+
+# Priorities; lower runs first
+INTERACTIVE = 0
+BACKGROUND = 1
+# A request that has waited this long (seconds) is no longer passed over
+# in favour of requests for a model that is already loaded
+MAX_WAIT = 30
+
+
+class CancelEvent(threading.Event):
+    """An Event that also runs callbacks when set, to interrupt blocking reads"""
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+
+    def set(self):
+        with self._lock:
+            super().set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_set(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Run callback when set (now, if it already is); returns a function that unregisters it"""
+        with self._lock:
+            if not self.is_set():
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def _discard(self, callback: Callable[[], None]):
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+class Ticket:
+    """One generation's place in the scheduler
+
+    cancel() withdraws a queued request or stops a running one: its
+    connection is shut down at once, which stops Ollama generating, and
+    its slot is freed when the stream has ended.
+    """
+
+    def __init__(self, scheduler: "RequestScheduler", model: str, priority: int,
+                 preemptible: bool = False):
+        self.scheduler = scheduler
+        self.model = model
+        self.priority = priority
+        # Preemptible requests are stopped and queued again when an
+        # interactive request needs their slot
+        self.preemptible = preemptible
+        self.preempted = False
+        self.seq = next(scheduler._seq)
+        self.queued_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.cancelled = CancelEvent()
+        self.state = "new"  # new, queued, running, done
+
+    def cancel(self):
+        self.scheduler._cancel(self)
+
+
+class RequestScheduler:
+    """Admits generation requests to Ollama in an order that avoids thrashing
+
+    Requests wait in one queue per model. At most max_active run at once,
+    on at most max_models different models, so a second model is not
+    loaded while the first is still generating. When a slot frees up the
+    next request is the highest priority one, preferring a model that is
+    already running or loaded, then the oldest; after MAX_WAIT seconds a
+    request is no longer passed over for a loaded model. An interactive
+    request that cannot start preempts running preemptible background
+    requests, which are retried from the start, when that lets it run.
+    A running request keeps its slot until its stream has ended, also when
+    it is cancelled or preempted.
+    """
+
+    def __init__(self, api_manager: "APIManager", max_active: int = 4, max_models: int = 1):
+        self.api_manager = api_manager
+        self.max_active = max_active
+        self.max_models = max_models
+        self._seq = itertools.count()
+        self._queues: Dict[str, List[Tuple[int, int, Ticket]]] = {}  # model -> heap
+        self._running: List[Ticket] = []
+        self._cond = threading.Condition()
+
+    def configure(self, max_active: int, max_models: int):
+        with self._cond:
+            self.max_active = max(1, max_active)
+            self.max_models = max(1, max_models)
+            self._cond.notify_all()
+
+    def ticket(self, model: Optional[str] = None, priority: int = INTERACTIVE,
+               preemptible: bool = False) -> Ticket:
+        """A ticket to pass to stream() or generate(), so the caller can cancel it"""
+        return Ticket(self, model or self.api_manager.model, priority, preemptible)
+
+    def stream(self, prompt: str, model: Optional[str] = None,
+               context: Optional[List[int]] = None, system: Optional[str] = None,
+               priority: int = INTERACTIVE, ticket: Optional[Ticket] = None,
+               **kwargs) -> Iterator[dict]:
+        """APIManager.stream_response once the scheduler admits the request
+
+        kwargs (options, use_cache, endpoint) are passed on to stream_response.
+        A cancelled request ends with a chunk that has "done" and "cancelled"
+        set, after whatever text arrived before it was stopped.
+        """
+        ticket = ticket or self.ticket(model, priority)
+        if not self._acquire(ticket):
+            yield self._cancelled_chunk()
+            return
+        try:
+            yield from self.api_manager.stream_response(prompt, ticket.model, context, system,
+                                                        cancel=ticket.cancelled, **kwargs)
+        finally:
+            self._release(ticket)
+
+    def generate(self, prompt: str, model: Optional[str] = None,
+                 context: Optional[List[int]] = None, system: Optional[str] = None,
+                 priority: int = BACKGROUND,
+                 ticket: Optional[Ticket] = None, **kwargs) -> Tuple[str, dict]:
+        """Whole response text and last chunk; background requests yield to interactive ones
+
+        An error comes back as its message with "error" set on the last chunk.
+        kwargs are passed on as in stream().
+        """
+        ticket = ticket or self.ticket(model, priority, preemptible=priority > INTERACTIVE)
+        while True:
+            pieces, final = [], {}
+            for chunk in self.stream(prompt, context=context, system=system, ticket=ticket,
+                                     **kwargs):
+                if chunk.get("error"):
+                    return chunk.get("response", ""), chunk
+                pieces.append(chunk.get("response", ""))
+                if chunk.get("done"):
+                    final = chunk
+            if not ticket.preempted:
+                return "".join(pieces), final
+            # Start over once the interactive request is through
+            ticket = self.ticket(ticket.model, ticket.priority, preemptible=True)
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {"running": len(self._running),
+                    "queued": sum(len(queue) for queue in self._queues.values()),
+                    "models": sorted({t.model for t in self._running})}
+
+    def _acquire(self, ticket: Ticket) -> bool:
+        """Queue ticket and block until it may run; False if it was cancelled"""
+        with self._cond:
+            if ticket.cancelled.is_set():
+                return False
+            ticket.state = "queued"
+            heapq.heappush(self._queues.setdefault(ticket.model, []),
+                           (ticket.priority, ticket.seq, ticket))
+            while True:
+                if ticket.cancelled.is_set():
+                    return False  # _cancel took it off the queue
+                if self._next() is ticket:
+                    heapq.heappop(self._queues[ticket.model])
+                    if not self._queues[ticket.model]:
+                        del self._queues[ticket.model]
+                    ticket.state = "running"
+                    ticket.started_at = time.monotonic()
+                    self._running.append(ticket)
+                    self._cond.notify_all()  # The next request may be able to start too
+                    return True
+                # Wake up in time to notice a request passing MAX_WAIT
+                self._cond.wait(timeout=1.0)
+
+    def _release(self, ticket: Ticket):
+        with self._cond:
+            if ticket in self._running:
+                self._running.remove(ticket)
+            ticket.state = "done"
+            self._cond.notify_all()
+
+    def _cancel(self, ticket: Ticket):
+        with self._cond:
+            ticket.cancelled.set()
+            if ticket.state == "queued":
+                queue = self._queues.get(ticket.model, [])
+                queue[:] = [entry for entry in queue if entry[2] is not ticket]
+                heapq.heapify(queue)
+                if not queue:
+                    self._queues.pop(ticket.model, None)
+            if ticket.state != "running":
+                # A running request keeps its slot until _release
+                ticket.state = "done"
+            self._cond.notify_all()
+
+    def _next(self) -> Optional[Ticket]:
+        """The request to start next, if it can start now; call with the lock held"""
+        heads = [queue[0][2] for queue in self._queues.values() if queue]
+        if not heads:
+            return None
+        now = time.monotonic()
+        running_models = {t.model for t in self._running}
+        best = min(heads, key=lambda t: (
+            t.priority,
+            now - t.queued_at < MAX_WAIT,
+            t.model not in running_models and not self.api_manager.loader.is_loaded(t.model),
+            t.seq))
+        if self._can_start(best):
+            return best
+        if best.priority == INTERACTIVE:
+            self._preempt_for(best)
+        return None
+
+    def _can_start(self, ticket: Ticket) -> bool:
+        return self._fits(ticket, self._running)
+
+    def _fits(self, ticket: Ticket, running: List[Ticket]) -> bool:
+        """Whether ticket could start alongside running"""
+        if len(running) >= self.max_active:
+            return False
+        running_models = {t.model for t in running}
+        return ticket.model in running_models or len(running_models) < self.max_models
+
+    def _preempt_for(self, ticket: Ticket) -> bool:
+        """Stop background requests so ticket can start once their streams end
+
+        Returns whether ticket will then fit. Nothing is stopped unless
+        stopping it makes room: a request for a model that must go is only
+        stopped if every other request on that model can be stopped too.
+        """
+        staying = [t for t in self._running if not t.cancelled.is_set()]
+        if self._fits(ticket, staying):
+            return True  # Requests already stopping make room
+        candidates = [t for t in staying if t.preemptible and t.priority > ticket.priority]
+        victims = []
+        models = {t.model for t in staying}
+        if ticket.model not in models and len(models) >= self.max_models:
+            # Free the model with the fewest requests, if all of them can be stopped
+            freeable = [m for m in models
+                        if all(t in candidates for t in staying if t.model == m)]
+            if not freeable:
+                return False
+            model = min(freeable, key=lambda m: sum(t.model == m for t in staying))
+            victims = [t for t in staying if t.model == model]
+        rest = [t for t in staying if t not in victims]
+        if len(rest) >= self.max_active:
+            extra = [t for t in candidates if t not in victims]
+            if not extra:
+                return False
+            victims.append(extra[-1])
+            rest.remove(extra[-1])
+        if not self._fits(ticket, rest):
+            return False
+        for victim in victims:
+            victim.preempted = True
+            victim.cancelled.set()  # Its slot frees when its stream has ended
+        return True
+
+    @staticmethod
+    def _cancelled_chunk() -> dict:
+        return {"response": "", "done": True, "cancelled": True}
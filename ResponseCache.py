@@ -0,0 +1,179 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+
+class ResponseCache:
+    """Two-tier cache of finished generations with single-flight de-duplication
+
+    Entries are keyed on everything that determines a response (see key()).
+    The memory tier is a small LRU; the disk tier keeps one JSON file per
+    entry and evicts the least recently used files once it grows past
+    max_disk_bytes. Concurrent identical requests share one generation: the
+    first caller generates while the others wait in single_flight() and then
+    read the result from the cache.
+    """
+
+    def __init__(self, directory: str = "response_cache", memory_entries: int = 256,
+                 max_disk_bytes: int = 100 * 1024 * 1024):
+        self.directory = directory
+        self.memory_entries = memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+
+        self._memory: "OrderedDict[str, dict]" = OrderedDict()
+        self._disk_sizes: Optional[OrderedDict] = None  # key -> bytes, least recent first
+        self._disk_total = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def configure(self, memory_entries: int, max_disk_bytes: int):
+        with self._lock:
+            self.memory_entries = memory_entries
+            self.max_disk_bytes = max_disk_bytes
+            while len(self._memory) > memory_entries:
+                self._memory.popitem(last=False)
+            index = self._disk_index()
+            while self._disk_total > max_disk_bytes and index:
+                self._remove_disk(next(iter(index)))
+
+    @staticmethod
+    def key(model: str, digest: str, prompt: str, context=None, system=None,
+            options=None) -> str:
+        material = json.dumps({
+            "model": model,
+            "digest": digest,
+            "prompt": prompt,
+            "context": context or [],
+            "system": system or "",
+            "options": options or {},
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str, count: bool = True) -> Optional[dict]:
+        """Look key up in memory, then on disk; counts a hit or a miss unless count is False"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+            else:
+                entry = self._read_disk(key)
+                if entry is not None:
+                    self._remember(key, entry)
+            if count:
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            return entry
+
+    def put(self, key: str, entry: dict):
+        with self._lock:
+            self._remember(key, entry)
+            self._write_disk(key, entry)
+
+    @contextmanager
+    def single_flight(self, key: str) -> Iterator[bool]:
+        """Yield True for the caller that should generate, False for followers
+
+        Followers block until the leader leaves the block and should then
+        call get() again; if the leader failed they generate themselves.
+        """
+        with self._lock:
+            event = self._in_flight.get(key)
+            leader = event is None
+            if leader:
+                event = self._in_flight[key] = threading.Event()
+            else:
+                self.shared += 1
+        if not leader:
+            event.wait()
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            event.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "shared": self.shared,
+                    "memory_entries": len(self._memory),
+                    "disk_bytes": self._disk_total if self._disk_sizes is not None else None}
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            for key in list(self._disk_index()):
+                self._remove_disk(key)
+
+    def _remember(self, key: str, entry: dict):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _disk_index(self) -> OrderedDict:
+        """Sizes of the entries on disk, scanned once and then kept up to date"""
+        if self._disk_sizes is None:
+            entries = []
+            if os.path.isdir(self.directory):
+                for name in os.listdir(self.directory):
+                    if name.endswith(".json"):
+                        stat = os.stat(os.path.join(self.directory, name))
+                        entries.append((stat.st_mtime, name[:-len(".json")], stat.st_size))
+            self._disk_sizes = OrderedDict((key, size) for _, key, size in sorted(entries))
+            self._disk_total = sum(self._disk_sizes.values())
+        return self._disk_sizes
+
+    def _read_disk(self, key: str) -> Optional[dict]:
+        index = self._disk_index()
+        if key not in index:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(self._path(key))  # Keeps disk eviction least-recently-used
+            index.move_to_end(key)
+            return entry
+        except (OSError, ValueError) as e:
+            print(f"Error reading cached response: {e}")
+            self._remove_disk(key)
+            return None
+
+    def _write_disk(self, key: str, entry: dict):
+        if self.max_disk_bytes <= 0:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            data = json.dumps(entry).encode("utf-8")
+            tmp_path = self._path(key) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+            index = self._disk_index()
+            self._disk_total += len(data) - index.get(key, 0)
+            index[key] = len(data)
+            index.move_to_end(key)
+            while self._disk_total > self.max_disk_bytes and len(index) > 1:
+                self._remove_disk(next(iter(index)))
+        except OSError as e:
+            print(f"Error writing cached response: {e}")
+
+    def _remove_disk(self, key: str):
+        self._disk_total -= self._disk_index().pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
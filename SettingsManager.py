@@ -1,16 +1,49 @@
 import json
+import threading
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, 
                              QCheckBox, QPushButton, QFileDialog, QSpinBox, QComboBox, 
-                             QMessageBox, QGroupBox)
-from PyQt5.QtCore import Qt, pyqtSignal, QTimer
+                             QMessageBox, QGroupBox, QDoubleSpinBox, QListWidget,
+                             QListWidgetItem, QScrollArea, QFrame)
+from PyQt5.QtCore import Qt, QRunnable, QThreadPool, pyqtSignal
 from PyQt5.QtGui import QPalette, QColor
-from APIManager import APIManager
+from ModelLoader import parse_keep_alive_overrides, format_keep_alive_overrides
+from PullManager import describe_download
+from EndpointPool import DEFAULT_URL, parse_endpoints, format_endpoints
+from ModelOptions import AutoTuner, parse_options, format_options, describe_model
+
+
+class ModelRemovalTask(QRunnable):
+    """Removes a model on a pool thread and reports through finished(model, success, message)"""
+
+    def __init__(self, api_manager, model: str, finished):
+        super().__init__()
+        self.api_manager = api_manager
+        self.model = model
+        self.finished = finished
+
+    def run(self):
+        try:
+            success, message = self.api_manager.remove_model(self.model)
+        except Exception as e:
+            success, message = False, f"Error removing model: {e}"
+        self.finished.emit(self.model, success, message)
+
 
 class SettingsManager(QWidget):
     settings_changed = pyqtSignal(dict)
+    models_changed = pyqtSignal(list)  # Emitted from the registry's refresh thread
+    endpoints_changed = pyqtSignal(list)  # Emitted from the endpoint health check thread
+    model_details_ready = pyqtSignal(str, object)  # model, /api/show response or None
+    tune_progress = pyqtSignal(str, dict, int, int)  # model, result, done, total
+    tune_finished = pyqtSignal(str, object)  # model, best result or None
+    model_removed = pyqtSignal(str, bool, str)  # model, success, message
 
     def __init__(self, parent=None):
         super().__init__(parent)
+        # Share the main window's API manager (and its model registry)
+        self.api_manager = getattr(parent, 'api_manager', None)
+        # Model downloads keep running while the dialog is closed
+        self.pull_manager = getattr(parent, 'pull_manager', None)
         # Initialize default settings
         self.settings = {
             "theme": "light",
@@ -18,7 +51,27 @@ class SettingsManager(QWidget):
             "auto_save": True,
             "save_directory": "",
             "dark_mode": False,
-            "model": "llama2-uncensored"
+            "model": "llama2-uncensored",
+            "preload_model": True,
+            "keep_alive": "",
+            "keep_alive_overrides": {},
+            "model_options": {},
+            "endpoints": [DEFAULT_URL],
+            "health_check_interval": 30,
+            "pool_size": 10,
+            "connect_timeout": 5.0,
+            "read_timeout": 30.0,
+            "max_active_requests": 4,
+            "max_active_models": 1,
+            "max_loaded_chats": 20,
+            "context_budget": 2048,
+            "system_prompt": "",
+            "summary_model": "",
+            "response_cache": False,
+            "cache_memory_entries": 256,
+            "cache_disk_mb": 100,
+            "metrics_log": True,
+            "metrics_log_mb": 5
         }
         
         # Setup window properties
@@ -26,32 +79,93 @@ class SettingsManager(QWidget):
         self.setWindowFlags(Qt.Window | Qt.WindowStaysOnTopHint | Qt.WindowCloseButtonHint)
         self.setAttribute(Qt.WA_DeleteOnClose, False)
         self.setWindowModality(Qt.ApplicationModal)
-        self.resize(400, 500)
+        self.resize(540, 600)
         
-        # Load settings and initialize UI
+        # Load settings now; the widgets are built the first time the
+        # dialog is shown so they stay off the startup path
         self.load_settings()
-        self.setup_ui()
-        self.apply_style()
+        self._ui_ready = False
+        # Profiles being edited; saved with the other settings
+        self.model_options = dict(self.settings["model_options"])
+        self._options_model = None
+        self._tune_cancel = None
+
+        # Keep the model list current without blocking on Ollama
+        self.models_changed.connect(self.populate_model_list)
+        if self.api_manager:
+            self.api_manager.registry.subscribe(self.models_changed.emit)
+            self.endpoints_changed.connect(self.populate_endpoint_status)
+            self.api_manager.endpoints.subscribe(self.endpoints_changed.emit)
+        if self.pull_manager:
+            self.pull_manager.downloads_changed.connect(self.populate_downloads)
+            self.pull_manager.progress_changed.connect(self.update_download)
+            self.pull_manager.pull_finished.connect(self.on_pull_finished)
+        self.model_details_ready.connect(self.show_model_details)
+        self.tune_progress.connect(self.on_tune_progress)
+        self.tune_finished.connect(self.on_tune_finished)
+        self.model_removed.connect(self.on_model_removed)
+
+    def ensure_ui(self):
+        """Build the dialog's widgets if that has not happened yet"""
+        if not self._ui_ready:
+            self._ui_ready = True
+            self.setup_ui()
+            self.apply_style()
+
+    def setVisible(self, visible):
+        # Children must exist before Qt shows them, so build here rather than in showEvent
+        if visible:
+            self.ensure_ui()
+        super().setVisible(visible)
 
     def setup_ui(self):
-        layout = QVBoxLayout()
+        # The groups scroll; the buttons below them stay in view
+        form = QWidget()
+        layout = QVBoxLayout(form)
         
         # Model Management Section
         layout.addWidget(self.create_model_group())
         
+        # Model Options Section
+        layout.addWidget(self.create_model_options_group())
+
+        # Conversation Context Section
+        layout.addWidget(self.create_context_group())
+        
+        # Response Cache Section
+        layout.addWidget(self.create_cache_group())
+        
+        # Connection Section
+        layout.addWidget(self.create_connection_group())
+        
+        # Metrics Section
+        layout.addWidget(self.create_metrics_group())
+        
         # Font Settings Section
         layout.addWidget(self.create_font_group())
         
         # Auto Save Section
         layout.addWidget(self.create_save_group())
         
+        # History Section
+        layout.addWidget(self.create_history_group())
+        
         # Theme Section
         layout.addWidget(self.create_theme_group())
+        layout.addStretch()
+
+        scroll = QScrollArea()
+        scroll.setWidget(form)
+        scroll.setWidgetResizable(True)
+        scroll.setFrameShape(QFrame.NoFrame)
+
+        main_layout = QVBoxLayout()
+        main_layout.addWidget(scroll)
         
         # Buttons Section
-        layout.addLayout(self.create_button_layout())
+        main_layout.addLayout(self.create_button_layout())
         
-        self.setLayout(layout)
+        self.setLayout(main_layout)
 
     def create_model_group(self):
         group = QGroupBox("Model Management")
@@ -64,6 +178,26 @@ class SettingsManager(QWidget):
         self.refresh_model_list()
         current_model_layout.addWidget(self.model_input)
         layout.addLayout(current_model_layout)
+
+        # Loading the model ahead of the first message
+        self.preload_checkbox = QCheckBox("Preload model at startup and while typing")
+        self.preload_checkbox.setChecked(self.settings["preload_model"])
+        layout.addWidget(self.preload_checkbox)
+
+        keep_alive_layout = QHBoxLayout()
+        keep_alive_layout.addWidget(QLabel("Keep Loaded For:"))
+        self.keep_alive_input = QLineEdit(self.settings["keep_alive"])
+        self.keep_alive_input.setPlaceholderText("Server default (5m); -1 for always")
+        keep_alive_layout.addWidget(self.keep_alive_input)
+        layout.addLayout(keep_alive_layout)
+
+        overrides_layout = QHBoxLayout()
+        overrides_layout.addWidget(QLabel("Per-Model Keep Loaded:"))
+        self.keep_alive_overrides_input = QLineEdit(
+            format_keep_alive_overrides(self.settings["keep_alive_overrides"]))
+        self.keep_alive_overrides_input.setPlaceholderText("e.g. llama2=30m, mistral=-1")
+        overrides_layout.addWidget(self.keep_alive_overrides_input)
+        layout.addLayout(overrides_layout)
         
         # New Model Installation
         new_model_layout = QHBoxLayout()
@@ -74,15 +208,201 @@ class SettingsManager(QWidget):
         install_button.clicked.connect(self.download_new_model)
         new_model_layout.addWidget(install_button)
         layout.addLayout(new_model_layout)
+
+        # Queued and running downloads with their progress
+        self.downloads_list = QListWidget()
+        self.downloads_list.setMaximumHeight(80)
+        layout.addWidget(self.downloads_list)
+        cancel_download_button = QPushButton("Cancel Download")
+        cancel_download_button.clicked.connect(self.cancel_selected_download)
+        layout.addWidget(cancel_download_button)
+        self.populate_downloads()
         
         # Remove Model Button
-        remove_button = QPushButton("Remove Selected Model")
-        remove_button.clicked.connect(self.remove_selected_model)
-        layout.addWidget(remove_button)
+        self.remove_button = QPushButton("Remove Selected Model")
+        self.remove_button.clicked.connect(self.remove_selected_model)
+        layout.addWidget(self.remove_button)
         
         group.setLayout(layout)
         return group
 
+    def create_model_options_group(self):
+        group = QGroupBox("Model Options")
+        layout = QVBoxLayout()
+
+        # Family, size, quantization and context length of the selected model
+        self.model_details_label = QLabel("")
+        self.model_details_label.setWordWrap(True)
+        layout.addWidget(self.model_details_label)
+
+        options_layout = QHBoxLayout()
+        options_layout.addWidget(QLabel("Options:"))
+        self.model_options_input = QLineEdit()
+        self.model_options_input.setPlaceholderText("e.g. num_ctx=4096, num_thread=8")
+        options_layout.addWidget(self.model_options_input)
+        layout.addLayout(options_layout)
+
+        tune_layout = QHBoxLayout()
+        self.tune_button = QPushButton("Auto-Tune")
+        self.tune_button.setToolTip("Time a reference prompt with different num_thread and "
+                                    "num_batch values and keep the fastest")
+        self.tune_button.clicked.connect(self.toggle_auto_tune)
+        tune_layout.addWidget(self.tune_button)
+        self.tune_status_label = QLabel("")
+        tune_layout.addWidget(self.tune_status_label, 1)
+        layout.addLayout(tune_layout)
+
+        self.model_input.currentTextChanged.connect(self.show_model_options)
+        self.show_model_options(self.model_input.currentText())
+
+        group.setLayout(layout)
+        return group
+
+    def create_context_group(self):
+        group = QGroupBox("Conversation Context")
+        layout = QVBoxLayout()
+
+        budget_layout = QHBoxLayout()
+        budget_layout.addWidget(QLabel("Token Budget:"))
+        self.context_budget_spin = QSpinBox()
+        self.context_budget_spin.setRange(256, 131072)
+        self.context_budget_spin.setSingleStep(256)
+        self.context_budget_spin.setValue(self.settings["context_budget"])
+        budget_layout.addWidget(self.context_budget_spin)
+        layout.addLayout(budget_layout)
+
+        system_layout = QHBoxLayout()
+        system_layout.addWidget(QLabel("System Prompt:"))
+        self.system_prompt_input = QLineEdit(self.settings["system_prompt"])
+        system_layout.addWidget(self.system_prompt_input)
+        layout.addLayout(system_layout)
+
+        summary_layout = QHBoxLayout()
+        summary_layout.addWidget(QLabel("Summary Model:"))
+        self.summary_model_input = QLineEdit(self.settings["summary_model"])
+        self.summary_model_input.setPlaceholderText("Same as current model")
+        summary_layout.addWidget(self.summary_model_input)
+        layout.addLayout(summary_layout)
+
+        group.setLayout(layout)
+        return group
+
+    def create_cache_group(self):
+        group = QGroupBox("Response Cache")
+        layout = QVBoxLayout()
+
+        self.response_cache_checkbox = QCheckBox("Reuse responses to identical prompts")
+        self.response_cache_checkbox.setChecked(self.settings["response_cache"])
+        layout.addWidget(self.response_cache_checkbox)
+
+        memory_layout = QHBoxLayout()
+        memory_layout.addWidget(QLabel("Responses Kept in Memory:"))
+        self.cache_memory_spin = QSpinBox()
+        self.cache_memory_spin.setRange(0, 100000)
+        self.cache_memory_spin.setValue(self.settings["cache_memory_entries"])
+        memory_layout.addWidget(self.cache_memory_spin)
+        layout.addLayout(memory_layout)
+
+        disk_layout = QHBoxLayout()
+        disk_layout.addWidget(QLabel("Disk Cache Size (MB):"))
+        self.cache_disk_spin = QSpinBox()
+        self.cache_disk_spin.setRange(0, 100000)
+        self.cache_disk_spin.setValue(self.settings["cache_disk_mb"])
+        disk_layout.addWidget(self.cache_disk_spin)
+        layout.addLayout(disk_layout)
+
+        group.setLayout(layout)
+        return group
+
+    def create_connection_group(self):
+        group = QGroupBox("Connection")
+        layout = QVBoxLayout()
+
+        endpoints_layout = QHBoxLayout()
+        endpoints_layout.addWidget(QLabel("Ollama Servers:"))
+        self.endpoints_input = QLineEdit(format_endpoints(self.settings["endpoints"]))
+        self.endpoints_input.setPlaceholderText("e.g. localhost:11434, gpu-box:11434")
+        endpoints_layout.addWidget(self.endpoints_input)
+        layout.addLayout(endpoints_layout)
+
+        health_layout = QHBoxLayout()
+        health_layout.addWidget(QLabel("Health Check Every (s):"))
+        self.health_interval_spin = QSpinBox()
+        self.health_interval_spin.setRange(5, 3600)
+        self.health_interval_spin.setValue(self.settings["health_check_interval"])
+        health_layout.addWidget(self.health_interval_spin)
+        layout.addLayout(health_layout)
+
+        # Each server's health, latency and load, updated after every check
+        self.endpoint_status_list = QListWidget()
+        self.endpoint_status_list.setMaximumHeight(80)
+        layout.addWidget(self.endpoint_status_list)
+        if self.api_manager:
+            self.populate_endpoint_status(self.api_manager.endpoints.status())
+
+        pool_layout = QHBoxLayout()
+        pool_layout.addWidget(QLabel("Connection Pool Size:"))
+        self.pool_size_spin = QSpinBox()
+        self.pool_size_spin.setRange(1, 100)
+        self.pool_size_spin.setValue(self.settings["pool_size"])
+        pool_layout.addWidget(self.pool_size_spin)
+        layout.addLayout(pool_layout)
+
+        connect_layout = QHBoxLayout()
+        connect_layout.addWidget(QLabel("Connect Timeout (s):"))
+        self.connect_timeout_spin = QDoubleSpinBox()
+        self.connect_timeout_spin.setRange(0.5, 120)
+        self.connect_timeout_spin.setValue(self.settings["connect_timeout"])
+        connect_layout.addWidget(self.connect_timeout_spin)
+        layout.addLayout(connect_layout)
+
+        read_layout = QHBoxLayout()
+        read_layout.addWidget(QLabel("Read Timeout (s):"))
+        self.read_timeout_spin = QDoubleSpinBox()
+        self.read_timeout_spin.setRange(1, 3600)
+        self.read_timeout_spin.setValue(self.settings["read_timeout"])
+        read_layout.addWidget(self.read_timeout_spin)
+        layout.addLayout(read_layout)
+
+        # Request scheduling: how much Ollama is asked to do at once
+        active_layout = QHBoxLayout()
+        active_layout.addWidget(QLabel("Parallel Generations:"))
+        self.max_active_requests_spin = QSpinBox()
+        self.max_active_requests_spin.setRange(1, 64)
+        self.max_active_requests_spin.setValue(self.settings["max_active_requests"])
+        active_layout.addWidget(self.max_active_requests_spin)
+        layout.addLayout(active_layout)
+
+        models_layout = QHBoxLayout()
+        models_layout.addWidget(QLabel("Models Generating at Once:"))
+        self.max_active_models_spin = QSpinBox()
+        self.max_active_models_spin.setRange(1, 16)
+        self.max_active_models_spin.setValue(self.settings["max_active_models"])
+        models_layout.addWidget(self.max_active_models_spin)
+        layout.addLayout(models_layout)
+
+        group.setLayout(layout)
+        return group
+
+    def create_metrics_group(self):
+        group = QGroupBox("Metrics")
+        layout = QVBoxLayout()
+
+        self.metrics_log_checkbox = QCheckBox("Log generation metrics to metrics.jsonl")
+        self.metrics_log_checkbox.setChecked(self.settings["metrics_log"])
+        layout.addWidget(self.metrics_log_checkbox)
+
+        size_layout = QHBoxLayout()
+        size_layout.addWidget(QLabel("Rotate Log At (MB):"))
+        self.metrics_log_spin = QSpinBox()
+        self.metrics_log_spin.setRange(1, 1000)
+        self.metrics_log_spin.setValue(self.settings["metrics_log_mb"])
+        size_layout.addWidget(self.metrics_log_spin)
+        layout.addLayout(size_layout)
+
+        group.setLayout(layout)
+        return group
+
     def create_font_group(self):
         group = QGroupBox("Font")
         layout = QVBoxLayout()
@@ -116,6 +436,19 @@ class SettingsManager(QWidget):
         group.setLayout(layout)
         return group
 
+    def create_history_group(self):
+        group = QGroupBox("History")
+        layout = QVBoxLayout()
+        loaded_layout = QHBoxLayout()
+        loaded_layout.addWidget(QLabel("Chats Kept in Memory:"))
+        self.max_loaded_spin = QSpinBox()
+        self.max_loaded_spin.setRange(1, 1000)
+        self.max_loaded_spin.setValue(self.settings["max_loaded_chats"])
+        loaded_layout.addWidget(self.max_loaded_spin)
+        layout.addLayout(loaded_layout)
+        group.setLayout(layout)
+        return group
+
     def create_theme_group(self):
         group = QGroupBox("Theme")
         layout = QVBoxLayout()
@@ -139,13 +472,36 @@ class SettingsManager(QWidget):
 
     def save_settings(self):
         try:
+            self.store_model_options()
             self.settings.update({
                 "font_size": self.font_size_spin.value(),
                 "auto_save": self.auto_save_checkbox.isChecked(),
                 "save_directory": self.save_dir_input.text(),
                 "dark_mode": self.dark_mode_checkbox.isChecked(),
                 "theme": "dark" if self.dark_mode_checkbox.isChecked() else "light",
-                "model": self.model_input.currentText()
+                "model": self.model_input.currentText(),
+                "preload_model": self.preload_checkbox.isChecked(),
+                "keep_alive": self.keep_alive_input.text().strip(),
+                "keep_alive_overrides": parse_keep_alive_overrides(
+                    self.keep_alive_overrides_input.text()),
+                "model_options": {model: options for model, options
+                                  in self.model_options.items() if options},
+                "endpoints": parse_endpoints(self.endpoints_input.text()) or [DEFAULT_URL],
+                "health_check_interval": self.health_interval_spin.value(),
+                "pool_size": self.pool_size_spin.value(),
+                "connect_timeout": self.connect_timeout_spin.value(),
+                "read_timeout": self.read_timeout_spin.value(),
+                "max_active_requests": self.max_active_requests_spin.value(),
+                "max_active_models": self.max_active_models_spin.value(),
+                "max_loaded_chats": self.max_loaded_spin.value(),
+                "context_budget": self.context_budget_spin.value(),
+                "system_prompt": self.system_prompt_input.text(),
+                "summary_model": self.summary_model_input.text().strip(),
+                "response_cache": self.response_cache_checkbox.isChecked(),
+                "cache_memory_entries": self.cache_memory_spin.value(),
+                "cache_disk_mb": self.cache_disk_spin.value(),
+                "metrics_log": self.metrics_log_checkbox.isChecked(),
+                "metrics_log_mb": self.metrics_log_spin.value()
             })
 
             with open("settings.json", "w") as f:
@@ -237,7 +593,7 @@ class SettingsManager(QWidget):
                     padding: 0px 5px 0px 5px;
                     color: #ffffff;
                 }
-                QLineEdit, QSpinBox, QComboBox {
+                QLineEdit, QSpinBox, QDoubleSpinBox, QComboBox {
                     padding: 5px;
                     border: 1px solid #404040;
                     border-radius: 4px;
@@ -272,7 +628,8 @@ class SettingsManager(QWidget):
                 QComboBox::down-arrow {
                     background-color: #4a90e2;
                 }
-                QSpinBox::up-button, QSpinBox::down-button {
+                QSpinBox::up-button, QSpinBox::down-button,
+                QDoubleSpinBox::up-button, QDoubleSpinBox::down-button {
                     background-color: #4a90e2;
                 }
                 QMessageBox {
@@ -306,7 +663,7 @@ class SettingsManager(QWidget):
                     padding: 0px 5px 0px 5px;
                     color: #333333;
                 }
-                QLineEdit, QSpinBox, QComboBox {
+                QLineEdit, QSpinBox, QDoubleSpinBox, QComboBox {
                     padding: 5px;
                     border: 1px solid #cccccc;
                     border-radius: 4px;
@@ -343,7 +700,13 @@ class SettingsManager(QWidget):
             with open("settings.json", "r") as f:
                 loaded_settings = json.load(f)
                 # Only update settings that we currently use
-                for key in ["theme", "font_size", "auto_save", "save_directory", "dark_mode", "model"]:
+                for key in ["theme", "font_size", "auto_save", "save_directory", "dark_mode", "model",
+                            "preload_model", "keep_alive", "keep_alive_overrides", "model_options",
+                            "endpoints", "health_check_interval", "pool_size",
+                            "max_active_requests", "max_active_models", "connect_timeout", "read_timeout", "max_loaded_chats",
+                            "context_budget", "system_prompt", "summary_model",
+                            "response_cache", "cache_memory_entries", "cache_disk_mb",
+                            "metrics_log", "metrics_log_mb"]:
                     if key in loaded_settings:
                         self.settings[key] = loaded_settings[key]
         except FileNotFoundError:
@@ -354,40 +717,147 @@ class SettingsManager(QWidget):
         if directory:
             self.save_dir_input.setText(directory)
 
+    def showEvent(self, event):
+        # The registry refreshes itself in the background if its list is stale
+        if self.api_manager:
+            self.populate_model_list(self.api_manager.list_models())
+            self.populate_endpoint_status(self.api_manager.endpoints.status())
+        super().showEvent(event)
+
     def refresh_model_list(self):
-        """Refresh the list of available models"""
-        try:
-            # Get API manager
-            if self.parent() and hasattr(self.parent(), 'api_manager'):
-                api_manager = self.parent().api_manager
-            else:
-                api_manager = APIManager()
+        """Show the cached model list and ask the registry for a fresh one"""
+        if not self.api_manager:
+            return
+        self.populate_model_list(self.api_manager.list_models())
+        self.api_manager.refresh_models()
 
-            # Get list of models
-            models = api_manager.list_models()
+    def populate_model_list(self, models):
+        """Fill the model combo box, keeping the current selection"""
+        if not hasattr(self, 'model_input'):
+            return
+        try:
+            selected = self.model_input.currentText() or self.settings.get("model", "llama2-uncensored")
+            self.model_input.blockSignals(True)
+            self.model_input.clear()
+            self.model_input.addItems(models)
             
-            # Clear and repopulate the combo box
-            if hasattr(self, 'model_input'):
-                self.model_input.clear()
-                self.model_input.addItems(models)
-                
-                # Set current model if it exists
-                current_model = self.settings.get("model", "llama2-uncensored")
-                index = self.model_input.findText(current_model)
-                if index >= 0:
-                    self.model_input.setCurrentIndex(index)
-                
+            # Set current model if it exists
+            index = self.model_input.findText(selected)
+            if index >= 0:
+                self.model_input.setCurrentIndex(index)
+            self.model_input.blockSignals(False)
+            self.show_model_options(self.model_input.currentText())
         except Exception as e:
             print(f"Error refreshing model list: {e}")
 
+    def store_model_options(self):
+        """Keep what was typed for the model whose options are showing"""
+        if self._options_model and hasattr(self, 'model_options_input'):
+            self.model_options[self._options_model] = parse_options(
+                self.model_options_input.text())
+
+    def show_model_options(self, model):
+        """Show the selected model's profile and fetch its details in the background"""
+        if not hasattr(self, 'model_options_input') or model == self._options_model:
+            return
+        self.store_model_options()
+        self._options_model = model
+        self.model_options_input.setText(format_options(self.model_options.get(model, {})))
+        self.model_details_label.setText("")
+        if self._tune_cancel is None:
+            self.tune_status_label.setText("")
+        if model and self.api_manager:
+            threading.Thread(target=lambda: self.model_details_ready.emit(
+                model, self.api_manager.registry.show(model)), daemon=True).start()
+
+    def show_model_details(self, model, details):
+        if model == self._options_model and hasattr(self, 'model_details_label'):
+            self.model_details_label.setText(describe_model(details))
+
+    def toggle_auto_tune(self):
+        """Start tuning the selected model, or stop the run in progress"""
+        if self._tune_cancel is not None:
+            self._tune_cancel.set()
+            self.tune_status_label.setText("Stopping...")
+            return
+        model = self._options_model
+        if not model or not self.api_manager:
+            return
+        reply = QMessageBox.question(self, 'Auto-Tune',
+            f'Time "{model}" with different thread and batch settings?\n\n'
+            'This runs the model many times and may take several minutes.',
+            QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+        if reply != QMessageBox.Yes:
+            return
+        self.store_model_options()
+        tuner = AutoTuner(self.api_manager, model,
+                          base_options=self.model_options.get(model))
+        self._tune_cancel = cancel = threading.Event()
+        self.tune_button.setText("Stop Tuning")
+        self.tune_status_label.setText("Loading model...")
+
+        def run():
+            best = None
+            try:
+                best = tuner.run(lambda result, done, total: self.tune_progress.emit(
+                    model, result, done, total), cancel)
+            except Exception as e:
+                print(f"Error tuning {model}: {e}")
+            self.tune_finished.emit(model, best)
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def on_tune_progress(self, model, result, done, total):
+        if self._tune_cancel is None or self._tune_cancel.is_set():
+            return
+        speed = ("failed" if "error" in result
+                 else f"{result['tokens_per_second']:.1f} tok/s")
+        self.tune_status_label.setText(
+            f"{done}/{total}: num_thread={result['num_thread']}, "
+            f"num_batch={result['num_batch']}: {speed}")
+
+    def on_tune_finished(self, model, best):
+        stopped = self._tune_cancel is not None and self._tune_cancel.is_set()
+        self._tune_cancel = None
+        self.tune_button.setText("Auto-Tune")
+        if best is None:
+            self.tune_status_label.setText("Tuning stopped" if stopped
+                                           else "No combination worked; see the console")
+            return
+        self.store_model_options()
+        self.model_options[model] = dict(self.model_options.get(model, {}),
+                                         num_thread=best["num_thread"],
+                                         num_batch=best["num_batch"])
+        if model == self._options_model:
+            self.model_options_input.setText(format_options(self.model_options[model]))
+        self.tune_status_label.setText(
+            f"Best: num_thread={best['num_thread']}, num_batch={best['num_batch']} "
+            f"at {best['tokens_per_second']:.1f} tok/s; save to keep it")
+
+    def populate_endpoint_status(self, status):
+        """One line per server: health, latency, requests in flight and models"""
+        if not hasattr(self, 'endpoint_status_list'):
+            return
+        self.endpoint_status_list.clear()
+        for endpoint in status:
+            if not endpoint["healthy"]:
+                text = f"{endpoint['url']}: down"
+            else:
+                text = f"{endpoint['url']}: up"
+                if endpoint["latency"] is not None:
+                    text += f", {endpoint['latency'] * 1000:.0f} ms"
+                text += f", {endpoint['in_flight']} in flight"
+                if endpoint["models"] is not None:
+                    count = len(endpoint["models"])
+                    text += f", {count} model{'s' if count != 1 else ''}"
+                if endpoint["loaded"]:
+                    text += f" ({', '.join(endpoint['loaded'])} loaded)"
+            item = QListWidgetItem(text)
+            item.setToolTip(endpoint["error"] or "")
+            self.endpoint_status_list.addItem(item)
+
     def download_new_model(self):
         """Download a new model"""
-        # Get API manager
-        if self.parent() and hasattr(self.parent(), 'api_manager'):
-            api_manager = self.parent().api_manager
-        else:
-            api_manager = APIManager()
-
         model_name = self.new_model_input.text().strip()
         if not model_name:
             QMessageBox.warning(self, "Error", 
@@ -408,58 +878,60 @@ class SettingsManager(QWidget):
             '• Require several GB of storage',
             QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         
-        if reply == QMessageBox.Yes:
-            try:
-                # Determine the operating system and open appropriate terminal
-                import platform
-                import os
-                
-                system = platform.system().lower()
-                command = f"ollama pull {model_name}"
-                
-                print(f"Operating System: {system}")  # Debug print
-                print(f"Command to run: {command}")   # Debug print
-                
-                if system == "windows":
-                    print("Attempting to open Windows CMD")  # Debug print
-                    os.system(f'start cmd /K "{command}"')
-                elif system == "darwin":
-                    print("Attempting to open macOS Terminal")  # Debug print
-                    os.system(f'open -a Terminal.app -e "bash -c \'{command}; read -p Press\\ any\\ key\\ to\\ close...\'"')
-                elif system == "linux":
-                    print("Attempting to open Linux terminal")  # Debug print
-                    terminals = ['gnome-terminal', 'konsole', 'xterm']
-                    for term in terminals:
-                        try:
-                            if term == 'gnome-terminal':
-                                os.system(f'{term} -- bash -c "{command}; read -p \'Press Enter to close...\'"')
-                            else:
-                                os.system(f'{term} -e "bash -c \'{command}; read -p \"Press Enter to close...\"\')"')
-                            print(f"Successfully opened {term}")  # Debug print
-                            break
-                        except:
-                            print(f"Failed to open {term}")  # Debug print
-                            continue
-                
-                self.new_model_input.clear()
-                # Refresh the model list after a short delay
-                QTimer.singleShot(1000, self.refresh_model_list)
-                
-            except Exception as e:
-                print(f"Error during download: {str(e)}")  # Debug print
-                QMessageBox.warning(self, "Error", 
-                    f"Failed to start installation: {str(e)}\n\n"
-                    "Make sure:\n"
-                    "• Ollama is installed\n"
-                    "• You have internet connection")
+        if reply == QMessageBox.Yes and self.pull_manager:
+            if not self.pull_manager.pull(model_name):
+                QMessageBox.information(self, "Already Downloading",
+                    f'The model "{model_name}" is already being downloaded.')
+                return
+            self.new_model_input.clear()
+
+    def populate_downloads(self):
+        """List every queued or running download"""
+        if not self.pull_manager or not hasattr(self, 'downloads_list'):
+            return
+        selected = self.downloads_list.currentItem()
+        selected = selected.data(Qt.UserRole) if selected else None
+        self.downloads_list.clear()
+        for model, state in self.pull_manager.downloads().items():
+            item = QListWidgetItem(describe_download(model, state))
+            item.setData(Qt.UserRole, model)
+            self.downloads_list.addItem(item)
+            if model == selected:
+                self.downloads_list.setCurrentItem(item)
+        self.downloads_list.setVisible(self.downloads_list.count() > 0)
+
+    def update_download(self, model, state):
+        if not hasattr(self, 'downloads_list'):
+            return
+        for row in range(self.downloads_list.count()):
+            item = self.downloads_list.item(row)
+            if item.data(Qt.UserRole) == model:
+                item.setText(describe_download(model, state))
+                return
+
+    def cancel_selected_download(self):
+        if not self.pull_manager:
+            return
+        item = self.downloads_list.currentItem()
+        if item is None and self.downloads_list.count():
+            item = self.downloads_list.item(0)
+        if item is not None:
+            self.pull_manager.cancel(item.data(Qt.UserRole))
+
+    def on_pull_finished(self, model, success, message):
+        # Only report failures here; the main window shows every outcome
+        if not success and self.isVisible() and message != "Download cancelled":
+            QMessageBox.warning(self, "Error",
+                f"Failed to download {model}: {message}\n\n"
+                "Make sure:\n"
+                "• Ollama is running\n"
+                "• You have internet connection\n"
+                "• The model name is correct")
 
     def remove_selected_model(self):
         """Remove the currently selected model"""
-        # Get API manager
-        if self.parent() and hasattr(self.parent(), 'api_manager'):
-            api_manager = self.parent().api_manager
-        else:
-            api_manager = APIManager()
+        if not self.api_manager:
+            return
 
         model_name = self.model_input.currentText()
         if not model_name:
@@ -471,9 +943,16 @@ class SettingsManager(QWidget):
                                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
         
         if reply == QMessageBox.Yes:
-            success, message = api_manager.remove_model(model_name)
-            if success:
-                QMessageBox.information(self, "Success", message)
-                self.refresh_model_list()
-            else:
-                QMessageBox.warning(self, "Error", message)
+            # The DELETE goes to every server hosting the model; keep it off the GUI thread
+            self.remove_button.setEnabled(False)
+            self.remove_button.setText(f"Removing {model_name}...")
+            QThreadPool.globalInstance().start(
+                ModelRemovalTask(self.api_manager, model_name, self.model_removed))
+
+    def on_model_removed(self, model_name, success, message):
+        self.remove_button.setEnabled(True)
+        self.remove_button.setText("Remove Selected Model")
+        if success:
+            QMessageBox.information(self, "Success", message)
+        else:
+            QMessageBox.warning(self, "Error", message)
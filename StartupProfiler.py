@@ -0,0 +1,40 @@
+import json
+import time
+from typing import List, Tuple
+
+
+class StartupProfiler:
+    """Times the phases of application startup for --profile-startup
+
+    mark() closes the current phase and starts the next one, so phases add
+    up to the total. Disabled profilers do nothing, which keeps the calls in
+    the normal startup path free.
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.start = self._last = time.perf_counter()
+        self.phases: List[Tuple[str, float]] = []
+
+    def mark(self, phase: str):
+        """Record the time since the previous mark as phase"""
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.phases.append((phase, now - self._last))
+        self._last = now
+
+    def total(self) -> float:
+        return self._last - self.start
+
+    def report(self, as_json: bool = False) -> str:
+        if as_json:
+            return json.dumps({"phases": {name: round(seconds * 1000, 2)
+                                          for name, seconds in self.phases},
+                               "total_ms": round(self.total() * 1000, 2)})
+        width = max([len(name) for name, _ in self.phases] + [len("total")])
+        lines = ["Startup profile:"]
+        for name, seconds in self.phases:
+            lines.append(f"  {name:<{width}}  {seconds * 1000:8.1f} ms")
+        lines.append(f"  {'total':<{width}}  {self.total() * 1000:8.1f} ms")
+        return "\n".join(lines)
@@ -0,0 +1,494 @@
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from collections.abc import Mapping
+from typing import Iterable, Iterator, List, Optional
+from MessageStore import MessageList
+
+# Bumped whenever _upgrade_schema gains a step
+SCHEMA_VERSION = 3
+
+# search() ranks at most this many of the newest matches, which keeps
+# queries for very common words in the milliseconds on large histories
+RANK_CANDIDATES = 2000
+# Wrap matched terms in search() snippets
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+
+class StorageManager:
+    """SQLite-backed chat storage
+
+    Every change is its own small transaction: appending a message writes one
+    row, and renaming or deleting a chat touches only that chat. The database
+    runs in WAL mode so a crash mid-write never loses earlier chats.
+    """
+
+    def __init__(self, db_path: str = "chats.db", legacy_json_path: str = "chats.json"):
+        self.db_path = db_path
+        self._in_transaction = False
+        self.conn = sqlite3.connect(db_path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self._create_schema()
+        self._upgrade_schema()
+        self.has_fts = self._create_search_index()
+        self.migrate_from_json(legacy_json_path)
+
+    def _create_schema(self):
+        with self._writing():
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS chats (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT NOT NULL UNIQUE,
+                    position INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    message_count INTEGER NOT NULL DEFAULT 0
+                )""")
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY,
+                    chat_id INTEGER NOT NULL REFERENCES chats(id) ON DELETE CASCADE,
+                    role TEXT NOT NULL,
+                    content TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    tokens INTEGER,
+                    metrics TEXT
+                )""")
+            self.conn.execute(
+                "CREATE INDEX IF NOT EXISTS messages_by_chat ON messages(chat_id, id)")
+            # Ollama context array per chat, valid while the chat still has
+            # message_count messages and the same model is used
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS chat_contexts (
+                    chat_id INTEGER PRIMARY KEY REFERENCES chats(id) ON DELETE CASCADE,
+                    model TEXT NOT NULL,
+                    context TEXT NOT NULL,
+                    message_count INTEGER NOT NULL
+                )""")
+            # Rolling summary of the first covered_count messages of a chat
+            self.conn.execute("""
+                CREATE TABLE IF NOT EXISTS chat_summaries (
+                    chat_id INTEGER PRIMARY KEY REFERENCES chats(id) ON DELETE CASCADE,
+                    summary TEXT NOT NULL,
+                    covered_count INTEGER NOT NULL,
+                    tokens INTEGER NOT NULL
+                )""")
+
+    def _upgrade_schema(self):
+        """Bring databases written by older versions up to SCHEMA_VERSION"""
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        with self._writing():
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(chats)")]
+            if version < 1 and "message_count" not in columns:
+                self.conn.execute(
+                    "ALTER TABLE chats ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0")
+                self.conn.execute("""
+                    UPDATE chats SET message_count =
+                        (SELECT COUNT(*) FROM messages WHERE messages.chat_id = chats.id)""")
+            columns = [row[1] for row in self.conn.execute("PRAGMA table_info(messages)")]
+            if version < 2 and "tokens" not in columns:
+                self.conn.execute("ALTER TABLE messages ADD COLUMN tokens INTEGER")
+            if version < 3 and "metrics" not in columns:
+                self.conn.execute("ALTER TABLE messages ADD COLUMN metrics TEXT")
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _create_search_index(self) -> bool:
+        """Keep an FTS5 index of message text in sync through triggers
+
+        Returns False if this SQLite build lacks FTS5; search() then falls
+        back to scanning. An index created for an existing database is
+        filled from the messages already stored.
+        """
+        exists = self.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'messages_fts'").fetchone()
+        try:
+            with self._writing():
+                self.conn.execute("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                        content, content='messages', content_rowid='id')""")
+                self.conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+                        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+                    END""")
+                # Also runs for messages removed by deleting their chat
+                self.conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+                        INSERT INTO messages_fts (messages_fts, rowid, content)
+                        VALUES ('delete', old.id, old.content);
+                    END""")
+                self.conn.execute("""
+                    CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN
+                        INSERT INTO messages_fts (messages_fts, rowid, content)
+                        VALUES ('delete', old.id, old.content);
+                        INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+                    END""")
+                if not exists:
+                    self.conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+            return True
+        except sqlite3.OperationalError as e:
+            print(f"Full-text search index unavailable, searching without it: {e}")
+            return False
+
+    def close(self):
+        self.conn.close()
+
+    def migrate_from_json(self, json_path: str) -> bool:
+        """Import a legacy chats.json once, then rename it to *.migrated"""
+        if not os.path.exists(json_path):
+            return False
+        if self.conn.execute("SELECT 1 FROM chats LIMIT 1").fetchone():
+            print(f"Skipping migration of {json_path}: database already has chats")
+            return False
+        try:
+            with open(json_path, "r") as f:
+                chats = json.load(f)
+            with self._writing():
+                for name, messages in chats.items():
+                    self._insert_chat(name, messages)
+            os.replace(json_path, json_path + ".migrated")
+            print(f"Migrated {len(chats)} chats from {json_path} to {self.db_path}")
+            return True
+        except Exception as e:
+            print(f"Error migrating chats from {json_path}: {e}")
+            return False
+
+    @contextmanager
+    def transaction(self):
+        """Hold the write lock for a read-check-write sequence, committing at the end
+
+        Other connections cannot write in between, so what was read is
+        still current when it is acted on. Writes made inside join it.
+        """
+        self.conn.execute("BEGIN IMMEDIATE")
+        self._in_transaction = True
+        try:
+            yield
+        except BaseException:
+            self.conn.rollback()
+            raise
+        else:
+            self.conn.commit()
+        finally:
+            self._in_transaction = False
+
+    @contextmanager
+    def _writing(self):
+        """One write as its own transaction, or as part of transaction()"""
+        if self._in_transaction:
+            yield
+        else:
+            with self.conn:
+                yield
+
+    def data_version(self) -> int:
+        """Changes whenever another connection commits to the database"""
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def load_index(self) -> List[dict]:
+        """Chat names, message counts and modification times in list order"""
+        return [{"name": name, "message_count": count, "updated_at": updated_at}
+                for name, count, updated_at in self.conn.execute(
+                    "SELECT name, message_count, updated_at FROM chats ORDER BY position")]
+
+    def load_entry(self, name: str) -> Optional[dict]:
+        """One chat's entry of load_index(), or None if there is no such chat"""
+        row = self.conn.execute("SELECT message_count, updated_at FROM chats WHERE name = ?",
+                                (name,)).fetchone()
+        return {"name": name, "message_count": row[0], "updated_at": row[1]} if row else None
+
+    def load_message_list(self, name: str) -> MessageList:
+        """Load the messages of one chat into a compact MessageList"""
+        messages = MessageList()
+        for role, content, tokens, metrics, created_at in self.conn.execute("""
+                SELECT role, content, tokens, metrics, created_at FROM messages
+                WHERE chat_id = (SELECT id FROM chats WHERE name = ?)
+                ORDER BY id""", (name,)):
+            messages.add(role, content, tokens, json.loads(metrics) if metrics else None,
+                         created_at)
+        return messages
+
+    def create_chat(self, name: str, messages: Optional[List[dict]] = None):
+        with self._writing():
+            self._insert_chat(name, messages or [])
+
+    def rename_chat(self, old_name: str, new_name: str):
+        with self._writing():
+            self.conn.execute("UPDATE chats SET name = ?, updated_at = ? WHERE name = ?",
+                              (new_name, time.time(), old_name))
+
+    def delete_chat(self, name: str):
+        with self._writing():
+            self.conn.execute("DELETE FROM chats WHERE name = ?", (name,))
+
+    def append_message(self, name: str, message: dict):
+        self.append_messages(name, [message])
+
+    def append_messages(self, name: str, messages: List[dict]):
+        with self._writing():
+            chat_id = self._chat_id(name)
+            if chat_id is None:
+                return
+            self._insert_messages(chat_id, messages)
+
+    def search(self, query: str, limit: int = 50) -> List[dict]:
+        """Messages matching every word of query, best matches first
+
+        Each result has the chat name, the message's index in that chat, its
+        role and a snippet with matches wrapped in HIGHLIGHT_START/END. The
+        last word also matches as a prefix, so results follow typing.
+        Message bodies are never loaded into memory.
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        if not self.has_fts:
+            return self._scan(terms, limit)
+        match = " ".join('"' + term.replace('"', '""') + '"' for term in terms) + "*"
+        rows = self.conn.execute("""
+            SELECT chats.name, messages.role,
+                   (SELECT COUNT(*) FROM messages AS earlier
+                    WHERE earlier.chat_id = messages.chat_id AND earlier.id < messages.id),
+                   snippet(messages_fts, 0, :start, :end, '...', 16)
+            FROM messages_fts
+            JOIN messages ON messages.id = messages_fts.rowid
+            JOIN chats ON chats.id = messages.chat_id
+            WHERE messages_fts MATCH :match AND messages_fts.rowid >= COALESCE(
+                (SELECT rowid FROM messages_fts WHERE messages_fts MATCH :match
+                 ORDER BY rowid DESC LIMIT 1 OFFSET :candidates), 0)
+            ORDER BY rank LIMIT :limit""", {"start": HIGHLIGHT_START, "end": HIGHLIGHT_END,
+                                            "match": match, "candidates": RANK_CANDIDATES - 1,
+                                            "limit": limit})
+        return [{"chat": name, "index": index, "role": role, "snippet": snippet}
+                for name, role, index, snippet in rows]
+
+    def _scan(self, terms: List[str], limit: int) -> List[dict]:
+        """search() without FTS5: a LIKE scan, newest messages first"""
+        condition = " AND ".join(["messages.content LIKE ? ESCAPE '\\'"] * len(terms))
+        patterns = ["%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+                    for term in terms]
+        rows = self.conn.execute(f"""
+            SELECT chats.name, messages.role,
+                   (SELECT COUNT(*) FROM messages AS earlier
+                    WHERE earlier.chat_id = messages.chat_id AND earlier.id < messages.id),
+                   messages.content
+            FROM messages JOIN chats ON chats.id = messages.chat_id
+            WHERE {condition}
+            ORDER BY messages.id DESC LIMIT ?""", (*patterns, limit))
+        results = []
+        for name, role, index, content in rows:
+            lowered = content.lower()
+            start = max(0, lowered.find(terms[0].lower()) - 60)
+            snippet = content[start:start + 160]
+            for term in terms:
+                position = snippet.lower().find(term.lower())
+                if position >= 0:
+                    snippet = (snippet[:position] + HIGHLIGHT_START +
+                               snippet[position:position + len(term)] + HIGHLIGHT_END +
+                               snippet[position + len(term):])
+            results.append({"chat": name, "index": index, "role": role,
+                            "snippet": ("..." if start else "") + snippet})
+        return results
+
+    def load_context(self, name: str) -> Optional[dict]:
+        """The cached Ollama context of a chat, with the model and message count it covers"""
+        row = self.conn.execute("""
+            SELECT model, context, message_count FROM chat_contexts
+            WHERE chat_id = (SELECT id FROM chats WHERE name = ?)""", (name,)).fetchone()
+        if not row:
+            return None
+        return {"model": row[0], "context": json.loads(row[1]), "message_count": row[2]}
+
+    def save_context(self, name: str, model: str, context: List[int], message_count: int):
+        with self._writing():
+            chat_id = self._chat_id(name)
+            if chat_id is None:
+                return
+            self.conn.execute(
+                "INSERT OR REPLACE INTO chat_contexts (chat_id, model, context, message_count) "
+                "VALUES (?, ?, ?, ?)",
+                (chat_id, model, json.dumps(context), message_count))
+
+    def load_summary(self, name: str) -> Optional[dict]:
+        """The rolling summary of a chat and how many leading messages it covers"""
+        row = self.conn.execute("""
+            SELECT summary, covered_count, tokens FROM chat_summaries
+            WHERE chat_id = (SELECT id FROM chats WHERE name = ?)""", (name,)).fetchone()
+        if not row:
+            return None
+        return {"summary": row[0], "covered_count": row[1], "tokens": row[2]}
+
+    def save_summary(self, name: str, summary: str, covered_count: int, tokens: int):
+        with self._writing():
+            chat_id = self._chat_id(name)
+            if chat_id is None:
+                return
+            self.conn.execute(
+                "INSERT OR REPLACE INTO chat_summaries (chat_id, summary, covered_count, tokens) "
+                "VALUES (?, ?, ?, ?)",
+                (chat_id, summary, covered_count, tokens))
+
+    def _chat_id(self, name: str) -> Optional[int]:
+        row = self.conn.execute("SELECT id FROM chats WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def _insert_chat(self, name: str, messages: List[dict]):
+        now = time.time()
+        position = self.conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM chats").fetchone()[0]
+        cursor = self.conn.execute(
+            "INSERT INTO chats (name, position, created_at, updated_at) VALUES (?, ?, ?, ?)",
+            (name, position, now, now))
+        self._insert_messages(cursor.lastrowid, messages)
+
+    def _insert_messages(self, chat_id: int, messages: List[dict]):
+        now = time.time()
+        self.conn.executemany(
+            "INSERT INTO messages (chat_id, role, content, created_at, tokens, metrics) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(chat_id, m.get("role", "unknown"), m.get("content", ""), now, m.get("tokens"),
+              json.dumps(m["metrics"]) if m.get("metrics") else None)
+             for m in messages])
+        self.conn.execute(
+            "UPDATE chats SET message_count = message_count + ?, updated_at = ? WHERE id = ?",
+            (len(messages), now, chat_id))
+
+
+class ChatCache(Mapping):
+    """Read-through view of stored chats with an LRU bound on loaded bodies
+
+    Only the chat index is read at startup. Iterating yields chat names in
+    list order without touching message bodies; indexing loads a chat's
+    messages on demand into a compact MessageList. At most max_loaded bodies stay in memory, least
+    recently used first out, except chats that are pinned (the one on
+    screen). All changes go through the mutators so storage stays in sync.
+    """
+
+    def __init__(self, storage: StorageManager, max_loaded: int = 20):
+        self.storage = storage
+        self.max_loaded = max_loaded
+        self.index: "OrderedDict[str, dict]" = OrderedDict(
+            (row["name"], row) for row in storage.load_index())
+        self._bodies: "OrderedDict[str, MessageList]" = OrderedDict()
+        self._pinned = set()
+
+    def __getitem__(self, name: str) -> MessageList:
+        if name not in self.index:
+            raise KeyError(name)
+        body = self._bodies.get(name)
+        if body is None:
+            body = self.storage.load_message_list(name)
+            self._bodies[name] = body
+            self._evict()
+        else:
+            self._bodies.move_to_end(name)
+        return body
+
+    def __contains__(self, name) -> bool:
+        return name in self.index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.index)
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def pin(self, name: str):
+        self._pinned.add(name)
+
+    def unpin(self, name: str):
+        self._pinned.discard(name)
+        self._evict()
+
+    def set_max_loaded(self, max_loaded: int):
+        self.max_loaded = max_loaded
+        self._evict()
+
+    def create(self, name: str, messages: Optional[List[dict]] = None):
+        messages = list(messages or [])
+        self.storage.create_chat(name, messages)
+        self.index[name] = {"name": name, "message_count": len(messages),
+                            "updated_at": time.time()}
+
+    def refresh(self, name: str):
+        """Re-read one chat that another connection created or changed"""
+        entry = self.storage.load_entry(name)
+        self._bodies.pop(name, None)
+        if entry is None:
+            self.index.pop(name, None)
+        else:
+            self.index[name] = entry
+
+    def reload(self, names: Iterable[str] = ()):
+        """Re-read the index after another connection changed the database
+
+        Loaded bodies of names are dropped so they are read again on use.
+        """
+        self.index = OrderedDict((row["name"], row) for row in self.storage.load_index())
+        for name in names:
+            self._bodies.pop(name, None)
+        for name in list(self._bodies):
+            if name not in self.index:
+                del self._bodies[name]
+
+    def append_message(self, name: str, message: dict):
+        """Persist message; a chat that is not loaded stays unloaded"""
+        if name not in self.index:
+            return
+        self.storage.append_message(name, message)
+        if name in self._bodies:
+            self._bodies[name].append(message)
+        entry = self.index[name]
+        entry["message_count"] += 1
+        entry["updated_at"] = time.time()
+
+    def context_for(self, name: str, model: str) -> Optional[List[int]]:
+        """The cached context of name if it still covers every message, for model"""
+        cached = self.storage.load_context(name)
+        entry = self.index.get(name)
+        if not cached or not entry or cached["model"] != model:
+            return None
+        # The new user message has already been appended when this is asked
+        if cached["message_count"] != entry["message_count"] - 1:
+            return None
+        return cached["context"]
+
+    def save_context(self, name: str, model: str, context: List[int]):
+        """Remember context as covering every message name currently has"""
+        entry = self.index.get(name)
+        if entry:
+            self.storage.save_context(name, model, context, entry["message_count"])
+
+    def rename(self, old_name: str, new_name: str):
+        self.storage.rename_chat(old_name, new_name)
+        self.index = OrderedDict(
+            (new_name if name == old_name else name, entry) for name, entry in self.index.items())
+        self.index[new_name]["name"] = new_name
+        if old_name in self._bodies:
+            self._bodies[new_name] = self._bodies.pop(old_name)
+        if old_name in self._pinned:
+            self._pinned.discard(old_name)
+            self._pinned.add(new_name)
+
+    def delete(self, name: str):
+        self.storage.delete_chat(name)
+        self.index.pop(name, None)
+        self._bodies.pop(name, None)
+        self._pinned.discard(name)
+
+    def _evict(self):
+        excess = len(self._bodies) - self.max_loaded
+        if excess <= 0:
+            return
+        for name in list(self._bodies):
+            if excess <= 0:
+                break
+            if name not in self._pinned:
+                del self._bodies[name]
+                excess -= 1
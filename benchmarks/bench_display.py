@@ -0,0 +1,86 @@
+"""Measure the cost of adding one message to the chat display
+
+Runs the real MainWindow offscreen and reports the mean time of
+update_chat_content() at increasing chat lengths. With append-only
+rendering the per-append cost should stay flat as the chat grows;
+--full-render times the old clear-and-redraw path for comparison.
+
+    python benchmarks/bench_display.py --sizes 100 500 1000 5000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtWidgets import QApplication
+
+
+def make_message(index):
+    role = "user" if index % 2 == 0 else "assistant"
+    return {"role": role, "content": f"Message {index} " + "lorem ipsum dolor sit amet " * 8}
+
+
+def bench_append(window, sizes, samples, full_render):
+    """Time samples appends starting at each chat length in sizes
+
+    Appends are kept (they are stored like any other message), so each
+    size's samples run at that length plus up to samples messages.
+    """
+    results = []
+    window.create_new_chat()
+    name = window.current_chat
+    window.chat_manager.auto_save = False
+
+    for size in sorted(sizes):
+        # Grow the chat to the target length through storage, untimed
+        count = len(window.chats[name])
+        if count < size:
+            window.storage.append_messages(name, [make_message(i) for i in range(count, size)])
+            window.chats.reload([name])
+        window.display_chat()
+
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            window.update_chat_content(make_message(len(window.chats[name])))
+            if full_render:
+                window.display_chat()
+            timings.append(time.perf_counter() - start)
+
+        results.append({
+            "messages": size,
+            "mean_ms": sum(timings) / len(timings) * 1000,
+            "max_ms": max(timings) * 1000,
+        })
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 500, 1000, 2000])
+    parser.add_argument("--samples", type=int, default=20)
+    parser.add_argument("--full-render", action="store_true",
+                        help="re-render the whole chat after each append")
+    args = parser.parse_args(argv)
+
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    # Keep chats.db and settings.json out of the working tree
+    os.chdir(tempfile.mkdtemp(prefix="ghost-writer-bench-"))
+    from Main import MainWindow
+    window = MainWindow()
+
+    results = bench_append(window, args.sizes, args.samples, args.full_render)
+    print(json.dumps({"benchmark": "display_append", "full_render": args.full_render,
+                      "results": results}, indent=2))
+    window.close()
+    return results
+
+
+if __name__ == "__main__":
+    main()
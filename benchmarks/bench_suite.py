@@ -0,0 +1,468 @@
+"""Run Ghost Writer's benchmark suite and write the results as JSON
+
+Measures the application's own overhead, separately from model time, by
+driving the real code against a local fake Ollama server (fake_ollama.py)
+and synthetic chat histories:
+
+  api         APIManager streaming: time to first token and total time
+              beyond what the fake server scripts, client-side token
+              throughput, and concurrent streams
+  render      MainWindow (offscreen Qt): full re-render of a chat, the
+              cost of appending one message to it, rendering the same
+              chat with Markdown replies with and without their HTML
+              cached, and each refresh while such a reply streams in
+  storage     chat history: saving and loading every chat, reopening the
+              index, single appends, MainWindow.load_chats and the legacy
+              JSON export/migration
+  transcript  ChatManager auto-save: full transcript writes and appends
+  memory      chat bodies in memory: bytes per message as one dict per
+              message (the old layout) and as a MessageList, and the time
+              to load a chat from storage into a MessageList
+  archive     chat import/export: exporting every chat (plain and gzip),
+              importing into an empty history, re-importing the same
+              archive (all duplicates) and merging a second machine's
+              archive whose chats continue or diverge from the first
+
+    python benchmarks/bench_suite.py --sizes 10000 100000 1000000 --output results.json
+
+Sizes are total messages in the synthetic history. Rendering very large
+chats in a QTextEdit takes minutes, so render only runs sizes up to
+--render-max.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_ollama import FakeOllama
+
+GROUPS = ("api", "render", "storage", "transcript", "memory", "archive")
+MODEL = "bench-model"
+
+
+def synthetic_messages(count, chars=120, start=0):
+    """count alternating user/assistant messages of roughly chars characters"""
+    filler = ("lorem ipsum dolor sit amet " * (chars // 27 + 1))[:chars]
+    return [{"role": "user" if i % 2 == 0 else "assistant", "content": f"{i} {filler}"}
+            for i in range(start, start + count)]
+
+
+# Streamed by the render group, a few characters per refresh
+STREAM_REPLY = "\n\n".join(
+    f"Step {n}: call `run()` with **care**.\n\n```python\ndef step_{n}(x):\n"
+    f"    return x * {n}  # scale\n```" for n in range(20))
+
+
+def summarize(samples):
+    """Mean, median, p95 and max of a list of seconds, in milliseconds"""
+    ordered = sorted(samples)
+    return {
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def stream_once(api_manager, prompt):
+    """Stream one response; returns (time to first token, total time, chunks)"""
+    start = time.perf_counter()
+    first = None
+    chunks = 0
+    for chunk in api_manager.stream_response(prompt, model=MODEL):
+        if chunk.get("error"):
+            raise RuntimeError(chunk["response"])
+        if first is None and chunk.get("response"):
+            first = time.perf_counter() - start
+        chunks += 1
+    return first or 0.0, time.perf_counter() - start, chunks
+
+
+def bench_api(args):
+    from APIManager import APIManager
+    results = {}
+
+    # Latency overhead: everything beyond the scripted first-token delay and rate
+    with FakeOllama(latency=args.latency, tokens_per_second=args.tokens_per_second,
+                    response_tokens=args.response_tokens, models=[MODEL]) as server:
+        api_manager = APIManager()
+        api_manager.base_url = server.url
+        stream_once(api_manager, "warm up")
+        ttft, totals = [], []
+        for i in range(args.requests):
+            first, total, _ = stream_once(api_manager, f"prompt {i}")
+            ttft.append(max(0.0, first - server.latency))
+            totals.append(max(0.0, total - server.scripted_seconds(args.response_tokens)))
+        results["latency_overhead"] = {
+            "requests": args.requests, "server_latency_ms": args.latency * 1000,
+            "server_tokens_per_second": args.tokens_per_second,
+            "first_token_overhead": summarize(ttft), "total_overhead": summarize(totals)}
+
+        # Concurrent streams should take about as long as one
+        threads = [threading.Thread(target=stream_once, args=(api_manager, f"concurrent {i}"))
+                   for i in range(args.concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        wall = time.perf_counter() - start
+        results["concurrent"] = {
+            "streams": args.concurrency, "wall_ms": wall * 1000,
+            "scripted_ms": server.scripted_seconds(args.response_tokens) * 1000}
+        api_manager.close()
+
+    # Client throughput: the server streams as fast as it can
+    with FakeOllama(tokens_per_second=0, response_tokens=args.throughput_tokens,
+                    models=[MODEL]) as server:
+        api_manager = APIManager()
+        api_manager.base_url = server.url
+        stream_once(api_manager, "warm up")
+        rates = []
+        for i in range(max(1, args.requests // 4)):
+            _, total, chunks = stream_once(api_manager, f"throughput {i}")
+            rates.append(chunks / total)
+        results["throughput"] = {"tokens_per_response": args.throughput_tokens,
+                                 "chunks_per_second": statistics.fmean(rates)}
+        api_manager.close()
+    return results
+
+
+def bench_render(args, app):
+    from Main import MainWindow
+    results = []
+    for size in args.sizes:
+        if size > args.render_max:
+            results.append({"messages": size, "skipped": f"larger than --render-max {args.render_max}"})
+            continue
+        with temporary_cwd():
+            window = MainWindow()
+            window.create_new_chat()
+            window.chat_manager.auto_save = False
+            # Fill the chat in one transaction; storage is measured separately
+            window.storage.append_messages(window.current_chat,
+                                           synthetic_messages(size, args.message_chars))
+            window.chats.reload([window.current_chat])
+            window.chats[window.current_chat]  # Load it before timing
+            render, _ = timed(window.display_chat)
+            appends = []
+            for i in range(args.samples):
+                seconds, _ = timed(window.update_chat_content,
+                                   synthetic_messages(1, args.message_chars, size + i)[0])
+                appends.append(seconds)
+            # A chat of the same size with every reply in Markdown with a code block
+            window.create_new_chat()
+            window.storage.append_messages(window.current_chat, [
+                dict(message, content=f"Reply **{i}**:\n\n```python\nprint({i})  # done\n```")
+                if message["role"] == "assistant" else message
+                for i, message in enumerate(synthetic_messages(size, args.message_chars))])
+            window.chats.reload([window.current_chat])
+            window.chats[window.current_chat]  # Load it before timing
+            markdown, _ = timed(window.display_chat)
+            cached, _ = timed(window.display_chat)
+            # Stream a reply by replacing what the generation manager reports
+            partial = [""]
+            window.generation_manager.partial_response = lambda chat: partial[0]
+            refreshes = []
+            for end in range(0, len(STREAM_REPLY) + 1, 4):
+                partial[0] = STREAM_REPLY[:end]
+                seconds, _ = timed(window.refresh_partial_response)
+                refreshes.append(seconds)
+            window.clear_partial_response()
+            results.append({"messages": size, "full_render_ms": render * 1000,
+                            "append": summarize(appends), "markdown_render_ms": markdown * 1000,
+                            "markdown_cached_render_ms": cached * 1000,
+                            "stream_refresh": summarize(refreshes)})
+            window.close()
+            app.processEvents()
+    return results
+
+
+def bench_storage(args, app):
+    from StorageManager import StorageManager, ChatCache
+    results = []
+    for size in args.sizes:
+        with temporary_cwd():
+            chats = {f"Chat {n + 1}": synthetic_messages(min(args.chat_size, size - start),
+                                                         args.message_chars, start)
+                     for n, start in enumerate(range(0, size, args.chat_size))}
+            result = {"messages": size, "chats": len(chats)}
+
+            def save_all():
+                storage = StorageManager()
+                for name, messages in chats.items():
+                    storage.create_chat(name, messages)
+                storage.close()
+
+            def open_index():
+                storage = StorageManager()
+                return storage, ChatCache(storage)
+
+            def load_all():
+                for name in cache:
+                    storage.load_message_list(name)
+
+            seconds, _ = timed(save_all)
+            result["save_all_ms"] = seconds * 1000
+            seconds, (storage, cache) = timed(open_index)
+            result["open_index_ms"] = seconds * 1000
+            seconds, _ = timed(load_all)
+            result["load_all_ms"] = seconds * 1000
+            appends = []
+            name = next(iter(cache))
+            for i in range(args.samples):
+                seconds, _ = timed(storage.append_message, name,
+                                   synthetic_messages(1, args.message_chars, size + i)[0])
+                appends.append(seconds)
+            result["append"] = summarize(appends)
+            storage.close()
+
+            # Startup with this history: the window fills its list and shows the first chat
+            from Main import MainWindow
+            window = MainWindow()
+            seconds, _ = timed(window.load_chats)
+            result["window_load_chats_ms"] = seconds * 1000
+            window.close()
+            app.processEvents()
+
+            # The original format: one JSON file holding every chat
+            seconds, _ = timed(write_json, "chats.json", chats)
+            result["json_export_ms"] = seconds * 1000
+            os.remove("chats.db")
+            for suffix in ("-wal", "-shm"):
+                if os.path.exists("chats.db" + suffix):
+                    os.remove("chats.db" + suffix)
+            seconds, storage = timed(StorageManager)
+            result["json_migrate_ms"] = seconds * 1000
+            storage.close()
+            results.append(result)
+    return results
+
+
+def bench_transcript(args):
+    from ChatManager import ChatManager
+    results = []
+    for size in args.sizes:
+        with temporary_cwd() as directory:
+            chat_manager = ChatManager()
+            chat_manager.set_auto_save(True, directory)
+            messages = synthetic_messages(size, args.message_chars)
+
+            def full_save():
+                content = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+                chat_manager.save_chat("bench", content)
+                chat_manager.flush(timeout=600)
+
+            seconds, _ = timed(full_save)
+            result = {"messages": size, "full_save_ms": seconds * 1000,
+                      "bytes": os.path.getsize(chat_manager.transcript_path("bench"))}
+
+            def appends():
+                for message in synthetic_messages(args.samples, args.message_chars, size):
+                    chat_manager.append_message("bench", message)
+                chat_manager.flush(timeout=600)
+
+            seconds, _ = timed(appends)
+            result["append_batch"] = {"messages": args.samples, "total_ms": seconds * 1000}
+            chat_manager.close()
+            results.append(result)
+    return results
+
+
+def bench_memory(args):
+    from MessageStore import MessageList
+    from StorageManager import StorageManager
+    results = []
+    for size in args.sizes:
+        # Replies carry a token count and metrics, as stored by the application
+        messages = synthetic_messages(size, args.message_chars)
+        for message in messages[1::2]:
+            message["tokens"] = 42
+            message["metrics"] = {"ttft_ms": 120.0, "tokens_per_second": 35.2,
+                                  "eval_count": 42, "prompt_eval_count": 17}
+        contents = [m["content"] for m in messages]
+        result = {"messages": size,
+                  "content_bytes": sum(sys.getsizeof(c) for c in contents)}
+
+        # Only the per-message structure is measured; both layouts share
+        # the content strings and metrics dicts built above
+        def dicts():
+            return [{key: value for key, value in m.items()} for m in messages]
+
+        for key, build in (("dicts", dicts), ("message_list", lambda: MessageList(messages))):
+            tracemalloc.start()
+            layout = build()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            result[f"{key}_bytes_per_message"] = current / size
+            result[f"{key}_peak_bytes"] = peak
+            del layout
+
+        with temporary_cwd():
+            storage = StorageManager()
+            storage.create_chat("bench", messages)
+            seconds, _ = timed(storage.load_message_list, "bench")
+            result["load_message_list_ms"] = seconds * 1000
+            storage.close()
+        results.append(result)
+    return results
+
+
+def bench_archive(args):
+    from StorageManager import StorageManager
+    from ArchiveManager import export_archive, import_archive
+    results = []
+    for size in args.sizes:
+        with temporary_cwd():
+            starts = range(0, size, args.chat_size)
+            chats = {f"Chat {n + 1}": synthetic_messages(min(args.chat_size, size - start),
+                                                         args.message_chars, start)
+                     for n, start in enumerate(starts)}
+            # The same history on another machine: a third of the chats
+            # went on there and a third were rewritten
+            other = {}
+            for n, (name, messages) in enumerate(chats.items()):
+                if n % 3 == 1:
+                    messages = messages + synthetic_messages(10, args.message_chars, size + n * 10)
+                elif n % 3 == 2:
+                    messages = synthetic_messages(len(messages), args.message_chars,
+                                                  2 * size + n * args.chat_size)
+                other[name] = messages
+            write_json("other.json", other)
+            source = StorageManager("source.db", legacy_json_path="")
+            for name, messages in chats.items():
+                source.create_chat(name, messages)
+            result = {"messages": size, "chats": len(chats)}
+
+            seconds, _ = timed(export_archive, source, "chats.json")
+            result["export_ms"] = seconds * 1000
+            seconds, _ = timed(export_archive, source, "chats.json.gz")
+            result["export_gzip_ms"] = seconds * 1000
+            result["bytes"] = os.path.getsize("chats.json")
+            result["gzip_bytes"] = os.path.getsize("chats.json.gz")
+            source.close()
+
+            storage = StorageManager("target.db", legacy_json_path="")
+            for key, path in (("import_ms", "chats.json"), ("reimport_ms", "chats.json.gz"),
+                              ("merge_ms", "other.json")):
+                seconds, actions = timed(lambda p: [a for a, _ in import_archive(storage, p)],
+                                         path)
+                result[key] = seconds * 1000
+                result[key.replace("_ms", "_actions")] = {
+                    action: actions.count(action) for action in sorted(set(actions))}
+            storage.close()
+            results.append(result)
+    return results
+
+
+def write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+@contextlib.contextmanager
+def temporary_cwd():
+    """Run in a fresh directory so chats.db and settings.json stay out of the tree"""
+    previous = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="ghost-writer-bench-") as directory:
+        os.chdir(directory)
+        try:
+            yield directory
+        finally:
+            os.chdir(previous)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", nargs="+", choices=GROUPS, default=list(GROUPS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000],
+                        help="total messages in each synthetic history")
+    parser.add_argument("--render-max", type=int, default=20000,
+                        help="largest history rendered in the chat display")
+    parser.add_argument("--chat-size", type=int, default=1000,
+                        help="messages per chat in the storage benchmark")
+    parser.add_argument("--message-chars", type=int, default=120)
+    parser.add_argument("--samples", type=int, default=50,
+                        help="appends timed per size")
+    parser.add_argument("--requests", type=int, default=20,
+                        help="generations timed in the api benchmark")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="fake server first-token delay in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=500)
+    parser.add_argument("--response-tokens", type=int, default=64)
+    parser.add_argument("--throughput-tokens", type=int, default=2000)
+    parser.add_argument("--output", help="write JSON here instead of standard output")
+    args = parser.parse_args(argv)
+
+    from PyQt5.QtWidgets import QApplication
+    app = QApplication.instance() or QApplication(sys.argv[:1])
+
+    results = {}
+    # The application's debug prints would corrupt JSON on standard output
+    with contextlib.redirect_stdout(sys.stderr):
+        for group in GROUPS:
+            if group not in args.only:
+                continue
+            print(f"Running {group} benchmarks...")
+            start = time.perf_counter()
+            if group == "api":
+                results[group] = bench_api(args)
+            elif group == "render":
+                results[group] = bench_render(args, app)
+            elif group == "storage":
+                results[group] = bench_storage(args, app)
+            elif group == "transcript":
+                results[group] = bench_transcript(args)
+            elif group == "memory":
+                results[group] = bench_memory(args)
+            else:
+                results[group] = bench_archive(args)
+            print(f"  done in {time.perf_counter() - start:.1f} s")
+
+    report = {
+        "suite": "ghost-writer",
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": vars(args),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
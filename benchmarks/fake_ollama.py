@@ -0,0 +1,309 @@
+"""Local stand-in for the Ollama HTTP API with scripted timing
+
+Implements the endpoints Ghost Writer uses (/api/generate, /api/chat,
+/api/tags, /api/show, /api/pull, /api/delete) closely enough to drive the
+real client code, while the first-token latency, token rate, response
+length and model load time are fixed. Subtracting the scripted time from
+a measurement leaves Ghost Writer's own overhead.
+
+Use it from a benchmark:
+
+    with FakeOllama(latency=0.05, tokens_per_second=200) as server:
+        api_manager.base_url = server.url
+
+or run it on its own to point the application at it:
+
+    python benchmarks/fake_ollama.py --port 11434 --tokens-per-second 50
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit")
+
+
+class FakeOllama:
+    """Threaded fake Ollama server; see the module docstring
+
+    latency is the delay before the first token, tokens_per_second the
+    streaming rate (0 streams as fast as possible) and response_tokens the
+    length of every response unless the request sets options.num_predict.
+    A model's first request (or a preload) also waits load_time seconds.
+    Pulls stream pull_chunks progress updates, pull_interval seconds apart.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 tokens_per_second: float = 0.0, response_tokens: int = 64,
+                 load_time: float = 0.0, models=("bench-model",), pull_chunks: int = 10,
+                 pull_interval: float = 0.0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.response_tokens = response_tokens
+        self.load_time = load_time
+        self.pull_chunks = pull_chunks
+        self.pull_interval = pull_interval
+        self.models = {name: self._model_entry(name) for name in models}
+        self.loaded = set()
+        self.requests = {}  # path -> number of requests served
+        self.disconnects = 0  # Generations the client closed before the end
+        self._lock = threading.Lock()
+
+        handler = type("Handler", (_Handler,), {"fake": self})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def start(self) -> "FakeOllama":
+        self._thread = threading.Thread(target=self.httpd.serve_forever,
+                                        name="FakeOllama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self) -> "FakeOllama":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def scripted_seconds(self, tokens: int) -> float:
+        """Time a warm generation of tokens tokens spends waiting on the script"""
+        rate = self.tokens_per_second
+        # The first token goes out right after the latency
+        return self.latency + (max(0, tokens - 1) / rate if rate else 0.0)
+
+    @staticmethod
+    def _model_entry(name: str) -> dict:
+        full_name = name if ":" in name else f"{name}:latest"
+        return {"name": full_name, "model": full_name, "size": 1,
+                "digest": hashlib.sha256(full_name.encode("utf-8")).hexdigest(),
+                "details": {"family": "llama", "parameter_size": "1B"}}
+
+    def _find(self, name: str):
+        for entry in list(self.models.values()):
+            if name in (entry["name"], entry["name"].split(":")[0]):
+                return entry
+        return None
+
+    def _count(self, path: str):
+        with self._lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def _load(self, name: str) -> float:
+        """Simulate loading name; returns the load time paid by this request"""
+        with self._lock:
+            if name in self.loaded:
+                return 0.0
+            self.loaded.add(name)
+        time.sleep(self.load_time)
+        return self.load_time
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    fake: FakeOllama = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.fake._count(self.path)
+        if self.path == "/api/tags":
+            self._send_json({"models": list(self.fake.models.values())})
+        elif self.path == "/api/ps":
+            loaded = [self.fake._find(name) for name in list(self.fake.loaded)]
+            self._send_json({"models": [entry for entry in loaded if entry]})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_DELETE(self):
+        self.fake._count(self.path)
+        body = self._read_json()
+        entry = self.fake._find(body.get("model", body.get("name", "")))
+        if self.path != "/api/delete" or entry is None:
+            self._send_json({"error": "model not found"}, 404)
+            return
+        with self.fake._lock:
+            self.fake.models = {k: v for k, v in self.fake.models.items() if v is not entry}
+        self._send_json({})
+
+    def do_POST(self):
+        self.fake._count(self.path)
+        body = self._read_json()
+        if self.path in ("/api/generate", "/api/chat"):
+            try:
+                self._generate(body, chat=self.path == "/api/chat")
+            except (BrokenPipeError, ConnectionResetError):
+                with self.fake._lock:
+                    self.fake.disconnects += 1  # The client stopped the generation
+        elif self.path == "/api/show":
+            entry = self.fake._find(body.get("model", body.get("name", "")))
+            if entry is None:
+                self._send_json({"error": "model not found"}, 404)
+            else:
+                self._send_json({"details": entry["details"],
+                                 "model_info": {"llama.context_length": 4096}})
+        elif self.path == "/api/pull":
+            self._pull(body)
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def _generate(self, body: dict, chat: bool):
+        fake = self.fake
+        name = body.get("model", "")
+        if fake._find(name) is None:
+            self._send_json({"error": f"model '{name}' not found"}, 404)
+            return
+        start = time.perf_counter()
+        load_seconds = fake._load(name)
+        prompt = body.get("prompt", "") if not chat else " ".join(
+            m.get("content", "") for m in body.get("messages", []))
+
+        # A request without a prompt (or messages) only loads the model
+        if not prompt and not body.get("messages"):
+            self._send_json({"model": name, "response": "", "done": True,
+                             "done_reason": "load", "load_duration": int(load_seconds * 1e9)})
+            return
+
+        stream = body.get("stream", True)
+        tokens = body.get("options", {}).get("num_predict") or fake.response_tokens
+        time.sleep(fake.latency)
+        eval_start = time.perf_counter()
+        rate = fake.tokens_per_second
+        pieces = []
+        if stream:
+            self._start_stream()
+        for i in range(tokens):
+            if rate:
+                delay = eval_start + i / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            piece = ("" if i == 0 else " ") + WORDS[i % len(WORDS)]
+            pieces.append(piece)
+            if stream:
+                self._write_line(self._chunk(name, piece, chat, done=False))
+        eval_seconds = time.perf_counter() - eval_start
+
+        final = self._chunk(name, "" if stream else "".join(pieces), chat, done=True)
+        final.update({
+            "done_reason": "stop",
+            "total_duration": int((time.perf_counter() - start) * 1e9),
+            "load_duration": int(load_seconds * 1e9),
+            "prompt_eval_count": max(1, len(prompt) // 4),
+            "prompt_eval_duration": 1000000,
+            "eval_count": tokens,
+            "eval_duration": int(eval_seconds * 1e9),
+        })
+        if not chat:
+            final["context"] = list(body.get("context") or []) + list(range(tokens))
+        if stream:
+            self._write_line(final)
+            self._end_stream()
+        else:
+            self._send_json(final)
+
+    def _pull(self, body: dict):
+        fake = self.fake
+        name = body.get("model", body.get("name", ""))
+        if not name:
+            self._send_json({"error": "missing model name"}, 400)
+            return
+        entry = fake._model_entry(name)
+        total = fake.pull_chunks * 1024 * 1024
+        self._start_stream()
+        try:
+            self._write_line({"status": "pulling manifest"})
+            for i in range(fake.pull_chunks + 1):
+                if i:
+                    time.sleep(fake.pull_interval)
+                self._write_line({"status": f"pulling {entry['digest'][:12]}",
+                                  "digest": f"sha256:{entry['digest']}", "total": total,
+                                  "completed": total * i // max(1, fake.pull_chunks)})
+            for status in ("verifying sha256 digest", "writing manifest", "success"):
+                self._write_line({"status": status})
+            self._end_stream()
+        except (BrokenPipeError, ConnectionResetError):
+            return  # The client cancelled the pull
+        with fake._lock:
+            fake.models[name] = entry
+
+    @staticmethod
+    def _chunk(model: str, text: str, chat: bool, done: bool) -> dict:
+        chunk = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ"), "done": done}
+        if chat:
+            chunk["message"] = {"role": "assistant", "content": text}
+        else:
+            chunk["response"] = text
+        return chunk
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        data = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(data or b"{}")
+        except ValueError:
+            return {}
+
+    def _send_json(self, obj: dict, status: int = 200):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _start_stream(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_line(self, obj: dict):
+        data = (json.dumps(obj) + "\n").encode("utf-8")
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        self.wfile.flush()
+
+    def _end_stream(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0,
+                        help="streaming rate; 0 streams as fast as possible")
+    parser.add_argument("--response-tokens", type=int, default=64)
+    parser.add_argument("--load-time", type=float, default=0.0,
+                        help="seconds the first request to each model waits")
+    parser.add_argument("--models", nargs="+", default=["llama2-uncensored", "bench-model"])
+    args = parser.parse_args(argv)
+
+    server = FakeOllama(args.host, args.port, args.latency, args.tokens_per_second,
+                        args.response_tokens, args.load_time, args.models,
+                        pull_interval=0.2)
+    print(f"Fake Ollama listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+
+
+if __name__ == "__main__":
+    main()
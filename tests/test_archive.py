@@ -0,0 +1,107 @@
+import io
+import json
+
+import pytest
+
+from ArchiveManager import (export_archive, import_archive, iter_archive, open_archive,
+                            write_archive)
+from StorageManager import StorageManager
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def reply(text):
+    return {"role": "assistant", "content": text}
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = StorageManager(str(tmp_path / "chats.db"), legacy_json_path="")
+    yield storage
+    storage.close()
+
+
+def write(path, chats):
+    stream, raw = open_archive(str(path), "w")
+    write_archive(stream, chats.items())
+    stream.close()
+    raw.close()
+    return str(path)
+
+
+def test_iter_archive_reads_chats_one_at_a_time_across_buffer_refills():
+    chats = {"plain": [user("hi")],
+             'quo"ted é': [user("{not: a brace}"), reply("a\nb \\ ☃" * 3000)],
+             "empty": []}
+    text = json.dumps(chats, indent=2)
+    assert list(iter_archive(io.StringIO(text))) == list(chats.items())
+
+
+@pytest.mark.parametrize("text", ["[]", '{"a": [] "b": []}', '{"a": []'])
+def test_iter_archive_rejects_malformed_archives(text):
+    with pytest.raises(ValueError):
+        list(iter_archive(io.StringIO(text)))
+
+
+def test_gzip_archive_round_trip(storage, tmp_path):
+    storage.create_chat("Chat 1", [user("hi"), dict(reply("hello"), tokens=3,
+                                                    metrics={"ttft_ms": 12.5})])
+    path = str(tmp_path / "backup.json.gz")
+    assert export_archive(storage, path) == 1
+    with open(path, "rb") as f:
+        assert f.read(2) == b"\x1f\x8b"
+    stream, raw = open_archive(path, "r")
+    try:
+        assert list(iter_archive(stream)) == [("Chat 1", [
+            user("hi"), {"role": "assistant", "content": "hello", "tokens": 3,
+                         "metrics": {"ttft_ms": 12.5}}])]
+    finally:
+        stream.close()
+        raw.close()
+
+
+def test_import_merges_by_content(storage, tmp_path):
+    storage.create_chat("Chat 1", [user("a"), reply("b")])
+    storage.create_chat("Chat 2", [user("c")])
+    path = write(tmp_path / "backup.json", {
+        "Chat 1": [user("a"), reply("b"), user("more")],  # continues Chat 1
+        "Chat 2": [user("different")],                    # same name, other content
+        "Renamed": [user("c")],                           # Chat 2 under another name
+        "Chat 3": [user("new")],
+    })
+    assert list(import_archive(storage, path)) == [
+        ("extended", "Chat 1"), ("renamed", "Chat 2 (2)"), ("skipped", "Chat 2"),
+        ("added", "Chat 3")]
+    assert [m["content"] for m in storage.load_message_list("Chat 1")] == ["a", "b", "more"]
+    # Importing the same archive again changes nothing
+    assert {action for action, _ in import_archive(storage, path)} == {"skipped"}
+    assert len(storage.load_index()) == 4
+
+
+def test_import_extends_a_renamed_copy_from_an_earlier_import(storage, tmp_path):
+    storage.create_chat("Chat 1", [user("mine")])
+    assert list(import_archive(storage, write(tmp_path / "one.json",
+                                              {"Chat 1": [user("theirs")]}))) == [
+        ("renamed", "Chat 1 (2)")]
+    assert list(import_archive(storage, write(tmp_path / "two.json",
+                                              {"Chat 1": [user("theirs"), reply("ok")]}))) == [
+        ("extended", "Chat 1 (2)")]
+
+
+def test_import_sees_chats_written_by_another_connection_meanwhile(storage, tmp_path):
+    path = write(tmp_path / "backup.json", {"Chat 1": [user("a")], "Chat 2": [user("b")],
+                                            "Chat 3": [user("x"), reply("y"), user("z")]})
+    storage.create_chat("Chat 3", [user("x")])
+    window = StorageManager(storage.db_path, legacy_json_path="")
+    try:
+        merged = import_archive(storage, path)
+        assert next(merged) == ("added", "Chat 1")
+        # The window creates a chat and sends a message while the import runs
+        window.create_chat("Chat 2", [user("typed in the window")])
+        window.append_message("Chat 3", reply("y"))
+        assert list(merged) == [("renamed", "Chat 2 (2)"), ("extended", "Chat 3")]
+    finally:
+        window.close()
+    assert [m["content"] for m in storage.load_message_list("Chat 3")] == ["x", "y", "z"]
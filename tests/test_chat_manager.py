@@ -0,0 +1,26 @@
+import time
+
+import ChatManager as chat_manager_module
+from ChatManager import ChatManager
+
+
+def test_last_append_of_a_burst_is_fsynced_without_more_writes(tmp_path, monkeypatch):
+    monkeypatch.setattr(chat_manager_module, "FSYNC_INTERVAL", 0.2)
+    manager = ChatManager()
+    manager.set_auto_save(True, str(tmp_path))
+    synced = []
+    fsync_all = manager._fsync_all
+    monkeypatch.setattr(manager, "_fsync_all", lambda: (synced.append(set(manager._unsynced)),
+                                                        fsync_all()))
+    # Written within the interval, so the batch itself does not fsync
+    manager._last_fsync = time.monotonic()
+    manager.append_message("1", {"role": "user", "content": "hello"})
+    deadline = time.monotonic() + 2
+    while not synced and time.monotonic() < deadline:
+        time.sleep(0.02)
+    try:
+        assert synced == [{manager.transcript_path("1")}]
+        assert not manager._unsynced
+    finally:
+        manager.close()
+    assert (tmp_path / "chat_1.txt").read_text() == "user: hello\n"
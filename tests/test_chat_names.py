@@ -0,0 +1,71 @@
+"""Chat numbering after importing an archive whose chats clash on name
+
+An imported chat that conflicts with a stored one is kept as "Chat N (k)";
+the next start must still find the highest "Chat N" and New Chat must not
+reuse a stored name.
+
+    python -m unittest discover tests
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PyQt5.QtWidgets import QApplication
+
+from ArchiveManager import import_archive, open_archive, write_archive
+from StorageManager import StorageManager
+
+
+class ImportedChatNamesTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.app = QApplication.instance() or QApplication(sys.argv)
+
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp(prefix="ghost-writer-test-")
+        os.chdir(self.directory)
+        storage = StorageManager()
+        storage.create_chat("Chat 1", [{"role": "user", "content": "first"}])
+        storage.create_chat("Chat 2", [{"role": "user", "content": "second"}])
+        stream, raw = open_archive("backup.json", "w")
+        write_archive(stream, [("Chat 2", [{"role": "user", "content": "other machine"}])])
+        stream.close()
+        raw.close()
+        self.assertEqual(list(import_archive(storage, "backup.json")),
+                         [("renamed", "Chat 2 (2)")])
+        storage.close()
+
+    def tearDown(self):
+        self.window.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def start_window(self):
+        from Main import MainWindow
+        self.window = MainWindow()
+        self.window.load_chats()
+        return self.window
+
+    def test_restart_after_import_selects_a_chat(self):
+        window = self.start_window()
+        self.assertEqual(window.chat_counter, 2)
+        self.assertEqual(window.chat_list.count(), 3)
+        self.assertIsNotNone(window.current_chat)
+
+    def test_new_chat_skips_stored_names(self):
+        window = self.start_window()
+        window.create_new_chat()
+        self.assertEqual(window.current_chat, "Chat 3")
+        window.chat_counter = 0
+        window.create_new_chat()
+        self.assertEqual(window.current_chat, "Chat 4")
+
+
+if __name__ == "__main__":
+    unittest.main()
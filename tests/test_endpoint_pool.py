@@ -0,0 +1,94 @@
+import socket
+
+import pytest
+
+from APIManager import APIManager
+from EndpointPool import COLD_PENALTY, normalize_url, parse_endpoints
+from fake_ollama import FakeOllama
+
+
+def unused_url():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}/api"
+
+
+def pool_for(urls):
+    """An APIManager routing across urls, health checked once without the background thread"""
+    api_manager = APIManager(connect_timeout=1)
+    api_manager.configure_endpoints(urls, check_interval=3600)
+    checker = api_manager.endpoints._checker
+    api_manager.endpoints.close()
+    checker.join(10)
+    api_manager.endpoints.check()
+    return api_manager
+
+
+@pytest.fixture
+def servers():
+    with FakeOllama(models=["small"]) as first, FakeOllama(models=["small", "large"]) as second:
+        yield first, second
+
+
+def test_parse_endpoints_normalizes_and_deduplicates():
+    assert parse_endpoints("box:11434, http://box:11434/ other:1/api") == [
+        "http://box:11434/api", "http://other:1/api"]
+    assert normalize_url(" http://box:11434/ ") == "http://box:11434/api"
+
+
+def test_choose_prefers_installed_then_warm_then_idle(servers):
+    api_manager = pool_for([server.url for server in servers])
+    pool = api_manager.endpoints
+    first, second = pool.endpoints
+    try:
+        assert first.models == {"small"} and second.models == {"small", "large"}
+        assert pool.choose("large") is second
+        assert pool.hosting("large") == [second]
+        pool.mark_warm(second, "small")
+        assert pool.choose("small") is second
+        # A warm server stays first until it is busier than a cold one would be
+        for _ in range(COLD_PENALTY):
+            pool.begin(second)
+        assert pool.choose("small") is second
+        pool.begin(second)
+        assert pool.choose("small") is first
+        assert pool.choose("small", exclude=[first]) is second
+        assert pool.choose("small", exclude=[first, second]) is None
+    finally:
+        api_manager.close()
+
+
+def test_list_models_merges_every_server(servers):
+    api_manager = pool_for([server.url for server in servers])
+    try:
+        assert set(api_manager.endpoints.list_models()) == {"small", "large"}
+    finally:
+        api_manager.close()
+
+
+def test_generation_fails_over_to_a_server_that_answers(servers):
+    server = servers[0]
+    dead = unused_url()
+    api_manager = pool_for([dead, server.url])
+    try:
+        # As if the server went down after answering its last health check
+        down = api_manager.endpoints.primary
+        down.healthy, down.error, down.latency, down.models = True, None, 0.0, {"small"}
+        assert api_manager.endpoints.choose("small") is down
+        text = api_manager.generate_response("hi", model="small")
+        assert text and not text.startswith("Error")
+        assert not down.healthy and down.error
+        assert api_manager.endpoints.choose("small").url == server.url
+        assert all(e.in_flight == 0 for e in api_manager.endpoints.endpoints)
+    finally:
+        api_manager.close()
+
+
+def test_unreachable_servers_report_a_connection_error():
+    api_manager = APIManager(connect_timeout=1)
+    try:
+        api_manager.configure_endpoints([unused_url(), unused_url()], check_interval=3600)
+        assert api_manager.generate_response("hi", model="small").startswith(
+            "Error: Cannot connect to Ollama")
+    finally:
+        api_manager.close()
@@ -0,0 +1,74 @@
+from MessageRenderer import MessageRenderer, render_block, split_blocks, with_label
+
+REPLY = """# Plan
+
+Some **bold** text
+and a second line.
+
+```python
+def f():
+
+    return "<x>"  # done
+```
+- one
+- two
+
+Tail"""
+
+
+def test_split_blocks_at_blank_lines_and_fences():
+    blocks, tail = split_blocks(REPLY)
+    assert blocks == ["# Plan", "Some **bold** text\nand a second line.",
+                      '```python\ndef f():\n\n    return "<x>"  # done\n```', "- one\n- two"]
+    assert tail == "Tail"
+
+
+def test_unclosed_or_just_closed_fence_stays_open():
+    assert split_blocks("```\ncode\n\nmore") == ([], "```\ncode\n\nmore")
+    # The closing line may still grow ("```" could become "```js" in a new fence)
+    assert split_blocks("```\ncode\n```") == ([], "```\ncode\n```")
+    assert split_blocks("```\ncode\n```\n") == (["```\ncode\n```"], "")
+
+
+def test_closed_blocks_never_change_as_text_streams_in():
+    closed = []
+    for end in range(len(REPLY) + 1):
+        blocks, _ = split_blocks(REPLY[:end])
+        assert blocks[:len(closed)] == closed
+        closed = blocks
+    assert closed == split_blocks(REPLY)[0]
+
+
+def test_render_block_escapes_and_highlights_code():
+    html = render_block('```python\nif x: return "<b>"  # note\n```')
+    assert html.startswith("<pre")
+    assert "&lt;b&gt;" in html and "<b>" not in html
+    assert '">if</span>' in html and '">return</span>' in html
+    assert '"># note</span>' in html
+
+
+def test_render_block_markdown():
+    assert render_block("- a\n- b") == "<ul><li>a</li><li>b</li></ul>"
+    assert render_block("1. a\n2) b") == "<ol><li>a</li><li>b</li></ol>"
+    assert render_block("Use `x < y` and [docs](http://d)") == (
+        '<p>Use <code style="color:#1f2328; background-color:#eff1f3">x &lt; y</code> and '
+        '<a href="http://d">docs</a></p>')
+    assert with_label(render_block("## Title"), "Assistant").startswith(
+        '<p style="font-size:17pt">Assistant: <b>Title</b>')
+
+
+def test_renderer_caches_messages_and_blocks():
+    renderer = MessageRenderer(max_messages=1)
+    assert renderer.render("user", "**not rendered**") == ""
+    assert renderer.render("assistant", "plain text") == ""
+    first = renderer.render("assistant", REPLY)
+    assert renderer.render("assistant", REPLY) == first
+    assert renderer.stats()["hits"] == 1
+    renderer.render("assistant", "*other*")
+    assert renderer.stats()["messages"] == 1
+    # The evicted message is rebuilt from its cached blocks
+    hits = renderer.stats()["hits"]
+    assert renderer.render("assistant", REPLY) == first
+    assert renderer.stats()["hits"] == hits + 5
+    renderer.configure("dark", 12)
+    assert renderer.render("assistant", REPLY) != first
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+from MessageStore import ROLES, MessageList
+from StorageManager import ChatCache, StorageManager
+
+
+def test_views_read_like_the_dicts_they_replace():
+    messages = MessageList([{"role": "user", "content": "hi"},
+                            {"role": "assistant", "content": "hello", "tokens": 0,
+                             "metrics": {"ttft_ms": 5.0}}])
+    first, second = messages
+    assert dict(first) == {"role": "user", "content": "hi"}
+    assert first.get("tokens") is None and "tokens" not in first
+    assert second["tokens"] == 0 and second["metrics"] == {"ttft_ms": 5.0}
+    assert json.loads(json.dumps([dict(m) for m in messages])) == messages
+    with pytest.raises(KeyError):
+        first["created_at"]
+
+
+def test_setting_tokens_and_metrics_writes_through():
+    messages = MessageList([{"role": "assistant", "content": "x"}])
+    view = messages[0]
+    view["tokens"] = 7
+    view["metrics"] = {"eval_count": 7}
+    assert messages[-1] == {"role": "assistant", "content": "x", "tokens": 7,
+                            "metrics": {"eval_count": 7}}
+    view["tokens"] = None
+    view["metrics"] = {}
+    assert dict(messages[0]) == {"role": "assistant", "content": "x"}
+    with pytest.raises(KeyError):
+        view["content"] = "changed"
+
+
+def test_indexing_slicing_and_editing():
+    messages = MessageList()
+    messages.add("user", "a", created_at=1.0)
+    messages.extend([{"role": "assistant", "content": "b"}, {"role": "user", "content": "c"}])
+    assert len(messages) == 3
+    assert [m["content"] for m in messages[1:]] == ["b", "c"]
+    assert messages[-3].created_at == 1.0
+    with pytest.raises(IndexError):
+        messages[3]
+    assert messages.pop() == {"role": "user", "content": "c"}
+    assert [m["content"] for m in messages] == ["a", "b"]
+    copy = MessageList(messages)
+    assert copy == messages and copy[0].created_at == 1.0
+    with pytest.raises(IndexError):
+        MessageList().pop()
+
+
+def test_unknown_roles_are_kept():
+    messages = MessageList([{"role": "tool", "content": "42"}, {"content": "?"}])
+    assert [m["role"] for m in messages] == ["tool", "unknown"]
+    assert "tool" in ROLES
+
+
+def test_chat_cache_loads_messages_as_lists_and_evicts_unpinned_chats(tmp_path):
+    storage = StorageManager(str(tmp_path / "chats.db"), legacy_json_path="")
+    try:
+        for number in range(1, 4):
+            storage.create_chat(f"Chat {number}", [{"role": "user", "content": str(number)}])
+        chats = ChatCache(storage, max_loaded=2)
+        chats.pin("Chat 1")
+        assert isinstance(chats["Chat 1"], MessageList)
+        chats["Chat 2"]
+        chats["Chat 3"]
+        assert chats["Chat 1"][0]["content"] == "1"
+        assert sorted(chats._bodies) == ["Chat 1", "Chat 3"]
+        # An unloaded chat stays unloaded; a loaded one is updated in place
+        chats.append_message("Chat 2", {"role": "assistant", "content": "reply"})
+        assert "Chat 2" not in chats._bodies
+        chats.append_message("Chat 1", {"role": "assistant", "content": "one"})
+        assert [m["content"] for m in chats["Chat 1"]] == ["1", "one"]
+        assert [m["content"] for m in storage.load_message_list("Chat 2")] == ["2", "reply"]
+        assert [m["content"] for m in chats["Chat 2"]] == ["2", "reply"]
+    finally:
+        storage.close()
@@ -0,0 +1,83 @@
+import threading
+
+from APIManager import APIManager
+from ResponseCache import ResponseCache
+from fake_ollama import FakeOllama
+
+
+def entry(text):
+    return {"response": text, "final": {"done": True}}
+
+
+def test_key_covers_everything_that_changes_the_response():
+    base = ("m", "sha256:1", "hi", [1, 2], "be brief", {"temperature": 0.7, "top_k": 40})
+    key = ResponseCache.key(*base)
+    assert key == ResponseCache.key("m", "sha256:1", "hi", [1, 2], "be brief",
+                                    {"top_k": 40, "temperature": 0.7})
+    for index, other in enumerate(["n", "sha256:2", "ho", [1], "be long", {"temperature": 0}]):
+        changed = list(base)
+        changed[index] = other
+        assert ResponseCache.key(*changed) != key
+    assert ResponseCache.key("m", "d", "p") == ResponseCache.key("m", "d", "p", [], "", {})
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path), memory_entries=2, max_disk_bytes=0)
+    cache.put("a", entry("a"))
+    cache.put("b", entry("b"))
+    assert cache.get("a") == entry("a")  # "b" is now the least recent
+    cache.put("c", entry("c"))
+    assert cache.get("b") is None
+    assert cache.get("a") == entry("a")
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+
+def test_disk_tier_survives_restart_and_stays_under_its_limit(tmp_path):
+    cache = ResponseCache(str(tmp_path), memory_entries=1, max_disk_bytes=200)
+    for name in "abc":
+        cache.put(name, entry(name * 40))
+    assert cache.stats()["disk_bytes"] <= 200
+    reopened = ResponseCache(str(tmp_path), memory_entries=1, max_disk_bytes=200)
+    assert reopened.get("c") == entry("c" * 40)
+    assert reopened.get("a") is None
+
+
+def test_single_flight_lets_one_caller_generate(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    inside = threading.Event()
+    roles = []
+
+    def follower():
+        with cache.single_flight("k") as leader:
+            roles.append((leader, cache.get("k", count=False)))
+
+    with cache.single_flight("k") as leader:
+        assert leader
+        thread = threading.Thread(target=follower)
+        thread.start()
+        thread.join(0.1)
+        assert thread.is_alive()  # Waits for the leader
+        cache.put("k", entry("shared"))
+    thread.join(5)
+    assert roles == [(False, entry("shared"))]
+    assert cache.stats()["shared"] == 1
+
+
+def test_identical_requests_reach_ollama_once(tmp_path):
+    with FakeOllama(models=["m"], latency=0.2, response_tokens=5) as server:
+        api_manager = APIManager()
+        api_manager.base_url = server.url
+        api_manager.enable_cache(True, directory=str(tmp_path))
+        try:
+            results = []
+            threads = [threading.Thread(target=lambda: results.append(
+                api_manager.generate_response("same", model="m"))) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+            assert len(set(results)) == 1 and results[0]
+            assert api_manager.generate_response("same", model="m") == results[0]
+            assert server.requests["/api/generate"] == 1
+        finally:
+            api_manager.close()
@@ -0,0 +1,155 @@
+import threading
+import time
+
+import pytest
+
+from APIManager import APIManager
+from RequestScheduler import BACKGROUND, INTERACTIVE, RequestScheduler
+from fake_ollama import FakeOllama
+
+
+class Loader:
+    def is_loaded(self, model):
+        return False
+
+
+class FakeAPI:
+    """Streams one chunk per request, then holds the stream open until finished"""
+
+    model = "a"
+
+    def __init__(self):
+        self.loader = Loader()
+        self.started = []
+        self.finish = threading.Event()
+
+    def stream_response(self, prompt, model=None, context=None, system=None, cancel=None):
+        self.started.append(prompt)
+        yield {"response": prompt, "done": False}
+        while not self.finish.wait(0.01):
+            if cancel.is_set():
+                yield {"response": "", "done": True, "cancelled": True}
+                return
+        yield {"response": "", "done": True}
+
+
+def run(scheduler, prompt, ticket):
+    chunks = []
+    thread = threading.Thread(target=lambda: chunks.extend(
+        scheduler.stream(prompt, ticket=ticket)), daemon=True)
+    thread.start()
+    return thread, chunks
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def api():
+    api = FakeAPI()
+    yield api
+    api.finish.set()
+
+
+def test_interactive_requests_start_before_earlier_background_ones(api):
+    scheduler = RequestScheduler(api, max_active=1)
+    first = scheduler.ticket("a", INTERACTIVE)
+    threads = [run(scheduler, "first", first)[0]]
+    wait_for(lambda: api.started == ["first"])
+    threads.append(run(scheduler, "background", scheduler.ticket("a", BACKGROUND))[0])
+    wait_for(lambda: scheduler.stats()["queued"] == 1)
+    threads.append(run(scheduler, "interactive", scheduler.ticket("a", INTERACTIVE))[0])
+    wait_for(lambda: scheduler.stats()["queued"] == 2)
+    api.finish.set()
+    for thread in threads:
+        thread.join(5)
+    assert api.started == ["first", "interactive", "background"]
+
+
+def test_cancelled_request_keeps_its_slot_until_its_stream_ends(api):
+    scheduler = RequestScheduler(api, max_active=1)
+    first = scheduler.ticket("a")
+    thread, chunks = run(scheduler, "first", first)
+    wait_for(lambda: api.started == ["first"])
+    second, _ = run(scheduler, "second", scheduler.ticket("a"))
+    with scheduler._cond:
+        first.cancel()
+        # The stream has not noticed yet, so nothing else may start
+        assert scheduler.stats()["running"] == 1
+    thread.join(5)
+    assert chunks[-1] == {"response": "", "done": True, "cancelled": True}
+    wait_for(lambda: api.started == ["first", "second"])
+    api.finish.set()
+    second.join(5)
+
+
+def test_preempts_background_request_for_interactive_one(api):
+    scheduler = RequestScheduler(api, max_active=1)
+    result = []
+    background = threading.Thread(target=lambda: result.append(
+        scheduler.generate("background", model="a", priority=BACKGROUND)), daemon=True)
+    background.start()
+    wait_for(lambda: api.started == ["background"])
+    interactive, chunks = run(scheduler, "interactive", scheduler.ticket("a"))
+    wait_for(lambda: api.started == ["background", "interactive"])
+    api.finish.set()
+    interactive.join(5)
+    background.join(5)
+    # The background request was started over after the interactive one
+    assert api.started == ["background", "interactive", "background"]
+    assert result[0][0] == "background"
+
+
+def test_does_not_preempt_when_that_would_not_admit_the_request(api):
+    scheduler = RequestScheduler(api, max_active=2, max_models=1)
+    # Model "a" is held by one background and one interactive request, so
+    # stopping the background one cannot make room for model "b"
+    background = scheduler.ticket("a", BACKGROUND, preemptible=True)
+    threads = [run(scheduler, "background", background)[0],
+               run(scheduler, "interactive", scheduler.ticket("a"))[0]]
+    wait_for(lambda: len(api.started) == 2)
+    threads.append(run(scheduler, "other model", scheduler.ticket("b"))[0])
+    wait_for(lambda: scheduler.stats()["queued"] == 1)
+    time.sleep(0.1)
+    assert not background.cancelled.is_set()
+    api.finish.set()
+    for thread in threads:
+        thread.join(5)
+    assert api.started[-1] == "other model"
+
+
+def test_frees_a_whole_model_for_another_one(api):
+    scheduler = RequestScheduler(api, max_active=4, max_models=1)
+    backgrounds = [scheduler.ticket("a", BACKGROUND, preemptible=True) for _ in range(2)]
+    threads = [run(scheduler, f"background {i}", t)[0] for i, t in enumerate(backgrounds)]
+    wait_for(lambda: len(api.started) == 2)
+    threads.append(run(scheduler, "other model", scheduler.ticket("b"))[0])
+    wait_for(lambda: "other model" in api.started)
+    assert all(t.preempted for t in backgrounds)
+    assert scheduler.stats()["models"] == ["b"]
+    api.finish.set()
+    for thread in threads:
+        thread.join(5)
+
+
+def test_cancel_interrupts_a_read_in_progress():
+    with FakeOllama(models=["bench-model"], tokens_per_second=0.5, response_tokens=5) as server:
+        api_manager = APIManager()
+        api_manager.base_url = server.url
+        try:
+            ticket = api_manager.scheduler.ticket("bench-model")
+            chunks = api_manager.scheduler.stream("hi", ticket=ticket)
+            assert not next(chunks)["done"]
+            # The next token is two seconds away
+            threading.Timer(0.2, ticket.cancel).start()
+            start = time.monotonic()
+            rest = list(chunks)
+            assert time.monotonic() - start < 1.5
+            assert rest[-1].get("cancelled")
+            assert api_manager.scheduler.stats()["running"] == 0
+        finally:
+            api_manager.close()
@@ -0,0 +1,103 @@
+import json
+import sqlite3
+
+import pytest
+
+from StorageManager import HIGHLIGHT_END, HIGHLIGHT_START, SCHEMA_VERSION, StorageManager
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def reply(text):
+    return {"role": "assistant", "content": text}
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = StorageManager(str(tmp_path / "chats.db"), legacy_json_path="")
+    yield storage
+    storage.close()
+
+
+def found(storage, query):
+    return [(r["chat"], r["index"]) for r in storage.search(query)]
+
+
+def test_search_matches_every_word_and_the_last_as_a_prefix(storage):
+    storage.create_chat("Trip", [user("Plan a walk in the mountains"), reply("Pack water")])
+    storage.create_chat("Code", [user("Why does the mountain car problem diverge?")])
+    assert storage.has_fts
+    assert sorted(found(storage, "mountain")) == [("Code", 0), ("Trip", 0)]
+    assert found(storage, "walk mount") == [("Trip", 0)]
+    assert found(storage, "pack") == [("Trip", 1)]
+    assert found(storage, 'water "') == [("Trip", 1)]  # Quotes cannot break the query
+    assert found(storage, "   ") == []
+    snippet = storage.search("water")[0]["snippet"]
+    assert f"{HIGHLIGHT_START}water{HIGHLIGHT_END}" in snippet
+
+
+def test_triggers_keep_the_index_in_sync(storage):
+    storage.create_chat("Chat 1", [user("alpha")])
+    storage.append_message("Chat 1", reply("beta"))
+    assert found(storage, "beta") == [("Chat 1", 1)]
+    storage.rename_chat("Chat 1", "Renamed")
+    assert found(storage, "alpha") == [("Renamed", 0)]
+    with storage.conn:
+        storage.conn.execute("UPDATE messages SET content = 'gamma' WHERE content = 'beta'")
+    assert found(storage, "beta") == []
+    assert found(storage, "gamma") == [("Renamed", 1)]
+    storage.delete_chat("Renamed")
+    assert found(storage, "alpha") == found(storage, "gamma") == []
+
+
+def test_scan_fallback_finds_the_same_messages(storage):
+    storage.create_chat("Chat 1", [user("100% sure_thing"), reply("Something else")])
+    storage.has_fts = False
+    assert found(storage, "100%") == [("Chat 1", 0)]
+    assert found(storage, "sure_") == [("Chat 1", 0)]
+    assert found(storage, "THING") == [("Chat 1", 1), ("Chat 1", 0)]
+
+
+def test_opening_a_version_0_database_upgrades_it_and_indexes_old_messages(tmp_path):
+    path = str(tmp_path / "chats.db")
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE chats (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE,
+                            position INTEGER NOT NULL, created_at REAL NOT NULL,
+                            updated_at REAL NOT NULL);
+        CREATE TABLE messages (id INTEGER PRIMARY KEY,
+                               chat_id INTEGER NOT NULL REFERENCES chats(id) ON DELETE CASCADE,
+                               role TEXT NOT NULL, content TEXT NOT NULL,
+                               created_at REAL NOT NULL);
+        INSERT INTO chats VALUES (1, 'Old', 0, 0, 0);
+        INSERT INTO messages VALUES (1, 1, 'user', 'stored before search existed', 0);
+        INSERT INTO messages VALUES (2, 1, 'assistant', 'indeed', 0);
+    """)
+    conn.close()
+
+    storage = StorageManager(path, legacy_json_path="")
+    try:
+        assert storage.conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        assert storage.load_entry("Old")["message_count"] == 2
+        assert found(storage, "search existed") == [("Old", 0)]
+        storage.append_message("Old", dict(reply("more"), tokens=2, metrics={"ttft_ms": 1.0}))
+        assert storage.load_message_list("Old")[2] == {"role": "assistant", "content": "more",
+                                                       "tokens": 2, "metrics": {"ttft_ms": 1.0}}
+    finally:
+        storage.close()
+
+
+def test_chats_json_is_migrated_once(tmp_path):
+    legacy = tmp_path / "chats.json"
+    legacy.write_text(json.dumps({"Chat 1": [user("hi"), reply("hello")]}))
+    path = str(tmp_path / "chats.db")
+    StorageManager(path, legacy_json_path=str(legacy)).close()
+    assert not legacy.exists() and (tmp_path / "chats.json.migrated").exists()
+    storage = StorageManager(path, legacy_json_path=str(legacy))
+    try:
+        assert [entry["name"] for entry in storage.load_index()] == ["Chat 1"]
+        assert found(storage, "hello") == [("Chat 1", 1)]
+    finally:
+        storage.close()